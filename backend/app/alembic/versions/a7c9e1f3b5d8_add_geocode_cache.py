@@ -0,0 +1,52 @@
+"""Add geocode cache
+
+Revision ID: a7c9e1f3b5d8
+Revises: f1a3c5e7b9d2
+Create Date: 2026-10-18 21:12:05.613948
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c9e1f3b5d8'
+down_revision = 'f1a3c5e7b9d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('geocodecache',
+    sa.Column('address_key', sqlmodel.sql.sqltypes.AutoString(length=1536), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=True),
+    sa.Column('longitude', sa.Float(), nullable=True),
+    sa.Column('formatted_address', sqlmodel.sql.sqltypes.AutoString(length=512), nullable=True),
+    sa.Column('geocoded_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('address_key')
+    )
+    # No migration creates the useraddress table, it may not exist yet
+    if not sa.inspect(op.get_bind()).has_table('useraddress'):
+        return
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_useraddress_ungeocoded',
+            'useraddress',
+            ['id'],
+            unique=False,
+            postgresql_where=sa.text('latitude IS NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_useraddress_ungeocoded',
+            table_name='useraddress',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_table('geocodecache')
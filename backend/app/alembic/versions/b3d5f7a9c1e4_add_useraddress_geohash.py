@@ -0,0 +1,117 @@
+"""Add useraddress geohash
+
+Revision ID: b3d5f7a9c1e4
+Revises: a7c9e1f3b5d8
+Create Date: 2026-10-18 22:40:31.274519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3d5f7a9c1e4'
+down_revision = 'a7c9e1f3b5d8'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 10000
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def _geohash_encode(latitude, longitude, precision=12):
+    # A copy of app.core.geo.geohash_encode as of this revision, so later
+    # changes to the app don't change what the migration writes
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (
+            (longitude_range, longitude) if even else (latitude_range, latitude)
+        )
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # No migration creates the useraddress table, it may not exist yet
+    inspector = sa.inspect(bind)
+    if not inspector.has_table('useraddress'):
+        return
+    # Already there when create_all made the table from the current models
+    columns = {column['name'] for column in inspector.get_columns('useraddress')}
+    if 'geohash' not in columns:
+        op.add_column(
+            'useraddress',
+            sa.Column('geohash', sa.String(length=12, collation='C'), nullable=True),
+        )
+    # Keyset batches over the addresses geocoded before the column existed,
+    # outside the migration transaction so each batch is committed and its
+    # rows unlocked as it goes
+    with op.get_context().autocommit_block():
+        last_id = None
+        while True:
+            statement = sa.text(
+                "SELECT id, latitude, longitude FROM useraddress "
+                "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+                + (" AND id > :last_id" if last_id is not None else "")
+                + " ORDER BY id LIMIT :limit"
+            )
+            rows = bind.execute(
+                statement, {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}
+            ).all()
+            if not rows:
+                break
+            bind.execute(
+                sa.text(
+                    "UPDATE useraddress SET geohash = data.geohash "
+                    "FROM (SELECT unnest(CAST(:ids AS uuid[])) AS id, "
+                    "unnest(CAST(:geohashes AS text[])) AS geohash) AS data "
+                    "WHERE useraddress.id = data.id"
+                ),
+                {
+                    "ids": [id for id, _, _ in rows],
+                    "geohashes": [
+                        _geohash_encode(latitude, longitude)
+                        for _, latitude, longitude in rows
+                    ],
+                },
+            )
+            last_id = rows[-1][0]
+        op.create_index(
+            'ix_useraddress_geohash',
+            'useraddress',
+            ['geohash'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    if not sa.inspect(op.get_bind()).has_table('useraddress'):
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_useraddress_geohash',
+            table_name='useraddress',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('useraddress', 'geohash')
@@ -0,0 +1,29 @@
+"""Add keyset pagination indexes
+
+Revision ID: b3f1c2d4e5a6
+Revises: 1a31ce608336
+Create Date: 2026-10-18 10:12:41.208315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1c2d4e5a6'
+down_revision = '1a31ce608336'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_email_id', 'user', ['email', 'id'], unique=False)
+    op.create_index('ix_item_title_id', 'item', ['title', 'id'], unique=False)
+    op.create_index('ix_item_owner_id_title_id', 'item', ['owner_id', 'title', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_item_owner_id_title_id', table_name='item')
+    op.drop_index('ix_item_title_id', table_name='item')
+    op.drop_index('ix_user_email_id', table_name='user')
@@ -0,0 +1,36 @@
+"""Add rowcount table
+
+Revision ID: c7d2e9f0a1b4
+Revises: b3f1c2d4e5a6
+Create Date: 2026-10-18 11:03:27.540182
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e9f0a1b4'
+down_revision = 'b3f1c2d4e5a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rowcount',
+    sa.Column('key', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+    # Seed the per-owner counters from the existing rows, crud keeps them up
+    # to date. Whole table counts come from the planner, a single row for
+    # them would serialize every insert and delete
+    op.execute("""
+        INSERT INTO rowcount (key, count)
+        SELECT 'item:owner:' || owner_id, count(*) FROM item GROUP BY owner_id
+    """)
+
+
+def downgrade():
+    op.drop_table('rowcount')
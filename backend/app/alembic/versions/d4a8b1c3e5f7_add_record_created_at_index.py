@@ -0,0 +1,43 @@
+"""Add record created_at index
+
+Revision ID: d4a8b1c3e5f7
+Revises: c7d2e9f0a1b4
+Create Date: 2026-10-18 15:42:09.731204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a8b1c3e5f7'
+down_revision = 'c7d2e9f0a1b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # No migration creates the record table, it may not exist yet
+    if not sa.inspect(op.get_bind()).has_table('record'):
+        return
+    # Built concurrently so the cleanup and inserts keep running meanwhile
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_record_created_at_id',
+            'record',
+            ['created_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_record_created_at_id',
+            table_name='record',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,83 @@
+"""Add daily rollups
+
+Revision ID: f1a3c5e7b9d2
+Revises: d4a8b1c3e5f7
+Create Date: 2026-10-18 19:21:47.106352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a3c5e7b9d2'
+down_revision = 'd4a8b1c3e5f7'
+branch_labels = None
+depends_on = None
+
+# Shared with the record and payment tables, which may not exist yet
+record_type = postgresql.ENUM('TYPE_A', 'TYPE_B', name='recordtype', create_type=False)
+payment_status = postgresql.ENUM(
+    'PENDING', 'COMPLETED', 'FAILED', name='paymentstatus', create_type=False
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    record_type.create(bind, checkfirst=True)
+    payment_status.create(bind, checkfirst=True)
+    op.create_table('recorddailyrollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('record_type', record_type, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'record_type')
+    )
+    op.create_table('paymentdailyrollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', payment_status, nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'status')
+    )
+    op.create_table('rollupwatermark',
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(length=255), nullable=False),
+    sa.Column('position', sa.DateTime(), nullable=False),
+    sa.Column('last_id', sa.Uuid(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # The rollups start empty, the first refresh folds in the existing rows
+
+    if not sa.inspect(bind).has_table('payment'):
+        return
+    op.add_column('payment', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.execute("UPDATE payment SET updated_at = coalesce(completed_at, created_at)")
+    op.alter_column('payment', 'updated_at', nullable=False)
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_payment_updated_at_id',
+            'payment',
+            ['updated_at', 'id'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_payment_created_at',
+            'payment',
+            ['created_at'],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('payment'):
+        op.drop_index('ix_payment_created_at', table_name='payment', if_exists=True)
+        op.drop_index('ix_payment_updated_at_id', table_name='payment', if_exists=True)
+        op.drop_column('payment', 'updated_at')
+    op.drop_table('rollupwatermark')
+    op.drop_table('paymentdailyrollup')
+    op.drop_table('recorddailyrollup')
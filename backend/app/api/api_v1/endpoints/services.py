@@ -1,15 +1,5 @@
-from app.services.cache import set_cache, get_cache
-from fastapi import APIRouter
+# Same routes as app.api.v1.endpoints.services, which is the mounted one;
+# sharing its router registers the "service" cache only once
+from app.api.v1.endpoints.services import router, service_cache
 
-router = APIRouter()
-
-@router.get("/service/{service_id}")
-async def get_service(service_id: str):
-    cached_data = get_cache(f"service:{service_id}")
-    if cached_data:
-        return cached_data
-
-    # Fetch data from DB here and then cache it
-    fetched_data = {"service_id": service_id, "data": "Service Data"}
-    set_cache(f"service:{service_id}", fetched_data)
-    return fetched_data
+__all__ = ["router", "service_cache"]
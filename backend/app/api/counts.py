@@ -0,0 +1,62 @@
+import json
+from typing import Any
+
+from sqlalchemy import text
+from sqlmodel import SQLModel, col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.models import RowCount
+
+
+async def count_rows(
+    session: AsyncSession,
+    model: type[SQLModel],
+    *whereclause: Any,
+    counter_key: str | None = None,
+    strategy: str | None = None,
+) -> int:
+    """
+    Total rows of `model` matching `whereclause`, for list endpoints.
+
+    "exact" runs a COUNT(*), "estimated" asks the planner (pg_class.reltuples
+    for the whole table, the EXPLAIN row estimate with filters) and "cached"
+    reads the RowCount counter `counter_key`, which crud keeps up to date on
+    every write of the filtered rows. Whole tables have no counter, "cached"
+    answers them from pg_class.reltuples like "estimated". Defaults to
+    settings.LIST_COUNT_STRATEGY.
+    """
+    strategy = strategy or settings.LIST_COUNT_STRATEGY
+    if strategy == "cached" and counter_key is not None:
+        statement = select(RowCount.count).where(col(RowCount.key) == counter_key)
+        return (await session.exec(statement)).first() or 0
+    if strategy in ("estimated", "cached"):
+        estimate = await _estimate_rows(session, model, whereclause)
+        if estimate is not None:
+            return estimate
+    statement = select(func.count()).select_from(model).where(*whereclause)
+    return (await session.exec(statement)).one()
+
+
+async def _estimate_rows(
+    session: AsyncSession, model: type[SQLModel], whereclause: tuple[Any, ...]
+) -> int | None:
+    if not whereclause:
+        statement = text(
+            "SELECT reltuples FROM pg_class WHERE oid = to_regclass(quote_ident(:name))"
+        )
+        result = await session.exec(statement, params={"name": model.__tablename__})  # type: ignore[call-overload]
+        reltuples = result.scalar()
+        # -1 until the table is first vacuumed or analyzed
+        if reltuples is None or reltuples < 0:
+            return None
+        return int(reltuples)
+    connection = await session.connection()
+    compiled = select(model).where(*whereclause).compile(dialect=connection.dialect)
+    result = await connection.exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {compiled}", compiled.params
+    )
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
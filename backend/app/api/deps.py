@@ -1,16 +1,25 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
-import jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
+from sqlalchemy.exc import OperationalError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from app.core import security
+from app.core.auth_cache import (
+    decode_access_token,
+    get_user_snapshot,
+    get_user_snapshot_async,
+    set_user_snapshot,
+    set_user_snapshot_async,
+)
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import async_engine, engine
+from app.core.replicas import replica_router
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -18,27 +27,90 @@ reusable_oauth2 = OAuth2PasswordBearer(
 )
 
 
-def get_db() -> Generator[Session, None, None]:
+def _request_subject(request: Request) -> str | None:
+    """User id of the bearer token, if any, without enforcing authentication."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = decode_access_token(token)
+    except InvalidTokenError:
+        return None
+    return payload.get("sub")
+
+
+def _wrote_as(request: Request, session: Session) -> str | None:
+    """Subject whose commit in this session starts a read-your-writes window."""
+    if not replica_router.replicas or not session.info.get("committed"):
+        return None
+    return _request_subject(request)
+
+
+def get_db(request: Request) -> Generator[Session, None, None]:
     with Session(engine) as session:
         yield session
+        if subject := _wrote_as(request, session):
+            replica_router.mark_write(subject)
+
+
+async def get_async_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with AsyncSession(async_engine) as session:
+        yield session
+        if subject := _wrote_as(request, session.sync_session):
+            await run_in_threadpool(replica_router.mark_write, subject)
+
+
+def get_read_db(request: Request) -> Generator[Session, None, None]:
+    """Session for read-only handlers, on a replica when one is available."""
+    replica = None
+    if replica_router.replicas:
+        replica = replica_router.choose(_request_subject(request))
+    with Session(replica.engine if replica else engine) as session:
+        try:
+            yield session
+        except OperationalError:
+            if replica:
+                replica_router.eject(replica)
+            raise
+
+
+async def get_async_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """Async session for read-only handlers, on a replica when one is available."""
+    replica = None
+    if replica_router.replicas:
+        replica = await run_in_threadpool(
+            replica_router.choose, _request_subject(request)
+        )
+    async with AsyncSession(
+        replica.async_engine if replica else async_engine
+    ) as session:
+        try:
+            yield session
+        except OperationalError:
+            if replica:
+                replica_router.eject(replica)
+            raise
 
 
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
+AsyncReadSessionDep = Annotated[AsyncSession, Depends(get_async_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
-def get_current_user(session: SessionDep, token: TokenDep) -> User:
+def _decode_token(token: str) -> TokenPayload:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
+        payload = decode_access_token(token)
+        return TokenPayload(**payload)
     except (InvalidTokenError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = session.get(User, token_data.sub)
+
+
+def _check_user(user: User | None) -> User:
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     if not user.is_active:
@@ -46,12 +118,53 @@ def get_current_user(session: SessionDep, token: TokenDep) -> User:
     return user
 
 
+def get_current_user(request: Request, session: SessionDep, token: TokenDep) -> User:
+    token_data = _decode_token(token)
+    user = get_user_snapshot(token_data.sub) if token_data.sub else None
+    if user:
+        # Attach without a SELECT, the snapshot is what the DB holds
+        user = session.merge(user, load=False)
+    else:
+        user = session.get(User, token_data.sub)
+        if user:
+            set_user_snapshot(user)
+    # Reused by GeoIPMiddleware's request.state.location
+    request.state.user = _check_user(user)
+    return request.state.user
+
+
+async def get_current_user_async(
+    request: Request, session: AsyncSessionDep, token: TokenDep
+) -> User:
+    token_data = _decode_token(token)
+    user = None
+    if token_data.sub:
+        user = await get_user_snapshot_async(token_data.sub)
+    if user:
+        user = await session.merge(user, load=False)
+    else:
+        user = await session.get(User, token_data.sub)
+        if user:
+            await set_user_snapshot_async(user)
+    request.state.user = _check_user(user)
+    return request.state.user
+
+
 CurrentUser = Annotated[User, Depends(get_current_user)]
+AsyncCurrentUser = Annotated[User, Depends(get_current_user_async)]
 
 
-def get_current_active_superuser(current_user: CurrentUser) -> User:
+def _check_superuser(current_user: User) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def get_current_active_superuser(current_user: CurrentUser) -> User:
+    return _check_superuser(current_user)
+
+
+async def get_current_active_superuser_async(current_user: AsyncCurrentUser) -> User:
+    return _check_superuser(current_user)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, FastAPI, HTTPException, Request
 from starlette.middleware.sessions import SessionMiddleware
 
 from app.api.v1.endpoints import (
+    geoip,
     graphql,
     items,
     login,
@@ -31,6 +32,7 @@ api_router.include_router(notifications.router, prefix="/notifications", tags=["
 # api_router.include_router(reviews.router, prefix="/reviews", tags=["reviews"])
 api_router.include_router(services.router, prefix="/services", tags=["services"])
 api_router.include_router(graphql.router, prefix="/graphql", tags=["graphql"])
+api_router.include_router(geoip.router, prefix="/geoip", tags=["geoip"])
 
 # Include social media login router
 api_router.include_router(social_auth.router, prefix="/social_auth", tags=["social_auth"])
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+import uuid
+from collections.abc import Sequence
+from typing import Any, TypeVar
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlmodel.sql.expression import SelectOfScalar
+
+T = TypeVar("T")
+
+
+def encode_cursor(sort_key: Any, id: uuid.UUID) -> str:
+    """Opaque cursor pointing right after the row with (sort_key, id)."""
+    raw = json.dumps([sort_key, str(id)], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, uuid.UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_key, id = json.loads(raw)
+        # The sort columns are strings, anything else would fail in the query
+        if not isinstance(sort_key, str):
+            raise TypeError("sort key must be a string")
+        return sort_key, uuid.UUID(id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(
+    statement: SelectOfScalar[T],
+    *,
+    sort_column: InstrumentedAttribute[Any],
+    id_column: InstrumentedAttribute[Any],
+    cursor: str | None,
+    skip: int,
+    limit: int,
+) -> SelectOfScalar[T]:
+    """
+    Order `statement` by (sort_column, id_column) and select one page.
+
+    With a cursor the page starts right after the cursor row, a range scan on
+    the matching composite index whatever the page depth; otherwise `skip`
+    rows are skipped. One extra row is fetched so `page_with_cursor` can tell
+    whether a next page exists.
+    """
+    statement = statement.order_by(sort_column, id_column)
+    if cursor:
+        sort_key, last_id = decode_cursor(cursor)
+        statement = statement.where(
+            tuple_(sort_column, id_column) > tuple_(sort_key, last_id)
+        )
+    else:
+        statement = statement.offset(skip)
+    return statement.limit(limit + 1)
+
+
+def page_with_cursor(
+    rows: Sequence[T], *, sort_attr: str, limit: int
+) -> tuple[Sequence[T], str | None]:
+    """Trim the extra row fetched by `paginate`, returning the next cursor."""
+    if limit <= 0 or len(rows) <= limit:
+        return rows[: max(limit, 0)], None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_attr), last.id)  # type: ignore[attr-defined]
@@ -0,0 +1,100 @@
+import json
+from collections.abc import Iterator
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from starlette.datastructures import UploadFile
+from starlette.types import Message
+
+from app.api.deps import get_current_active_superuser
+from app.core.config import settings
+from app.services.geoip_service import lookup_many
+
+router = APIRouter()
+
+_ip_addresses = TypeAdapter(list[str])
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"At most {settings.GEOIP_BATCH_MAX_BYTES} bytes per request",
+    )
+
+
+def _limit_body(request: Request, max_bytes: int) -> Request:
+    """
+    `request` reading at most `max_bytes` of body, so an oversized one is
+    rejected before it is buffered or spooled to disk.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        raise _too_large()
+    received = 0
+
+    async def receive() -> Message:
+        nonlocal received
+        message = await request.receive()
+        if message["type"] == "http.request":
+            # Chunked bodies have no Content-Length to check up front
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise _too_large()
+        return message
+
+    return Request(request.scope, receive)
+
+
+async def _read_ip_addresses(request: Request) -> list[str]:
+    request = _limit_body(request, settings.GEOIP_BATCH_MAX_BYTES)
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        try:
+            return _ip_addresses.validate_json(await request.body())
+        except ValidationError:
+            raise HTTPException(
+                status_code=422, detail="Expected a JSON array of IP addresses"
+            )
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(
+                status_code=422, detail='Upload the IP addresses as "file"'
+            )
+        data = await upload.read()
+    else:
+        data = await request.body()
+    try:
+        return data.decode().splitlines()
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=422, detail="Expected UTF-8 text")
+
+
+def _ndjson(ip_addresses: list[str]) -> Iterator[str]:
+    for result in lookup_many(ip_addresses):
+        yield json.dumps(result._asdict()) + "\n"
+
+
+@router.post(
+    "/lookup/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_class=StreamingResponse,
+    responses={200: {"content": {"application/x-ndjson": {}}}},
+)
+async def lookup(request: Request) -> StreamingResponse:
+    """
+    Locate many IP addresses, sent as a JSON array, as newline-delimited text
+    or as a newline-delimited file uploaded as "file".
+
+    Each distinct address gets one JSON line {"ip", "location", "error"},
+    streamed back as the lookups complete.
+    """
+    ip_addresses = await _read_ip_addresses(request)
+    if len(ip_addresses) > settings.GEOIP_BATCH_MAX_ADDRESSES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.GEOIP_BATCH_MAX_ADDRESSES} addresses per request",
+        )
+    return StreamingResponse(_ndjson(ip_addresses), media_type="application/x-ndjson")
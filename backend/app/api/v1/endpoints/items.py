@@ -2,51 +2,74 @@ import uuid
 from typing import Any
 
 from fastapi import APIRouter, HTTPException
-from sqlmodel import func, select
+from sqlmodel import select
 
-from app.api.deps import CurrentUser, SessionDep
+from app import crud
+from app.api.counts import count_rows
+from app.api.deps import (
+    AsyncCurrentUser,
+    AsyncReadSessionDep,
+    AsyncSessionDep,
+    CurrentUser,
+    SessionDep,
+)
+from app.api.pagination import page_with_cursor, paginate
 from app.models import Item, ItemCreate, ItemPublic, ItemsPublic, ItemUpdate, Message
 
 router = APIRouter()
 
 
 @router.get("/", response_model=ItemsPublic)
-def read_items(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+async def read_items(
+    session: AsyncReadSessionDep,
+    current_user: AsyncCurrentUser,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_count: bool = True,
 ) -> Any:
     """
-    Retrieve items.
+    Retrieve items, ordered by title.
+
+    Pass the returned `next_cursor` as `cursor` to get the following page,
+    `skip` is only used without a cursor. With `include_count=false` the
+    total is not computed and `count` is null. With the "cached" count
+    strategy `count` reads the owner's row counter, superusers listing
+    every item get the planner's estimate.
     """
 
+    counter_key: str | None = None
     if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Item)
-        count = session.exec(count_statement).one()
-        statement = select(Item).offset(skip).limit(limit)
-        items = session.exec(statement).all()
+        filters = []
     else:
-        count_statement = (
-            select(func.count())
-            .select_from(Item)
-            .where(Item.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Item)
-            .where(Item.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        items = session.exec(statement).all()
-
-    return ItemsPublic(data=items, count=count)
+        filters = [Item.owner_id == current_user.id]
+        counter_key = crud.item_count_key(current_user.id)
+    count = None
+    if include_count:
+        count = await count_rows(session, Item, *filters, counter_key=counter_key)
+    statement = paginate(
+        select(Item).where(*filters),
+        sort_column=Item.title,
+        id_column=Item.id,
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+    )
+    items, next_cursor = page_with_cursor(
+        (await session.exec(statement)).all(), sort_attr="title", limit=limit
+    )
+
+    return ItemsPublic(data=items, count=count, next_cursor=next_cursor)
 
 
 @router.get("/{id}", response_model=ItemPublic)
-def read_item(session: SessionDep, current_user: CurrentUser, id: uuid.UUID) -> Any:
+async def read_item(
+    session: AsyncSessionDep, current_user: AsyncCurrentUser, id: uuid.UUID
+) -> Any:
     """
     Get item by ID.
     """
-    item = session.get(Item, id)
+    item = await crud.get_item_async(session=session, item_id=id)
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
@@ -61,10 +84,7 @@ def create_item(
     """
     Create new item.
     """
-    item = Item.model_validate(item_in, update={"owner_id": current_user.id})
-    session.add(item)
-    session.commit()
-    session.refresh(item)
+    item = crud.create_item(session=session, item_in=item_in, owner_id=current_user.id)
     return item
 
 
@@ -104,6 +124,5 @@ def delete_item(
         raise HTTPException(status_code=404, detail="Item not found")
     if not current_user.is_superuser and (item.owner_id != current_user.id):
         raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(item)
-    session.commit()
+    crud.delete_item(session=session, db_item=item)
     return Message(message="Item deleted successfully")
@@ -6,8 +6,14 @@ from fastapi.responses import HTMLResponse
 from fastapi.security import OAuth2PasswordRequestForm
 
 from app import crud
-from app.api.deps import CurrentUser, SessionDep, get_current_active_superuser
+from app.api.deps import (
+    AsyncSessionDep,
+    CurrentUser,
+    SessionDep,
+    get_current_active_superuser,
+)
 from app.core import security
+from app.core.auth_cache import invalidate_user
 from app.core.config import settings
 from app.core.security import get_password_hash
 from app.models import Message, NewPassword, Token, UserPublic
@@ -22,13 +28,14 @@ router = APIRouter()
 
 
 @router.post("/login/access-token")
-def login_access_token(
-    session: SessionDep, form_data: Annotated[OAuth2PasswordRequestForm, Depends()]
+async def login_access_token(
+    session: AsyncSessionDep,
+    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
 ) -> Token:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.authenticate(
+    user = await crud.authenticate_async(
         session=session, email=form_data.username, password=form_data.password
     )
     if not user:
@@ -95,6 +102,7 @@ def reset_password(session: SessionDep, body: NewPassword) -> Message:
     user.hashed_password = hashed_password
     session.add(user)
     session.commit()
+    invalidate_user(user.id)
     return Message(message="Password updated successfully")
 
 
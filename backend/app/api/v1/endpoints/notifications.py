@@ -1,6 +1,11 @@
-from fastapi import APIRouter
+from typing import Any
 
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.api.deps import get_current_active_superuser
+from app.models import NotificationBroadcast, NotificationBroadcastQueued
 from app.services.tasks import (
+    broadcast_notification_task,
     send_notification_task,  # Celery tasks for both payment and notification
 )
 
@@ -12,3 +17,28 @@ async def notify(user_id: str, message: str):
     # Trigger notification sending in background
     send_notification_task.delay(user_id, message)
     return {"status": "Notification queued"}
+
+@router.post(
+    "/broadcast/",
+    status_code=202,
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=NotificationBroadcastQueued,
+)
+def broadcast(broadcast_in: NotificationBroadcast) -> Any:
+    """
+    Notify many users in one background task, by id or by filters.
+    """
+    filters = broadcast_in.model_dump(
+        include={"is_active", "is_superuser"}, exclude_none=True
+    )
+    if broadcast_in.user_ids is not None and filters:
+        raise HTTPException(
+            status_code=400, detail="Give either user ids or filters, not both"
+        )
+    user_ids = (
+        [str(user_id) for user_id in broadcast_in.user_ids]
+        if broadcast_in.user_ids is not None
+        else None
+    )
+    result = broadcast_notification_task.delay(broadcast_in.message, user_ids, filters)
+    return NotificationBroadcastQueued(task_id=result.id)
@@ -1,16 +1,15 @@
 from fastapi import APIRouter
 
-from app.services.cache import get_cache, set_cache
+from app.models import ServicePublic
+from app.services.cache import Cache, cached
 
 router = APIRouter()
 
-@router.get("/service/{service_id}")
-async def get_service(service_id: str):
-    cached_data = get_cache(f"service:{service_id}")
-    if cached_data:
-        return cached_data
+service_cache = Cache("service", ttl=3600)
 
-    # Fetch data from DB here and then cache it
-    fetched_data = {"service_id": service_id, "data": "Service Data"}
-    set_cache(f"service:{service_id}", fetched_data)
-    return fetched_data
+
+@router.get("/service/{service_id}", response_model=ServicePublic)
+@cached(service_cache)
+async def get_service(service_id: str) -> ServicePublic:
+    # Fetch data from DB here, the result is cached
+    return ServicePublic(service_id=service_id, data="Service Data")
@@ -1,25 +1,32 @@
 import uuid
-from typing import Any
+from typing import Annotated, Any
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlmodel import col, delete, func, select
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlmodel import select
 
 from app import crud
+from app.api.counts import count_rows
 from app.api.deps import (
+    AsyncReadSessionDep,
     CurrentUser,
+    ReadSessionDep,
     SessionDep,
     get_current_active_superuser,
+    get_current_active_superuser_async,
 )
+from app.api.pagination import page_with_cursor, paginate
+from app.core.auth_cache import invalidate_user
 from app.core.config import settings
 from app.core.security import get_password_hash, verify_password
 from app.models import (
-    Item,
     Message,
     UpdatePassword,
     User,
     UserCreate,
+    UserNearby,
     UserPublic,
     UserRegister,
+    UsersNearby,
     UsersPublic,
     UserUpdate,
     UserUpdateMe,
@@ -31,21 +38,42 @@ router = APIRouter()
 
 @router.get(
     "/",
-    dependencies=[Depends(get_current_active_superuser)],
+    dependencies=[Depends(get_current_active_superuser_async)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+async def read_users(
+    session: AsyncReadSessionDep,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: str | None = None,
+    include_count: bool = True,
+) -> Any:
     """
-    Retrieve users.
+    Retrieve users, ordered by email.
+
+    Pass the returned `next_cursor` as `cursor` to get the following page,
+    `skip` is only used without a cursor. With `include_count=false` the
+    total is not computed and `count` is null. Users have no row counter,
+    with the "cached" count strategy `count` is the planner's estimate.
     """
 
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
+    count = None
+    if include_count:
+        count = await count_rows(session, User)
 
-    statement = select(User).offset(skip).limit(limit)
-    users = session.exec(statement).all()
+    statement = paginate(
+        select(User),
+        sort_column=User.email,
+        id_column=User.id,
+        cursor=cursor,
+        skip=skip,
+        limit=limit,
+    )
+    users, next_cursor = page_with_cursor(
+        (await session.exec(statement)).all(), sort_attr="email", limit=limit
+    )
 
-    return UsersPublic(data=users, count=count)
+    return UsersPublic(data=users, count=count, next_cursor=next_cursor)
 
 
 @router.post(
@@ -93,6 +121,7 @@ def update_user_me(
     current_user.sqlmodel_update(user_data)
     session.add(current_user)
     session.commit()
+    invalidate_user(current_user.id)
     session.refresh(current_user)
     return current_user
 
@@ -114,6 +143,7 @@ def update_password_me(
     current_user.hashed_password = hashed_password
     session.add(current_user)
     session.commit()
+    invalidate_user(current_user.id)
     return Message(message="Password updated successfully")
 
 
@@ -134,10 +164,7 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == current_user.id)
-    session.exec(statement)  # type: ignore
-    session.delete(current_user)
-    session.commit()
+    crud.delete_user(session=session, db_user=current_user)
     return Message(message="User deleted successfully")
 
 
@@ -157,6 +184,53 @@ def register_user(session: SessionDep, user_in: UserRegister) -> Any:
     return user
 
 
+@router.get(
+    "/nearby",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=UsersNearby,
+)
+def read_users_nearby(
+    session: ReadSessionDep,
+    latitude: Annotated[float, Query(ge=-90, le=90)],
+    longitude: Annotated[float, Query(ge=-180, le=180)],
+    radius_km: Annotated[
+        float | None, Query(gt=0, le=settings.NEARBY_MAX_RADIUS_KM)
+    ] = None,
+    limit: Annotated[int, Query(ge=1, le=settings.NEARBY_MAX_RESULTS)] = 10,
+) -> Any:
+    """
+    Users with a geocoded address near a point, closest first.
+
+    With `radius_km` the users within that distance, at most `limit`;
+    without it the `limit` nearest users.
+    """
+    if radius_km is not None:
+        users = crud.get_users_nearby(
+            session=session,
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=radius_km,
+            limit=limit,
+            max_cells=settings.NEARBY_COVER_MAX_CELLS,
+        )
+    else:
+        users = crud.get_nearest_users(
+            session=session,
+            latitude=latitude,
+            longitude=longitude,
+            k=limit,
+            start_radius_km=settings.NEARBY_START_RADIUS_KM,
+            max_radius_km=settings.NEARBY_MAX_RADIUS_KM,
+            max_cells=settings.NEARBY_COVER_MAX_CELLS,
+        )
+    return UsersNearby(
+        data=[
+            UserNearby.model_validate(user, update={"distance_km": distance_km})
+            for user, distance_km in users
+        ]
+    )
+
+
 @router.get("/{user_id}", response_model=UserPublic)
 def read_user_by_id(
     user_id: uuid.UUID, session: SessionDep, current_user: CurrentUser
@@ -221,8 +295,5 @@ def delete_user(
         raise HTTPException(
             status_code=403, detail="Super users are not allowed to delete themselves"
         )
-    statement = delete(Item).where(col(Item.owner_id) == user_id)
-    session.exec(statement)  # type: ignore
-    session.delete(user)
-    session.commit()
+    crud.delete_user(session=session, db_user=user)
     return Message(message="User deleted successfully")
@@ -1,8 +1,21 @@
+from typing import Any
+
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
 from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.core.db import get_pool_stats
+from app.core.replicas import replica_router
+from app.core.security import password_hasher
+from app.models import (
+    CacheStats,
+    DBPoolStats,
+    GeoIPStats,
+    Message,
+    PasswordHasherStats,
+)
+from app.services.cache import get_cache_stats
+from app.services.geoip_service import geoip_reader
 from app.utils import generate_test_email, send_email
 
 router = APIRouter()
@@ -29,3 +42,52 @@ def test_email(email_to: EmailStr) -> Message:
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get(
+    "/db-pool-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[DBPoolStats],
+)
+def db_pool_stats() -> Any:
+    """
+    Connection pool usage of the sync and async engines of the serving process,
+    the primary's then each read replica's.
+    """
+    return get_pool_stats() + replica_router.pool_stats()
+
+
+@router.get(
+    "/password-hasher-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=PasswordHasherStats,
+)
+def password_hasher_stats() -> Any:
+    """
+    Queue depth and latency of password hashing in the serving process.
+    """
+    return password_hasher.stats()
+
+
+@router.get(
+    "/cache-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[CacheStats],
+)
+def cache_stats() -> Any:
+    """
+    Hits, misses and Redis latency of each cache namespace in the serving process.
+    """
+    return get_cache_stats()
+
+
+@router.get(
+    "/geoip-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=GeoIPStats,
+)
+def geoip_stats() -> Any:
+    """
+    Cache hit rate and database lookup latency of the GeoIP reader in the serving process.
+    """
+    return geoip_reader.stats()
@@ -0,0 +1,200 @@
+"""
+Benchmark of the nearby user search over synthetic addresses.
+
+Inserts `--addresses` random addresses spread over the Caribbean, owned by
+`--users` synthetic users, then times the radius and nearest neighbour
+searches against a scan computing the distance of every address. Everything
+happens in one transaction that is rolled back at the end, run it against a
+development database:
+
+    python app/benchmark_nearby.py --addresses 1000000
+"""
+
+import argparse
+import logging
+import random
+import statistics
+import time
+import uuid
+from collections.abc import Callable
+from functools import partial
+from typing import Any
+
+from sqlalchemy import func, insert, text
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.core.geo import geohash_encode
+from app.models import User, UserAddress
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Latitude and longitude ranges of the synthetic addresses
+REGION = ((10.0, 27.0), (-85.0, -59.0))
+INSERT_BATCH_SIZE = 10000
+
+
+def _random_point(rng: random.Random) -> tuple[float, float]:
+    (min_latitude, max_latitude), (min_longitude, max_longitude) = REGION
+    return rng.uniform(min_latitude, max_latitude), rng.uniform(
+        min_longitude, max_longitude
+    )
+
+
+def populate(session: Session, *, users: int, addresses: int, seed: int) -> None:
+    rng = random.Random(seed)
+    run = uuid.uuid4().hex[:8]
+    user_ids = [uuid.uuid4() for _ in range(users)]
+    for start in range(0, users, INSERT_BATCH_SIZE):
+        session.execute(
+            insert(User),
+            [
+                {
+                    "id": user_id,
+                    "email": f"nearby-{run}-{start + i}@example.com",
+                    "hashed_password": "!",
+                    "is_active": True,
+                    "is_superuser": False,
+                }
+                for i, user_id in enumerate(user_ids[start : start + INSERT_BATCH_SIZE])
+            ],
+        )
+    for start in range(0, addresses, INSERT_BATCH_SIZE):
+        rows = []
+        for i in range(start, min(start + INSERT_BATCH_SIZE, addresses)):
+            latitude, longitude = _random_point(rng)
+            rows.append(
+                {
+                    "id": uuid.uuid4(),
+                    "user_id": user_ids[i % users],
+                    "address_line_1": f"{i} Benchmark Road",
+                    "city": "Kingston",
+                    "state": "St. Andrew",
+                    "country": "Jamaica",
+                    "postal_code": "JMAAW06",
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    # Bulk inserts skip the ORM hook that sets it
+                    "geohash": geohash_encode(latitude, longitude),
+                }
+            )
+        session.execute(insert(UserAddress), rows)
+        logger.info(f"Inserted {start + len(rows)} addresses")
+    session.execute(text('ANALYZE "user", useraddress'))
+
+
+def scan_nearby(
+    session: Session, latitude: float, longitude: float, radius_km: float, limit: int
+) -> list[tuple[uuid.UUID, float]]:
+    """The radius search without its index, as the baseline."""
+    distance = crud._distance_km(latitude, longitude)
+    statement = (
+        select(col(UserAddress.user_id), func.min(distance))
+        .where(distance <= radius_km)
+        .group_by(col(UserAddress.user_id))
+        .order_by(func.min(distance), col(UserAddress.user_id))
+        .limit(limit)
+    )
+    return [
+        (user_id, distance_km) for user_id, distance_km in session.execute(statement)
+    ]
+
+
+def _elapsed(run: Callable[[], Any]) -> tuple[float, Any]:
+    started = time.perf_counter()
+    result = run()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def _report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    logger.info(f"{name}: median {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms")
+
+
+def benchmark(
+    *,
+    users: int,
+    addresses: int,
+    queries: int,
+    radius_km: float,
+    k: int,
+    seed: int,
+) -> None:
+    rng = random.Random(seed + 1)
+    points = [_random_point(rng) for _ in range(queries)]
+    limit = settings.NEARBY_MAX_RESULTS
+    timings: dict[str, list[float]] = {"radius": [], "scan": [], "nearest": []}
+    mismatches = 0
+    with Session(engine) as session:
+        try:
+            populate(session, users=users, addresses=addresses, seed=seed)
+            for latitude, longitude in points:
+                elapsed, nearby = _elapsed(
+                    partial(
+                        crud.get_users_nearby,
+                        session=session,
+                        latitude=latitude,
+                        longitude=longitude,
+                        radius_km=radius_km,
+                        limit=limit,
+                        max_cells=settings.NEARBY_COVER_MAX_CELLS,
+                    )
+                )
+                timings["radius"].append(elapsed)
+                elapsed, scanned = _elapsed(
+                    partial(scan_nearby, session, latitude, longitude, radius_km, limit)
+                )
+                timings["scan"].append(elapsed)
+                if [user.id for user, _ in nearby] != [id for id, _ in scanned]:
+                    mismatches += 1
+                elapsed, _ = _elapsed(
+                    partial(
+                        crud.get_nearest_users,
+                        session=session,
+                        latitude=latitude,
+                        longitude=longitude,
+                        k=k,
+                        start_radius_km=settings.NEARBY_START_RADIUS_KM,
+                        max_radius_km=settings.NEARBY_MAX_RADIUS_KM,
+                        max_cells=settings.NEARBY_COVER_MAX_CELLS,
+                    )
+                )
+                timings["nearest"].append(elapsed)
+        finally:
+            session.rollback()
+    logger.info(
+        f"{addresses} addresses of {users} users, {queries} queries, "
+        f"radius {radius_km} km, k {k}"
+    )
+    _report("radius search", timings["radius"])
+    _report("full scan", timings["scan"])
+    _report("nearest neighbours", timings["nearest"])
+    if mismatches:
+        logger.warning(f"{mismatches} radius searches differ from the full scan")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--addresses", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--radius-km", type=float, default=10)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    benchmark(
+        users=args.users,
+        addresses=args.addresses,
+        queries=args.queries,
+        radius_km=args.radius_km,
+        k=args.k,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
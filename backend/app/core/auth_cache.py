@@ -0,0 +1,165 @@
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections.abc import Collection
+from typing import Any
+
+import jwt
+import redis
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.core import security
+from app.core.config import settings
+from app.models import User
+from app.services.cache import ALL_TAGS, LRUCache, on_invalidate, redis_client
+from app.services.redis_pool import async_redis
+
+logger = logging.getLogger(__name__)
+
+USER_SNAPSHOT_KEY = "auth:user:{}"
+
+# sha256(token) -> verified claims, each entry expiring with the token itself
+token_cache = LRUCache(maxsize=settings.AUTH_TOKEN_CACHE_SIZE)
+# user id -> column values of the user, except the password hash
+user_cache = LRUCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS
+)
+
+
+def decode_access_token(token: str) -> dict[str, Any]:
+    """
+    Verify an access token and return its claims.
+
+    Signature verification runs once per token; afterwards the claims are
+    served from memory until the token expires.
+    Raises jwt.InvalidTokenError like jwt.decode.
+    """
+    key = hashlib.sha256(token.encode()).digest()
+    claims: dict[str, Any] | None = token_cache.get(key)
+    if claims is not None:
+        return claims
+    claims = jwt.decode(token, settings.SECRET_KEY, algorithms=[security.ALGORITHM])
+    ttl = None
+    if isinstance(claims.get("exp"), int | float):
+        ttl = claims["exp"] - time.time()
+    token_cache.set(key, claims, ttl=ttl)
+    return claims
+
+
+def _user_cache_enabled() -> bool:
+    return settings.AUTH_USER_CACHE_TTL_SECONDS > 0
+
+
+def get_user_snapshot(user_id: str) -> User | None:
+    """
+    Detached User rebuilt from the snapshot cache, None on a miss.
+
+    The password hash is never cached, it is loaded on first access once the
+    instance is merged into a session.
+    """
+    if not _user_cache_enabled():
+        return None
+    data = user_cache.get(user_id)
+    if data is None and settings.AUTH_USER_CACHE_REDIS:
+        try:
+            raw = redis_client.get(USER_SNAPSHOT_KEY.format(user_id))
+        except redis.RedisError as e:
+            logger.error(f"Could not read user snapshot {user_id}: {e}")
+            raw = None
+        data = _load_shared_snapshot(user_id, raw)
+    return _snapshot_user(data)
+
+
+async def get_user_snapshot_async(user_id: str) -> User | None:
+    if not _user_cache_enabled():
+        return None
+    data = user_cache.get(user_id)
+    if data is None and settings.AUTH_USER_CACHE_REDIS:
+        try:
+            raw = await async_redis.client.get(USER_SNAPSHOT_KEY.format(user_id))
+        except redis.RedisError as e:
+            logger.error(f"Could not read user snapshot {user_id}: {e}")
+            raw = None
+        data = _load_shared_snapshot(user_id, raw)
+    return _snapshot_user(data)
+
+
+def _load_shared_snapshot(
+    user_id: str, raw: str | bytes | None
+) -> dict[str, Any] | None:
+    if not raw:
+        return None
+    data: dict[str, Any] = json.loads(raw)
+    data["id"] = uuid.UUID(data["id"])
+    user_cache.set(user_id, data)
+    return data
+
+
+def _snapshot_user(data: dict[str, Any] | None) -> User | None:
+    if data is None:
+        return None
+    user = User(**data)
+    make_transient_to_detached(user)
+    return user
+
+
+def set_user_snapshot(user: User) -> None:
+    if not _user_cache_enabled():
+        return
+    data = user.model_dump(exclude={"hashed_password"})
+    user_cache.set(str(user.id), data)
+    if settings.AUTH_USER_CACHE_REDIS:
+        try:
+            redis_client.set(
+                USER_SNAPSHOT_KEY.format(user.id),
+                json.dumps(data, default=str),
+                px=int(settings.AUTH_USER_CACHE_TTL_SECONDS * 1000),
+            )
+        except redis.RedisError as e:
+            logger.error(f"Could not store user snapshot {user.id}: {e}")
+
+
+async def set_user_snapshot_async(user: User) -> None:
+    if not _user_cache_enabled():
+        return
+    data = user.model_dump(exclude={"hashed_password"})
+    user_cache.set(str(user.id), data)
+    if settings.AUTH_USER_CACHE_REDIS:
+        try:
+            await async_redis.client.set(
+                USER_SNAPSHOT_KEY.format(user.id),
+                json.dumps(data, default=str),
+                px=int(settings.AUTH_USER_CACHE_TTL_SECONDS * 1000),
+            )
+        except redis.RedisError as e:
+            logger.error(f"Could not store user snapshot {user.id}: {e}")
+
+
+def invalidate_user(user_id: uuid.UUID | str) -> None:
+    """
+    Drop the cached snapshot of a user, call after changing or deleting one.
+
+    Only this process and Redis are purged here; other workers drop their
+    in-process copy when the commit invalidates the "user:<id>" cache tag.
+    """
+    user_cache.delete(str(user_id))
+    if settings.AUTH_USER_CACHE_REDIS:
+        try:
+            redis_client.delete(USER_SNAPSHOT_KEY.format(user_id))
+        except redis.RedisError as e:
+            logger.error(f"Could not invalidate user snapshot {user_id}: {e}")
+
+
+def _purge_user_snapshots(tags: Collection[str]) -> None:
+    if ALL_TAGS in tags:
+        user_cache.clear()
+        return
+    for tag in tags:
+        kind, _, user_id = tag.partition(":")
+        if kind == "user":
+            user_cache.delete(user_id)
+
+
+on_invalidate(_purge_user_snapshots)
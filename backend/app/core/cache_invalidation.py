@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+from collections.abc import Callable
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app.models import Item, Notification, Payment, User
+from app.services.cache import invalidate_tags, invalidate_tags_async
+
+# Cache tags of the models, entries depending on a row are tagged with these
+USER_TAG = "user:{}"
+ITEM_TAG = "item:{}"
+OWNER_ITEMS_TAG = "items:owner:{}"
+USER_PAYMENTS_TAG = "payments:user:{}"
+USER_NOTIFICATIONS_TAG = "notifications:user:{}"
+
+# Tags to purge once the session commits
+SESSION_TAGS_KEY = "cache_tags"
+
+# Purges scheduled on an event loop, referenced until they are done
+_pending: set[asyncio.Task[None]] = set()
+
+
+def _previous(obj: Any, attribute: str) -> list[Any]:
+    """Values `attribute` had before the pending change, if it changed."""
+    return list(sa_inspect(obj).attrs[attribute].history.deleted or ())
+
+
+def _user_tags(user: User) -> list[str]:
+    return [USER_TAG.format(user.id)]
+
+
+def _item_tags(item: Item) -> list[str]:
+    owners = [item.owner_id, *_previous(item, "owner_id")]
+    return [ITEM_TAG.format(item.id)] + [
+        OWNER_ITEMS_TAG.format(owner_id) for owner_id in owners
+    ]
+
+
+def _payment_tags(payment: Payment) -> list[str]:
+    users = [payment.user_id, *_previous(payment, "user_id")]
+    return [USER_PAYMENTS_TAG.format(user_id) for user_id in users]
+
+
+def _notification_tags(notification: Notification) -> list[str]:
+    users = [notification.user_id, *_previous(notification, "user_id")]
+    return [USER_NOTIFICATIONS_TAG.format(user_id) for user_id in users]
+
+
+MODEL_TAGS: dict[type, Callable[[Any], list[str]]] = {
+    User: _user_tags,
+    Item: _item_tags,
+    Payment: _payment_tags,
+    Notification: _notification_tags,
+}
+
+
+def tag_session(session: Session, *tags: str) -> None:
+    """
+    Purge `tags` when `session` commits.
+
+    Changes made through the ORM are tagged automatically, this is for bulk
+    statements such as `delete(Item).where(...)` that bypass it.
+    """
+    session.info.setdefault(SESSION_TAGS_KEY, set()).update(tags)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_tags(session: Session, _flush_context: Any) -> None:
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        tags_of = MODEL_TAGS.get(type(obj))
+        if tags_of is not None:
+            tag_session(session, *tags_of(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _purge_tags(session: Session) -> None:
+    tags = session.info.pop(SESSION_TAGS_KEY, None)
+    if not tags:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        invalidate_tags(*sorted(tags))
+        return
+    # Committed on the event loop (an AsyncSession), the Redis round trip
+    # runs as a task rather than blocking the loop
+    task = loop.create_task(invalidate_tags_async(*sorted(tags)))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_tags(session: Session, _previous_transaction: Any) -> None:
+    session.info.pop(SESSION_TAGS_KEY, None)
@@ -2,6 +2,7 @@ import os
 import secrets
 import warnings
 from typing import Annotated, Any, Literal
+from urllib.parse import quote
 
 from pydantic import (
     AnyUrl,
@@ -35,6 +36,18 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # Verified token claims kept in memory until the token expires
+    AUTH_TOKEN_CACHE_SIZE: int = 10_000
+    # Snapshots of authenticated users, 0 disables the cache; with
+    # AUTH_USER_CACHE_REDIS they are shared with other workers through Redis
+    AUTH_USER_CACHE_SIZE: int = 10_000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 10
+    AUTH_USER_CACHE_REDIS: bool = False
+    # bcrypt runs in this many worker processes (0 hashes in the calling
+    # thread); once PASSWORD_HASHER_MAX_QUEUE more operations are waiting,
+    # further logins/password changes are rejected with 429
+    PASSWORD_HASHER_WORKERS: int = 2
+    PASSWORD_HASHER_MAX_QUEUE: int = 32
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
@@ -79,6 +92,57 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # Connection pool, sized per engine: every process owns a sync engine and
+    # web workers additionally an async one
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Total connections this deployment may open against Postgres; when set,
+    # the per-process pool is capped to an even share of it
+    DB_MAX_CONNECTIONS: int | None = None
+    # Process counts sharing DB_MAX_CONNECTIONS, keep them in line with
+    # `fastapi run --workers` and `celery worker --concurrency`
+    WEB_CONCURRENCY: int = 1
+    CELERY_WORKER_CONCURRENCY: int = 0
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def db_pool_limits(self) -> tuple[int, int]:
+        """(pool_size, max_overflow) for each connection pool of this process."""
+        if self.DB_MAX_CONNECTIONS is None:
+            return self.DB_POOL_SIZE, self.DB_MAX_OVERFLOW
+        pools = max(1, 2 * self.WEB_CONCURRENCY + self.CELERY_WORKER_CONCURRENCY)
+        budget = max(1, self.DB_MAX_CONNECTIONS // pools)
+        pool_size = min(self.DB_POOL_SIZE, budget)
+        max_overflow = min(self.DB_MAX_OVERFLOW, budget - pool_size)
+        return pool_size, max_overflow
+
+    # Optional hot standbys serving read-only routes, comma separated DSNs
+    POSTGRES_REPLICA_URIS: Annotated[
+        list[PostgresDsn] | str, BeforeValidator(parse_cors)
+    ] = []
+    REPLICA_SELECTION: Literal["round_robin", "least_connections"] = "round_robin"
+    # How long a replica that failed to connect is left out of rotation
+    REPLICA_EJECT_SECONDS: float = 30
+    # How long after committing a write a user keeps reading from the primary
+    READ_YOUR_WRITES_SECONDS: float = 5
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def replica_database_uris(self) -> list[str]:
+        # Accept plain postgresql:// DSNs, the engines need the psycopg driver
+        return [
+            str(uri).replace(f"{uri.scheme}://", "postgresql+psycopg://", 1)
+            for uri in self.POSTGRES_REPLICA_URIS
+        ]
+
+    # How list endpoints compute their total `count`: a COUNT(*) query,
+    # the planner's estimate, or the per-owner counters kept in the rowcount
+    # table (the planner's estimate for whole tables)
+    LIST_COUNT_STRATEGY: Literal["exact", "estimated", "cached"] = "exact"
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -106,6 +170,31 @@ class Settings(BaseSettings):
     REDIS_HOST: str =  "localhost"
     REDIS_PORT: int =  6379
     REDIS_URL: str = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"  # Redis URL for Celery backend and cache
+    # Limits of each Redis connection pool, callers wait REDIS_POOL_TIMEOUT_SECONDS
+    # for a free connection once REDIS_MAX_CONNECTIONS are in use
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT_SECONDS: float = 5
+    REDIS_SOCKET_TIMEOUT_SECONDS: float = 2
+    REDIS_HEALTH_CHECK_INTERVAL: int = 30
+
+    # Two-tier cache of app.services.cache: an in-process LRU in front of Redis
+    CACHE_KEY_PREFIX: str = "cache"
+    CACHE_SERIALIZER: Literal["json", "msgpack"] = "json"
+    CACHE_DEFAULT_TTL_SECONDS: float = 300
+    # Entries are kept in process for at most this long, 0 disables the tier
+    CACHE_L1_TTL_SECONDS: float = 5
+    CACHE_L1_MAXSIZE: int = 10_000
+    CACHE_REDIS_ENABLED: bool = True
+    # After a Redis error the cache serves from process memory for this long
+    CACHE_REDIS_RETRY_SECONDS: float = 5
+    # Concurrent misses of a key share one load per process; with the lock
+    # enabled a Redis lock makes it one load across all workers
+    CACHE_LOCK_ENABLED: bool = False
+    CACHE_LOCK_TIMEOUT_SECONDS: float = 10
+    # XFetch early refresh, higher refreshes earlier, 0 disables it
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+    # Pub/sub channel telling every worker which cache tags to purge
+    CACHE_INVALIDATION_CHANNEL: str = "cache:invalidate"
 
     # RabbitMQ settings
     RABBITMQ_HOST: str = os.getenv("RABBITMQ_HOST", "localhost")
@@ -113,6 +202,120 @@ class Settings(BaseSettings):
     RABBITMQ_USER: str = os.getenv("RABBITMQ_USER", "celreyuser")
     RABBITMQ_PASSWORD: str = os.getenv("RABBITMQ_PASSWORD", "rabbitpass")
     RABBITMQ_VHOST: str = os.getenv("RABBITMQ_VHOST", "/")
+    # Channels the long-lived publisher keeps open, each in confirm mode
+    RABBITMQ_CHANNEL_POOL_SIZE: int = 4
+    # How long a publish waits for the broker to confirm it
+    RABBITMQ_PUBLISH_TIMEOUT_SECONDS: float = 10
+    # Batched publishing: a burst is sent at BATCH_SIZE messages or after
+    # BATCH_LINGER_MS, publishers wait once CONFIRM_WINDOW are unconfirmed
+    RABBITMQ_BATCH_SIZE: int = 100
+    RABBITMQ_BATCH_LINGER_MS: float = 5
+    RABBITMQ_CONFIRM_WINDOW: int = 1000
+    # Consumers: unacked messages per queue and handler tasks working on them
+    RABBITMQ_PREFETCH_COUNT: int = 50
+    RABBITMQ_CONSUMER_CONCURRENCY: int = 10
+    # A failed message is retried after each delay in turn, then parked in
+    # the "<queue>.dead" queue
+    RABBITMQ_RETRY_DELAYS_SECONDS: Annotated[
+        list[int] | str, BeforeValidator(parse_cors)
+    ] = [5, 30, 300]
+    # How long a stopping consumer finishes the messages it holds
+    RABBITMQ_DRAIN_TIMEOUT_SECONDS: float = 30
+    # Interval between per-queue stats log lines, 0 disables them
+    RABBITMQ_CONSUMER_STATS_INTERVAL_SECONDS: float = 60
+
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def RABBITMQ_URL(self) -> str:
+        # The default vhost "/" has to be escaped in the URL path
+        return (
+            f"amqp://{quote(self.RABBITMQ_USER, safe='')}:"
+            f"{quote(self.RABBITMQ_PASSWORD, safe='')}@"
+            f"{self.RABBITMQ_HOST}:{self.RABBITMQ_PORT}/"
+            f"{quote(self.RABBITMQ_VHOST, safe='')}"
+        )
+
+    # Hourly cleanup of Record rows older than RECORD_RETENTION_DAYS: rows
+    # deleted per transaction, pause between them and time budget of a run,
+    # after which the cleanup continues in a follow-up task
+    RECORD_RETENTION_DAYS: int = 30
+    RECORD_CLEANUP_BATCH_SIZE: int = 5000
+    RECORD_CLEANUP_SLEEP_SECONDS: float = 0.1
+    RECORD_CLEANUP_MAX_SECONDS: float = 300
+
+    # Monthly partitions created ahead of time by the maintenance task and
+    # app/partition_tables.py, which stores record and notification as
+    # tables range-partitioned by month
+    PARTITION_PREMAKE_MONTHS: int = 3
+    # Partitions whose month is older than this are dropped
+    NOTIFICATION_RETENTION_DAYS: int = 365
+
+    # GeoIP: GeoLite2 City database (app/services/data/geoip when unset),
+    # memory mapped once per process; lookups cached per address, or per
+    # /24 and /48 network with GEOIP_CACHE_BY_NETWORK, and how often the
+    # file is checked for a replacement to reload
+    GEOIP_DB_PATH: str | None = None
+    GEOIP_CACHE_SIZE: int = 100_000
+    GEOIP_CACHE_BY_NETWORK: bool = False
+    GEOIP_RELOAD_CHECK_SECONDS: float = 60
+    # Request paths where GeoIPMiddleware provides request.state.location,
+    # comma separated fnmatch patterns
+    GEOIP_INCLUDE_PATHS: Annotated[
+        list[str] | str, BeforeValidator(parse_cors)
+    ] = ["*"]
+    GEOIP_EXCLUDE_PATHS: Annotated[
+        list[str] | str, BeforeValidator(parse_cors)
+    ] = []
+    # Batch lookups: processes of the lookup pool (0 looks up in the caller),
+    # addresses per task, most addresses accepted by the admin endpoint and
+    # largest request body it reads, room for as many IPv6 addresses
+    GEOIP_BATCH_WORKERS: int = 2
+    GEOIP_BATCH_CHUNK_SIZE: int = 1000
+    GEOIP_BATCH_MAX_ADDRESSES: int = 100_000
+    GEOIP_BATCH_MAX_BYTES: int = 8_000_000
+
+    # Geocoding of user addresses, done in the background by a periodic
+    # task: API key, request timeout, addresses read per batch, API requests
+    # per second and per run, and the longest run, kept below the 10 minute
+    # schedule
+    GOOGLE_MAPS_API_KEY: str | None = None
+    GEOCODING_TIMEOUT_SECONDS: float = 5
+    GEOCODING_BATCH_SIZE: int = 100
+    GEOCODING_RATE_PER_SECOND: float = 10
+    GEOCODING_MAX_REQUESTS: int = 1000
+    GEOCODING_MAX_RUN_SECONDS: float = 480
+
+    # Nearby user search: largest radius and result count accepted, radius
+    # the nearest neighbour search starts from before widening, and geohash
+    # cells a search box is covered with
+    NEARBY_MAX_RADIUS_KM: float = 500
+    NEARBY_MAX_RESULTS: int = 100
+    NEARBY_START_RADIUS_KM: float = 5
+    NEARBY_COVER_MAX_CELLS: int = 32
+
+    # Daily report: file format, rows fetched per round trip while streaming,
+    # where the file is written (temp dir when unset), the largest file
+    # attached to the email, bigger ones are referred to by path and kept
+    # for REPORT_RETENTION_DAYS
+    REPORT_FORMAT: Literal["csv", "jsonl"] = "csv"
+    REPORT_YIELD_PER: int = 1000
+    REPORT_DIR: str | None = None
+    REPORT_ATTACHMENT_MAX_BYTES: int = 10_000_000
+    REPORT_RETENTION_DAYS: int = 7
+    REPORT_EMAIL_TO: str = "admin@example.com"
+
+    # Daily rollups: source rows folded in per transaction, and how old a
+    # row must be before it is, so transactions still in flight when the
+    # watermark moves past their timestamps are not skipped. Timestamps are
+    # set before the commit, the days of the last ROLLUP_RESCAN_DAYS (and
+    # the current one) are also recounted on every refresh to catch rows
+    # committed later than that
+    ROLLUP_BATCH_SIZE: int = 10_000
+    ROLLUP_LAG_SECONDS: int = 60
+    ROLLUP_RESCAN_DAYS: int = 1
+
+    # Users handled per query, INSERT and commit by notification broadcasts
+    NOTIFICATION_BROADCAST_CHUNK_SIZE: int = 1000
 
     # Celery configurations
     CELERY_BROKER_URL: str = f"amqp://{RABBITMQ_USER}:{RABBITMQ_PASSWORD}@{RABBITMQ_HOST}:{RABBITMQ_PORT}/{RABBITMQ_VHOST}"
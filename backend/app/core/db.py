@@ -1,11 +1,100 @@
+import time
+from typing import Any
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, QueuePool
 from sqlmodel import Session, create_engine, select
 
 from app import crud
 from app.core.config import settings
+from app.core.metrics import Counter, Histogram
 from app.models import Payment, User, UserCreate
 from app.schemas.payment import PaymentRequest
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+
+class PoolStats:
+    """Checkout wait times and timeouts observed by an instrumented pool."""
+
+    def __init__(self) -> None:
+        self.wait_time = Histogram()
+        self.timeouts = Counter()
+
+    def snapshot(self, pool: QueuePool) -> dict[str, Any]:
+        return {
+            "pool_size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "timeouts": self.timeouts.value,
+            "wait_time": self.wait_time.snapshot(),
+        }
+
+
+class _InstrumentedPoolMixin:
+    """
+    Records how long each checkout waited for a connection.
+
+    Stats live on the concrete pool class because the engine recreates its
+    pool (e.g. on dispose) without forwarding custom arguments.
+    """
+
+    stats: PoolStats
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()  # type: ignore[misc, no-any-return]
+        except exc.TimeoutError:
+            self.stats.timeouts.inc()
+            raise
+        finally:
+            self.stats.wait_time.observe(time.perf_counter() - start)
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    stats = PoolStats()
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    stats = PoolStats()
+
+
+pool_size, max_overflow = settings.db_pool_limits
+pool_options: dict[str, Any] = {
+    "pool_size": pool_size,
+    "max_overflow": max_overflow,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+engine = create_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedQueuePool,
+    **pool_options,
+)
+
+# psycopg 3 drives both engines, the async one serves `async def` routes so
+# their DB round-trips don't hold a threadpool slot
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI),
+    poolclass=InstrumentedAsyncQueuePool,
+    **pool_options,
+)
+
+
+def get_pool_stats() -> list[dict[str, Any]]:
+    return [
+        {"name": "sync", **InstrumentedQueuePool.stats.snapshot(engine.pool)},  # type: ignore[arg-type]
+        {
+            "name": "async",
+            **InstrumentedAsyncQueuePool.stats.snapshot(async_engine.pool),  # type: ignore[arg-type]
+        },
+    ]
+
+
 SessionLocal = Session(autocommit=False, autoflush=False, bind=engine)
 
 
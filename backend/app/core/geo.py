@@ -0,0 +1,122 @@
+import itertools
+import math
+from typing import NamedTuple
+
+# Mean earth radius
+EARTH_RADIUS_KM = 6371.0088
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+# Stored precision, cells of about 3.7 cm by 1.9 cm
+GEOHASH_PRECISION = 12
+
+
+class BoundingBox(NamedTuple):
+    min_latitude: float
+    max_latitude: float
+    # min_longitude > max_longitude when the box crosses the antimeridian
+    min_longitude: float
+    max_longitude: float
+
+
+def haversine_km(
+    latitude1: float, longitude1: float, latitude2: float, longitude2: float
+) -> float:
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = (
+        math.sin((phi2 - phi1) / 2) ** 2
+        + math.cos(phi1)
+        * math.cos(phi2)
+        * math.sin(math.radians(longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def geohash_encode(
+    latitude: float, longitude: float, precision: int = GEOHASH_PRECISION
+) -> str:
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    # Bits alternate between longitude and latitude, longitude first
+    even = True
+    while len(chars) < precision:
+        interval, coordinate = (
+            (longitude_range, longitude) if even else (latitude_range, latitude)
+        )
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = value = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int) -> tuple[float, float]:
+    """Height and width in degrees of the geohash cells of `precision`."""
+    longitude_bits = math.ceil(precision * 5 / 2)
+    latitude_bits = precision * 5 // 2
+    return 180 / 2**latitude_bits, 360 / 2**longitude_bits
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> BoundingBox:
+    """Smallest latitude/longitude box holding the circle of `radius_km`."""
+    angle = radius_km / EARTH_RADIUS_KM
+    min_latitude = latitude - math.degrees(angle)
+    max_latitude = latitude + math.degrees(angle)
+    if min_latitude <= -90 or max_latitude >= 90 or angle >= math.pi / 2:
+        # Around a pole every longitude is in reach
+        return BoundingBox(max(min_latitude, -90), min(max_latitude, 90), -180, 180)
+    delta = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    min_longitude, max_longitude = longitude - delta, longitude + delta
+    if min_longitude < -180:
+        min_longitude += 360
+    if max_longitude > 180:
+        max_longitude -= 360
+    return BoundingBox(min_latitude, max_latitude, min_longitude, max_longitude)
+
+
+def _cell_indexes(
+    low: float, high: float, origin: float, step: float, cells: int
+) -> list[range]:
+    first = min(int((low - origin) // step), cells - 1)
+    last = min(int((high - origin) // step), cells - 1)
+    if first <= last:
+        return [range(first, last + 1)]
+    # Wrapped around the antimeridian
+    return [range(first, cells), range(0, last + 1)]
+
+
+def geohash_cover(box: BoundingBox, max_cells: int = 32) -> list[str]:
+    """
+    Geohash prefixes whose cells cover `box`, using the longest prefixes
+    that need at most `max_cells` cells.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = geohash_cell_size(precision)
+        rows = _cell_indexes(
+            box.min_latitude, box.max_latitude, -90, height, round(180 / height)
+        )
+        columns = _cell_indexes(
+            box.min_longitude, box.max_longitude, -180, width, round(360 / width)
+        )
+        count = sum(map(len, rows)) * sum(map(len, columns))
+        if count <= max_cells or precision == 1:
+            break
+    return sorted(
+        {
+            geohash_encode(
+                -90 + (row + 0.5) * height, -180 + (column + 0.5) * width, precision
+            )
+            for row in itertools.chain(*rows)
+            for column in itertools.chain(*columns)
+        }
+    )
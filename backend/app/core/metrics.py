@@ -0,0 +1,83 @@
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+# Upper bounds in seconds, tuned for DB/cache/CPU work done inside a request
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Counter:
+    """Thread-safe monotonically increasing counter."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+class Histogram:
+    """Thread-safe cumulative histogram of observed durations, in seconds."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self._lock = threading.Lock()
+        self._bounds = tuple(sorted(buckets))
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._count += 1
+            self._sum += value
+            for i, bound in enumerate(self._bounds):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+            else:
+                self._counts[-1] += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Return the histogram in Prometheus style: bucket counts are cumulative
+        and keyed by their upper bound, with a final "+Inf" bucket.
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        buckets: dict[str, int] = {}
+        running = 0
+        for bound, n in zip(self._bounds, counts, strict=False):
+            running += n
+            buckets[f"{bound:g}"] = running
+        buckets["+Inf"] = running + counts[-1]
+        return {"count": count, "sum": total, "buckets": buckets}
@@ -0,0 +1,253 @@
+import re
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import Connection, text
+
+# Tables that can be stored range-partitioned by month on their time column
+PARTITIONED_TABLES = {"record": "created_at", "notification": "sent_at"}
+
+_MONTH_SUFFIX = re.compile(r"_p(\d{4})_(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def _quote(connection: Connection, name: str) -> str:
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def is_partitioned(connection: Connection, table: str) -> bool:
+    statement = text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(quote_ident(:table))"
+    )
+    return connection.execute(statement, {"table": table}).scalar() == "p"
+
+
+def list_partitions(connection: Connection, table: str) -> dict[date, str]:
+    """Monthly partitions of `table`, by the first day of their month."""
+    statement = text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(quote_ident(:table))"
+    )
+    partitions = {}
+    for name in connection.execute(statement, {"table": table}).scalars():
+        match = _MONTH_SUFFIX.search(name)
+        if match is None:
+            continue
+        month = date(int(match[1]), int(match[2]), 1)
+        if name == partition_name(table, month):
+            partitions[month] = name
+    return partitions
+
+
+def create_partition(connection: Connection, table: str, month: date) -> str:
+    name = partition_name(table, month)
+    connection.execute(
+        text(
+            f"CREATE TABLE IF NOT EXISTS {_quote(connection, name)} "
+            f"PARTITION OF {_quote(connection, table)} "
+            f"FOR VALUES FROM ('{month.isoformat()}') "
+            f"TO ('{add_months(month, 1).isoformat()}')"
+        )
+    )
+    return name
+
+
+def _has_default_partition(connection: Connection, table: str) -> bool:
+    statement = text(
+        "SELECT partdefid <> 0 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass(quote_ident(:table))"
+    )
+    return bool(connection.execute(statement, {"table": table}).scalar())
+
+
+def drop_partition(connection: Connection, table: str, name: str) -> None:
+    """
+    Detach partition `name` of `table` then drop it.
+
+    DETACH ... CONCURRENTLY only takes a SHARE UPDATE EXCLUSIVE lock on
+    `table`, reads and writes go on; it can't run in a transaction block,
+    `connection` has to be in autocommit. A detach interrupted earlier is
+    finalized instead. Tables partitioned with a default partition can only
+    be detached with an exclusive lock.
+    """
+    quoted_table, quoted_name = _quote(connection, table), _quote(connection, name)
+    pending = connection.execute(
+        text(
+            "SELECT inhdetachpending FROM pg_inherits "
+            "WHERE inhrelid = to_regclass(quote_ident(:name))"
+        ),
+        {"name": name},
+    ).scalar()
+    if pending:
+        mode = " FINALIZE"
+    elif _has_default_partition(connection, table):
+        mode = ""
+    else:
+        mode = " CONCURRENTLY"
+    connection.execute(
+        text(f"ALTER TABLE {quoted_table} DETACH PARTITION {quoted_name}{mode}")
+    )
+    connection.execute(text(f"DROP TABLE {quoted_name}"))
+
+
+def maintain_table_partitions(
+    connection: Connection,
+    table: str,
+    *,
+    today: date,
+    months_ahead: int,
+    retention_days: int | None,
+) -> tuple[list[str], list[str]]:
+    """
+    Create the partitions of `table` from this month to `months_ahead`
+    months later and drop those whose whole month is older than
+    `retention_days`. Returns the names created and dropped.
+
+    Partitions are detached concurrently before being dropped, run it on a
+    connection in autocommit.
+    """
+    existing = list_partitions(connection, table)
+    current = month_start(today)
+    created = [
+        create_partition(connection, table, month)
+        for month in (add_months(current, i) for i in range(months_ahead + 1))
+        if month not in existing
+    ]
+    dropped = []
+    if retention_days is not None:
+        cutoff = today - timedelta(days=retention_days)
+        for month, name in sorted(existing.items()):
+            if add_months(month, 1) <= cutoff:
+                drop_partition(connection, table, name)
+                dropped.append(name)
+    return created, dropped
+
+
+def _definitions(
+    connection: Connection, table: str
+) -> tuple[str | None, list[str], list[tuple[str, str]]]:
+    """Primary key name, other index definitions and foreign keys of `table`."""
+    params = {"table": table}
+    primary_key = connection.execute(
+        text(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = to_regclass(quote_ident(:table)) AND contype = 'p'"
+        ),
+        params,
+    ).scalar()
+    indexes = connection.execute(
+        text(
+            "SELECT indexname, indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = :table"
+        ),
+        params,
+    ).all()
+    foreign_keys = connection.execute(
+        text(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(quote_ident(:table)) AND contype = 'f'"
+        ),
+        params,
+    ).all()
+    index_definitions = [
+        definition for name, definition in indexes if name != primary_key
+    ]
+    return primary_key, index_definitions, [(name, d) for name, d in foreign_keys]
+
+
+def _rebuild(
+    connection: Connection,
+    table: str,
+    *,
+    partition_by: str | None,
+    months_ahead: int = 0,
+) -> None:
+    quoted = _quote(connection, table)
+    previous = _quote(connection, f"{table}_previous")
+    primary_key, indexes, foreign_keys = _definitions(connection, table)
+    first_row: datetime | None = None
+    last_row: datetime | None = None
+    if partition_by is not None:
+        first_row, last_row = connection.execute(
+            text(
+                f"SELECT min({_quote(connection, partition_by)}), "
+                f"max({_quote(connection, partition_by)}) FROM {quoted}"
+            )
+        ).one()
+
+    connection.execute(text(f"ALTER TABLE {quoted} RENAME TO {previous}"))
+    partitioning = (
+        f" PARTITION BY RANGE ({_quote(connection, partition_by)})"
+        if partition_by is not None
+        else ""
+    )
+    connection.execute(
+        text(
+            f"CREATE TABLE {quoted} (LIKE {previous} "
+            f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partitioning}"
+        )
+    )
+    if partition_by is not None:
+        current = month_start(datetime.utcnow().date())
+        month = month_start(first_row.date()) if first_row else current
+        last = add_months(current, months_ahead)
+        if last_row is not None:
+            last = max(last, month_start(last_row.date()))
+        # No default partition, it would keep partitions from being detached
+        # concurrently
+        while month <= last:
+            create_partition(connection, table, month)
+            month = add_months(month, 1)
+    connection.execute(text(f"INSERT INTO {quoted} SELECT * FROM {previous}"))
+    connection.execute(text(f"DROP TABLE {previous}"))
+
+    # Recreated once the rows are in, under their previous names
+    if primary_key is not None:
+        # The partition key has to be part of the primary key
+        columns = f"id, {_quote(connection, partition_by)}" if partition_by else "id"
+        connection.execute(
+            text(
+                f"ALTER TABLE {quoted} ADD CONSTRAINT "
+                f"{_quote(connection, primary_key)} PRIMARY KEY ({columns})"
+            )
+        )
+    for definition in indexes:
+        connection.execute(text(definition))
+    for name, definition in foreign_keys:
+        connection.execute(
+            text(
+                f"ALTER TABLE {quoted} ADD CONSTRAINT "
+                f"{_quote(connection, name)} {definition}"
+            )
+        )
+
+
+def partition_table(
+    connection: Connection, table: str, column: str, *, months_ahead: int
+) -> None:
+    """
+    Rebuild `table` range-partitioned by month on `column`, keeping its rows,
+    indexes and foreign keys; the primary key becomes (id, `column`).
+
+    Monthly partitions cover the existing rows and `months_ahead` months
+    from now, the maintenance task keeps creating them ahead; a row outside
+    every partition fails to insert. The table is locked and its rows
+    copied, run it in a maintenance window.
+    """
+    _rebuild(connection, table, partition_by=column, months_ahead=months_ahead)
+
+
+def unpartition_table(connection: Connection, table: str) -> None:
+    """Rebuild a table turned by `partition_table` into a plain table."""
+    _rebuild(connection, table, partition_by=None)
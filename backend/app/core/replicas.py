@@ -0,0 +1,167 @@
+import itertools
+import logging
+import threading
+import time
+from typing import Any
+
+import redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session
+from sqlmodel import create_engine
+
+from app.core.config import settings
+from app.core.db import (
+    InstrumentedAsyncQueuePool,
+    InstrumentedQueuePool,
+    PoolStats,
+    pool_options,
+)
+from app.services.cache import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Recent writers are remembered locally and, so other workers see them too,
+# in Redis under this prefix
+RECENT_WRITE_KEY = "replicas:recent-write:{}"
+
+
+@event.listens_for(Session, "after_commit")
+def _flag_committed(session: Session) -> None:
+    session.info["committed"] = True
+
+
+class Replica:
+    def __init__(self, url: str) -> None:
+        # Pool classes of their own so the stats are per replica, with the
+        # same db_pool_limits as the primary's pools
+        self.pool_class = type(
+            "ReplicaQueuePool", (InstrumentedQueuePool,), {"stats": PoolStats()}
+        )
+        self.async_pool_class = type(
+            "ReplicaAsyncQueuePool",
+            (InstrumentedAsyncQueuePool,),
+            {"stats": PoolStats()},
+        )
+        self.engine: Engine = create_engine(
+            url, poolclass=self.pool_class, **pool_options
+        )
+        self.async_engine: AsyncEngine = create_async_engine(
+            url, poolclass=self.async_pool_class, **pool_options
+        )
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.ejected_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def in_use(self) -> int:
+        return self.engine.pool.checkedout() + self.async_engine.pool.checkedout()  # type: ignore[attr-defined]
+
+    def pool_stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "name": f"{self.name} sync",
+                **self.pool_class.stats.snapshot(self.engine.pool),  # type: ignore[arg-type]
+            },
+            {
+                "name": f"{self.name} async",
+                **self.async_pool_class.stats.snapshot(self.async_engine.pool),  # type: ignore[arg-type]
+            },
+        ]
+
+    async def dispose(self) -> None:
+        self.engine.dispose()
+        await self.async_engine.dispose()
+
+
+class ReplicaRouter:
+    """
+    Picks the replica serving a read-only request.
+
+    Replicas failing with a connection error are ejected for a cool-down
+    period, and users who committed a write within the read-your-writes
+    window keep reading from the primary so they never see their own write
+    missing.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        *,
+        strategy: str = "round_robin",
+        eject_seconds: float = 30,
+        read_your_writes_seconds: float = 5,
+    ) -> None:
+        self.replicas = [Replica(url) for url in urls]
+        self.strategy = strategy
+        self.eject_seconds = eject_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._recent_writes: dict[str, float] = {}
+
+    def choose(self, subject: str | None = None) -> Replica | None:
+        """Replica to read from, None means the primary."""
+        if not self.replicas or (subject and self.recently_wrote(subject)):
+            return None
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        if self.strategy == "least_connections":
+            return min(healthy, key=lambda replica: replica.in_use())
+        return healthy[next(self._counter) % len(healthy)]
+
+    def eject(self, replica: Replica) -> None:
+        replica.ejected_until = time.monotonic() + self.eject_seconds
+        logger.warning(
+            f"Ejecting read replica {replica.name} for {self.eject_seconds}s"
+        )
+
+    def mark_write(self, subject: str) -> None:
+        if not self.replicas:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._recent_writes) > 10_000:
+                self._recent_writes = {
+                    key: until
+                    for key, until in self._recent_writes.items()
+                    if until > now
+                }
+            self._recent_writes[subject] = now + self.read_your_writes_seconds
+        try:
+            redis_client.set(
+                RECENT_WRITE_KEY.format(subject),
+                1,
+                px=int(self.read_your_writes_seconds * 1000),
+            )
+        except redis.RedisError as e:
+            logger.error(f"Could not share recent write of {subject}: {e}")
+
+    def pool_stats(self) -> list[dict[str, Any]]:
+        return [stats for replica in self.replicas for stats in replica.pool_stats()]
+
+    async def dispose(self) -> None:
+        """Close the pooled connections of every replica."""
+        for replica in self.replicas:
+            await replica.dispose()
+
+    def recently_wrote(self, subject: str) -> bool:
+        if self._recent_writes.get(subject, 0.0) > time.monotonic():
+            return True
+        try:
+            return bool(redis_client.exists(RECENT_WRITE_KEY.format(subject)))
+        except redis.RedisError:
+            # Unknown, the primary is always consistent
+            return True
+
+
+replica_router = ReplicaRouter(
+    settings.replica_database_uris,
+    strategy=settings.REPLICA_SELECTION,
+    eject_seconds=settings.REPLICA_EJECT_SECONDS,
+    read_your_writes_seconds=settings.READ_YOUR_WRITES_SECONDS,
+)
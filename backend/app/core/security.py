@@ -1,11 +1,20 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
 from datetime import datetime, timedelta, timezone
-from typing import Any
+from typing import Any, TypeVar
  
 import jwt
 from jwt import PyJWTError
 from passlib.context import CryptContext
 
 from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+
+T = TypeVar("T")
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -18,12 +27,128 @@ def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+class PasswordHasherBusy(Exception):
+    """Every hasher slot is taken, the caller should retry later."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a process pool so hashing escapes the GIL.
+
+    At most `workers + max_queue` operations are admitted at once, beyond
+    that callers get PasswordHasherBusy right away instead of piling up.
+    With 0 workers, or inside a daemonic process such as a Celery prefork
+    child which can't have children, bcrypt runs in the calling thread.
+    """
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.capacity = max(workers, 1) + max_queue
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._executor: Executor | None = None
+        self.in_flight = 0
+        self.latency = Histogram()
+        self.rejected = Counter()
+
+    def _get_executor(self) -> Executor | None:
+        if self.workers <= 0 or multiprocessing.current_process().daemon:
+            return None
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded server process is not safe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _admit(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            self.rejected.inc()
+            raise PasswordHasherBusy()
+        with self._lock:
+            self.in_flight += 1
+
+    def _release(self, start: float) -> None:
+        self.latency.observe(time.perf_counter() - start)
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def _submit(self, fn: Callable[..., T], *args: Any) -> "Future[T]":
+        self._admit()
+        start = time.perf_counter()
+        executor = self._get_executor()
+        if executor is None:
+            future: Future[T] = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            try:
+                future = executor.submit(fn, *args)
+            except Exception:
+                self._release(start)
+                raise
+        future.add_done_callback(lambda _: self._release(start))
+        return future
+
+    def run(self, fn: Callable[..., T], *args: Any) -> T:
+        return self._submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable[..., T], *args: Any) -> T:
+        if self._get_executor() is None:
+            # Inline bcrypt must not run on the event loop
+            return await asyncio.to_thread(self.run, fn, *args)
+        return await asyncio.wrap_future(self._submit(fn, *args))
+
+    def stats(self) -> dict[str, Any]:
+        in_flight = self.in_flight
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": in_flight,
+            "queue_depth": max(0, in_flight - max(self.workers, 1)),
+            "rejected": self.rejected.value,
+            "latency": self.latency.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASHER_WORKERS,
+    max_queue=settings.PASSWORD_HASHER_MAX_QUEUE,
+)
+
+
+# Executed by the hasher processes, must stay importable module level functions
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+def _get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return password_hasher.run(_verify_password, plain_password, hashed_password)
+
+def get_password_hash(password: str) -> str:
+    return password_hasher.run(_get_password_hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.run_async(
+        _verify_password, plain_password, hashed_password
+    )
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.run_async(_get_password_hash, password)
+
 def authenticate_user(username: str, password: str):
     # Add user authentication logic
     if username == "user" and password == "password":
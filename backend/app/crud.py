@@ -1,10 +1,77 @@
+import math
 import uuid
+from collections.abc import Collection, Iterator, Sequence
+from datetime import datetime
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import ColumnElement, and_, func, or_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.core.auth_cache import invalidate_user
+from app.core.cache_invalidation import (
+    ITEM_TAG,
+    OWNER_ITEMS_TAG,
+    USER_NOTIFICATIONS_TAG,
+    tag_session,
+)
+from app.core.geo import EARTH_RADIUS_KM, bounding_box, geohash_cover
+from app.core.security import (
+    get_password_hash,
+    verify_password,
+    verify_password_async,
+)
+from app.models import (
+    GeocodeCache,
+    Item,
+    ItemCreate,
+    ItemPublic,
+    Notification,
+    RowCount,
+    User,
+    UserAddress,
+    UserCreate,
+    UserUpdate,
+)
+from app.services.cache import Cache, cached
+
+# Items by id, purged through ITEM_TAG whenever the item changes
+item_cache = Cache("item")
+
+
+@cached(item_cache, tags=lambda **kwargs: [ITEM_TAG.format(kwargs["item_id"])])
+async def get_item_async(
+    *, session: AsyncSession, item_id: uuid.UUID
+) -> ItemPublic | None:
+    item = await session.get(Item, item_id)
+    return ItemPublic.model_validate(item) if item else None
+
+
+# RowCount key of the items of one owner; there are no table-wide counters,
+# a single row every write updates would serialize all of them
+def item_count_key(owner_id: uuid.UUID) -> str:
+    return f"item:owner:{owner_id}"
+
+
+def adjust_row_counts(*, session: Session, deltas: dict[str, int]) -> None:
+    """
+    Add `deltas` to the RowCount counters within the current transaction.
+
+    Counters are upserted in key order so concurrent writers always lock
+    them in the same order.
+    """
+    values = [
+        {"key": key, "count": delta} for key, delta in sorted(deltas.items()) if delta
+    ]
+    if not values:
+        return
+    statement = insert(RowCount).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[RowCount.key],
+        set_={"count": RowCount.count + statement.excluded.count},
+    )
+    session.exec(statement)  # type: ignore
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -27,16 +94,41 @@ def update_user(*, session: Session, db_user: User, user_in: UserUpdate) -> Any:
     db_user.sqlmodel_update(user_data, update=extra_data)
     session.add(db_user)
     session.commit()
+    invalidate_user(db_user.id)
     session.refresh(db_user)
     return db_user
 
 
+def delete_user(*, session: Session, db_user: User) -> None:
+    statement = (
+        delete(Item).where(col(Item.owner_id) == db_user.id).returning(col(Item.id))
+    )
+    item_ids = session.exec(statement).scalars().all()  # type: ignore
+    # The bulk delete bypasses the ORM hooks tagging changed rows
+    tag_session(
+        session,
+        OWNER_ITEMS_TAG.format(db_user.id),
+        *(ITEM_TAG.format(item_id) for item_id in item_ids),
+    )
+    session.delete(db_user)
+    statement = delete(RowCount).where(col(RowCount.key) == item_count_key(db_user.id))
+    session.exec(statement)  # type: ignore
+    session.commit()
+    invalidate_user(db_user.id)
+
+
 def get_user_by_email(*, session: Session, email: str) -> User | None:
     statement = select(User).where(User.email == email)
     session_user = session.exec(statement).first()
     return session_user
 
 
+async def get_user_by_email_async(*, session: AsyncSession, email: str) -> User | None:
+    statement = select(User).where(User.email == email)
+    session_user = (await session.exec(statement)).first()
+    return session_user
+
+
 def authenticate(*, session: Session, email: str, password: str) -> User | None:
     db_user = get_user_by_email(session=session, email=email)
     if not db_user:
@@ -46,9 +138,220 @@ def authenticate(*, session: Session, email: str, password: str) -> User | None:
     return db_user
 
 
+async def authenticate_async(
+    *, session: AsyncSession, email: str, password: str
+) -> User | None:
+    db_user = await get_user_by_email_async(session=session, email=email)
+    if not db_user:
+        return None
+    if not await verify_password_async(password, db_user.hashed_password):
+        return None
+    return db_user
+
+
 def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -> Item:
     db_item = Item.model_validate(item_in, update={"owner_id": owner_id})
     session.add(db_item)
+    adjust_row_counts(session=session, deltas={item_count_key(owner_id): 1})
     session.commit()
     session.refresh(db_item)
     return db_item
+
+
+def delete_item(*, session: Session, db_item: Item) -> None:
+    session.delete(db_item)
+    adjust_row_counts(session=session, deltas={item_count_key(db_item.owner_id): -1})
+    session.commit()
+
+
+def iter_user_id_chunks(
+    *,
+    session: Session,
+    chunk_size: int,
+    is_active: bool | None = None,
+    is_superuser: bool | None = None,
+) -> Iterator[list[uuid.UUID]]:
+    """Ids of the users matching the filters, `chunk_size` at a time by id."""
+    statement = select(User.id).order_by(col(User.id)).limit(chunk_size)
+    if is_active is not None:
+        statement = statement.where(User.is_active == is_active)
+    if is_superuser is not None:
+        statement = statement.where(User.is_superuser == is_superuser)
+    last_id = None
+    while True:
+        page = statement if last_id is None else statement.where(col(User.id) > last_id)
+        user_ids = list(session.exec(page).all())
+        if not user_ids:
+            return
+        yield user_ids
+        last_id = user_ids[-1]
+
+
+def create_notifications(
+    *, session: Session, user_ids: Sequence[uuid.UUID], message: str
+) -> list[tuple[uuid.UUID, uuid.UUID]]:
+    """
+    Add a notification with `message` for each existing user of `user_ids`.
+
+    Existence is checked with a single query and the rows are written with a
+    single executemany INSERT, the caller commits. Unknown ids are skipped;
+    returns the (notification id, user id) pairs created.
+    """
+    existing = session.exec(select(User.id).where(col(User.id).in_(user_ids))).all()
+    if not existing:
+        return []
+    sent_at = datetime.utcnow()
+    rows = [
+        {"id": uuid.uuid4(), "user_id": user_id, "message": message, "sent_at": sent_at}
+        for user_id in existing
+    ]
+    session.execute(insert(Notification), rows)
+    # The bulk insert bypasses the ORM hooks tagging changed rows
+    tag_session(
+        session, *(USER_NOTIFICATIONS_TAG.format(user_id) for user_id in existing)
+    )
+    return [(row["id"], row["user_id"]) for row in rows]
+
+
+def get_geocodes(
+    *, session: Session, address_keys: Collection[str]
+) -> dict[str, GeocodeCache]:
+    """Cached geocoding results of `address_keys`, by key."""
+    if not address_keys:
+        return {}
+    statement = select(GeocodeCache).where(
+        col(GeocodeCache.address_key).in_(address_keys)
+    )
+    return {geocode.address_key: geocode for geocode in session.exec(statement)}
+
+
+def save_geocodes(*, session: Session, geocodes: Sequence[dict[str, Any]]) -> None:
+    """Upsert geocoding results, rows shaped like GeocodeCache; the caller commits."""
+    if not geocodes:
+        return
+    statement = insert(GeocodeCache).values(
+        sorted(geocodes, key=lambda geocode: geocode["address_key"])
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[GeocodeCache.address_key],
+        set_={
+            "latitude": statement.excluded.latitude,
+            "longitude": statement.excluded.longitude,
+            "formatted_address": statement.excluded.formatted_address,
+            "geocoded_at": statement.excluded.geocoded_at,
+        },
+    )
+    session.exec(statement)  # type: ignore
+
+
+def _distance_km(latitude: float, longitude: float) -> ColumnElement[float]:
+    """Haversine distance in SQL from the address coordinates to a point."""
+    phi = func.radians(UserAddress.latitude)
+    a = func.power(func.sin((phi - math.radians(latitude)) / 2), 2) + math.cos(
+        math.radians(latitude)
+    ) * func.cos(phi) * func.power(
+        func.sin((func.radians(UserAddress.longitude) - math.radians(longitude)) / 2),
+        2,
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(1.0, a)))
+
+
+def _box_filter(
+    latitude: float, longitude: float, radius_km: float, max_cells: int
+) -> list[ColumnElement[bool]]:
+    """Index friendly conditions matching the addresses near the circle."""
+    box = bounding_box(latitude, longitude, radius_km)
+    # Each geohash prefix is a range of ix_useraddress_geohash, the bytes
+    # after a prefix's last character bound it since the column sorts as "C"
+    cells = or_(
+        *(
+            and_(
+                col(UserAddress.geohash) >= prefix,
+                col(UserAddress.geohash) < prefix[:-1] + chr(ord(prefix[-1]) + 1),
+            )
+            for prefix in geohash_cover(box, max_cells)
+        )
+    )
+    longitude_range = (
+        col(UserAddress.longitude).between(box.min_longitude, box.max_longitude)
+        if box.min_longitude <= box.max_longitude
+        else or_(
+            col(UserAddress.longitude) >= box.min_longitude,
+            col(UserAddress.longitude) <= box.max_longitude,
+        )
+    )
+    return [
+        cells,
+        col(UserAddress.latitude).between(box.min_latitude, box.max_latitude),
+        longitude_range,
+    ]
+
+
+def get_users_nearby(
+    *,
+    session: Session,
+    latitude: float,
+    longitude: float,
+    radius_km: float,
+    limit: int,
+    max_cells: int = 32,
+) -> list[tuple[User, float]]:
+    """
+    Users with an address within `radius_km` of the point and the distance
+    to their closest one, closest first, at most `limit`.
+
+    Candidates come from the geohash cells and coordinates box around the
+    circle, the exact haversine distance only runs on those.
+    """
+    distance = _distance_km(latitude, longitude)
+    nearest = (
+        select(
+            col(UserAddress.user_id).label("user_id"),
+            func.min(distance).label("distance_km"),
+        )
+        .where(
+            *_box_filter(latitude, longitude, radius_km, max_cells),
+            distance <= radius_km,
+        )
+        .group_by(col(UserAddress.user_id))
+        .order_by(func.min(distance), col(UserAddress.user_id))
+        .limit(limit)
+        .subquery()
+    )
+    statement = (
+        select(User, nearest.c.distance_km)
+        .join(nearest, col(User.id) == nearest.c.user_id)
+        .order_by(nearest.c.distance_km, col(User.id))
+    )
+    return [(user, distance_km) for user, distance_km in session.exec(statement)]
+
+
+def get_nearest_users(
+    *,
+    session: Session,
+    latitude: float,
+    longitude: float,
+    k: int,
+    start_radius_km: float,
+    max_radius_km: float,
+    max_cells: int = 32,
+) -> list[tuple[User, float]]:
+    """
+    The `k` users closest to the point, no further than `max_radius_km`.
+
+    Searches within `start_radius_km` and doubles the radius until `k` users
+    are found: all of them are then closer than anyone outside the radius.
+    """
+    radius_km = min(start_radius_km, max_radius_km)
+    while True:
+        users = get_users_nearby(
+            session=session,
+            latitude=latitude,
+            longitude=longitude,
+            radius_km=radius_km,
+            limit=k,
+            max_cells=max_cells,
+        )
+        if len(users) >= k or radius_km >= max_radius_km:
+            return users
+        radius_km = min(radius_km * 2, max_radius_km)
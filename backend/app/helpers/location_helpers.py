@@ -1,36 +1,65 @@
-from app.models import UserBase
-from app.services.geoip_service import geocode_address, get_location_by_ip
+from collections.abc import Iterable, Iterator
 
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import inspect
+from sqlmodel import Session, col, select
 
-def get_user_location(ip_address: str, user: UserBase) -> dict | None:
+from app.core.db import engine
+from app.core.geo import EARTH_RADIUS_KM
+from app.models import User, UserAddress
+from app.services.geoip_service import get_location_by_ip
+
+try:
+    from sklearn.neighbors import BallTree
+except ImportError:  # pragma: no cover
+    BallTree = None
+
+# Arrays of coordinates have (latitude, longitude) in degrees on their last axis
+Coordinates = npt.NDArray[np.float64]
+
+# Working memory of the chunked distance computations, a few arrays of
+# this size are alive at once
+DISTANCE_CHUNK_BYTES = 32 * 1024 * 1024
+
+
+def _address_coordinates(user: User) -> tuple[float, float] | None:
+    if "addresses" in inspect(user).unloaded:
+        # One indexed query rather than a lazy load, which the users of
+        # async sessions can't do
+        statement = (
+            select(UserAddress.latitude, UserAddress.longitude)
+            .where(
+                UserAddress.user_id == user.id,
+                col(UserAddress.latitude).is_not(None),
+                col(UserAddress.longitude).is_not(None),
+            )
+            .limit(1)
+        )
+        with Session(engine) as session:
+            row = session.exec(statement).first()
+        return (row[0], row[1]) if row else None  # type: ignore[return-value]
+    for address in user.addresses:
+        if address.latitude is not None and address.longitude is not None:
+            return address.latitude, address.longitude
+    return None
+
+
+def get_user_location(ip_address: str | None, user: User | None = None) -> dict | None:
     """Get user location based on IP address and user-provided address."""
-    # First, check if the user has provided an address with valid latitude and longitude
-    if user.latitude and user.longitude:
+    # First, check if the user has an address with valid latitude and
+    # longitude. Addresses are geocoded in the background by the
+    # geocode_user_addresses task, never while serving a request
+    coordinates = _address_coordinates(user) if user is not None else None
+    if coordinates:
         return {
-            "latitude": user.latitude,
-            "longitude": user.longitude,
+            "latitude": coordinates[0],
+            "longitude": coordinates[1],
             "source": "user_address",
         }
 
-    # If latitude/longitude are not provided, try geocoding the address
-    if user.address_line_1 and user.city and user.country:
-        location_data = geocode_address({
-            "address_line_1": user.address_line_1,
-            "city": user.city,
-            "state": user.state,
-            "country": user.country,
-            "postal_code": user.postal_code,
-        })
-        if location_data:
-            return {
-                "latitude": location_data['latitude'],
-                "longitude": location_data['longitude'],
-                "formatted_address": location_data['formatted_address'],
-                "source": "geocoded_address",
-            }
-
     # Fallback to IP-based geolocation
-    location_data = get_location_by_ip(ip_address)
+    location_data = get_location_by_ip(ip_address) if ip_address else None
     if location_data:
         return {
             "latitude": location_data['latitude'],
@@ -41,3 +70,172 @@ def get_user_location(ip_address: str, user: UserBase) -> dict | None:
         }
 
     return None
+
+
+def coordinates_array(addresses: Iterable[UserAddress]) -> Coordinates:
+    """(n, 2) coordinates of `addresses`, NaN for those not geocoded yet."""
+    rows = [
+        (
+            np.nan if address.latitude is None else address.latitude,
+            np.nan if address.longitude is None else address.longitude,
+        )
+        for address in addresses
+    ]
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+def _radians(coordinates: npt.ArrayLike) -> Coordinates:
+    array = np.radians(np.asarray(coordinates, dtype=np.float64))
+    if array.shape[-1:] != (2,):
+        raise ValueError("coordinates need (latitude, longitude) on their last axis")
+    return array
+
+
+def _haversine_radians(
+    latitude1: Coordinates,
+    longitude1: Coordinates,
+    latitude2: Coordinates,
+    longitude2: Coordinates,
+    cos_latitude2: Coordinates | None = None,
+) -> npt.NDArray[np.float64]:
+    if cos_latitude2 is None:
+        cos_latitude2 = np.cos(latitude2)
+    a = (
+        np.sin((latitude2 - latitude1) / 2) ** 2
+        + np.cos(latitude1) * cos_latitude2 * np.sin((longitude2 - longitude1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def haversine(points: npt.ArrayLike, others: npt.ArrayLike) -> npt.NDArray[np.float64]:
+    """
+    Distances in km between `points` and `others`, broadcast against each
+    other like NumPy operands: one point against many, or pairwise.
+    """
+    points, others = _radians(points), _radians(others)
+    return _haversine_radians(
+        points[..., 0], points[..., 1], others[..., 0], others[..., 1]
+    )
+
+
+def _chunk_rows(columns: int, chunk_size: int | None) -> int:
+    if chunk_size is not None:
+        return max(1, chunk_size)
+    return max(1, DISTANCE_CHUNK_BYTES // (8 * max(1, columns)))
+
+
+def iter_distance_matrix(
+    points: npt.ArrayLike, others: npt.ArrayLike, *, chunk_size: int | None = None
+) -> Iterator[tuple[int, npt.NDArray[np.float64]]]:
+    """
+    Rows of the distance matrix in km between (n, 2) `points` and (m, 2)
+    `others`, `chunk_size` rows at a time with the index of their first row.
+
+    Without `chunk_size` the chunks are sized to DISTANCE_CHUNK_BYTES, so
+    memory stays bounded however many points there are.
+    """
+    points, others = _radians(points), _radians(others)
+    latitude2, longitude2 = others[:, 0], others[:, 1]
+    cos_latitude2 = np.cos(latitude2)
+    rows = _chunk_rows(len(others), chunk_size)
+    for start in range(0, len(points), rows):
+        chunk = points[start : start + rows]
+        yield start, _haversine_radians(
+            chunk[:, 0:1], chunk[:, 1:2], latitude2, longitude2, cos_latitude2
+        )
+
+
+def distance_matrix(
+    points: npt.ArrayLike,
+    others: npt.ArrayLike | None = None,
+    *,
+    chunk_size: int | None = None,
+    dtype: npt.DTypeLike = np.float64,
+) -> npt.NDArray[np.floating]:
+    """
+    (n, m) distances in km between `points` and `others`, `points` to
+    themselves by default.
+
+    Computed in chunks into a single `dtype` array, np.float32 halves its
+    size; iterate over iter_distance_matrix when it doesn't fit at all.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    others = points if others is None else np.asarray(others, dtype=np.float64)
+    matrix = np.empty((len(points), len(others)), dtype=dtype)
+    for start, block in iter_distance_matrix(points, others, chunk_size=chunk_size):
+        matrix[start : start + len(block)] = block
+    return matrix
+
+
+def _brute_force_neighbours(
+    points: Coordinates, candidates: Coordinates, k: int, chunk_size: int | None
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.intp]]:
+    distances = np.empty((len(points), k))
+    indexes = np.empty((len(points), k), dtype=np.intp)
+    for start, block in iter_distance_matrix(points, candidates, chunk_size=chunk_size):
+        if k < block.shape[1]:
+            nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+        else:
+            nearest = np.broadcast_to(np.arange(block.shape[1]), block.shape)
+        nearest_distances = np.take_along_axis(block, nearest, axis=1)
+        order = np.argsort(nearest_distances, axis=1, kind="stable")
+        stop = start + len(block)
+        distances[start:stop] = np.take_along_axis(nearest_distances, order, axis=1)
+        indexes[start:stop] = np.take_along_axis(nearest, order, axis=1)
+    return distances, indexes
+
+
+def _ball_tree_neighbours(
+    points: Coordinates, candidates: Coordinates, k: int, chunk_size: int | None
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.intp]]:
+    tree = BallTree(np.radians(candidates), metric="haversine")
+    distances = np.empty((len(points), k))
+    indexes = np.empty((len(points), k), dtype=np.intp)
+    # Each query returns k neighbours per point, chunks bound those
+    rows = _chunk_rows(k, chunk_size)
+    for start in range(0, len(points), rows):
+        stop = start + rows
+        angles, nearest = tree.query(np.radians(points[start:stop]), k=k)
+        distances[start:stop] = angles * EARTH_RADIUS_KM
+        indexes[start:stop] = nearest
+    return distances, indexes
+
+
+def nearest_neighbours(
+    points: npt.ArrayLike,
+    candidates: npt.ArrayLike,
+    k: int = 1,
+    *,
+    chunk_size: int | None = None,
+    use_ball_tree: bool | None = None,
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.intp]]:
+    """
+    The `k` candidates closest to each of `points`: (n, k) distances in km
+    and indexes into `candidates`, closest first.
+
+    Uses a scikit-learn BallTree over the coordinates in radians when it is
+    installed, unless `use_ball_tree` is False, and a chunked brute force
+    otherwise. Candidates without coordinates are never returned, points
+    without coordinates get inf distances and -1 indexes.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    candidates = np.asarray(candidates, dtype=np.float64).reshape(-1, 2)
+    if use_ball_tree is None:
+        use_ball_tree = BallTree is not None
+    elif use_ball_tree and BallTree is None:
+        raise RuntimeError("use_ball_tree requires the scikit-learn package")
+
+    located = np.flatnonzero(~np.isnan(candidates).any(axis=1))
+    if not 1 <= k <= len(located):
+        raise ValueError(f"k must be between 1 and {len(located)} located candidates")
+    querying = np.flatnonzero(~np.isnan(points).any(axis=1))
+
+    search = _ball_tree_neighbours if use_ball_tree else _brute_force_neighbours
+    found_distances, found_indexes = search(
+        points[querying], candidates[located], k, chunk_size
+    )
+    distances = np.full((len(points), k), np.inf)
+    indexes = np.full((len(points), k), -1, dtype=np.intp)
+    distances[querying] = found_distances
+    indexes[querying] = located[found_indexes]
+    return distances, indexes
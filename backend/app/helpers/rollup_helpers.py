@@ -0,0 +1,275 @@
+import logging
+import uuid
+from collections.abc import Callable
+from datetime import date, datetime, timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy import Date, cast, distinct, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import (
+    Payment,
+    PaymentDailyRollup,
+    PaymentStatus,
+    Record,
+    RecordDailyRollup,
+    RecordType,
+    RollupWatermark,
+)
+
+logger = logging.getLogger(__name__)
+
+# RollupWatermark names
+RECORD_WATERMARK = "record"
+PAYMENT_WATERMARK = "payment"
+
+# Watermark of a source nothing was folded from yet
+_ORIGIN = (datetime.min, uuid.UUID(int=0))
+
+Keyset = tuple[datetime, uuid.UUID]
+
+
+class RollupProgress(NamedTuple):
+    # Source rows folded into the rollups by this refresh
+    records: int
+    payments: int
+
+
+class DailySummary(NamedTuple):
+    records: dict[RecordType, int]
+    # Count and amount of the payments by status
+    payments: dict[PaymentStatus, tuple[int, float]]
+
+
+def _lock_watermark(session: Session, name: str) -> Keyset:
+    # Created on first use, then locked so concurrent refreshes of the same
+    # source queue up instead of folding the same rows twice
+    session.execute(
+        insert(RollupWatermark)
+        .values(name=name, position=_ORIGIN[0], last_id=_ORIGIN[1])
+        .on_conflict_do_nothing(index_elements=[RollupWatermark.name])
+    )
+    watermark = session.exec(
+        select(RollupWatermark)
+        .where(col(RollupWatermark.name) == name)
+        .with_for_update()
+    ).one()
+    return watermark.position, watermark.last_id
+
+
+def _next_chunk(
+    session: Session,
+    position: Any,
+    id: Any,
+    after: Keyset,
+    horizon: datetime,
+    batch_size: int,
+) -> tuple[Keyset, int] | None:
+    """Last key and size of the next `batch_size` rows after `after`."""
+    chunk = (
+        select(position.label("position"), id.label("id"))
+        .where(tuple_(position, id) > tuple_(*after), position < horizon)
+        .order_by(position, id)
+        .limit(batch_size)
+        .subquery()
+    )
+    row = session.execute(
+        select(chunk.c.position, chunk.c.id, func.count().over())
+        .order_by(chunk.c.position.desc(), chunk.c.id.desc())
+        .limit(1)
+    ).first()
+    if row is None:
+        return None
+    return (row[0], row[1]), row[2]
+
+
+def _fold_records(session: Session, after: Keyset, upto: Keyset) -> None:
+    # Records never change, their counts are added to the rollups
+    key = tuple_(col(Record.created_at), col(Record.id))
+    day = cast(Record.created_at, Date)
+    rows = session.execute(
+        select(day, Record.record_type, func.count())
+        .where(key > tuple_(*after), key <= tuple_(*upto))
+        .group_by(day, Record.record_type)
+    ).all()
+    values = [
+        {"day": day, "record_type": record_type, "count": count}
+        for day, record_type, count in sorted(rows)
+    ]
+    if not values:
+        return
+    statement = insert(RecordDailyRollup).values(values)
+    statement = statement.on_conflict_do_update(
+        index_elements=[RecordDailyRollup.day, RecordDailyRollup.record_type],
+        set_={"count": RecordDailyRollup.count + statement.excluded.count},
+    )
+    session.execute(statement)
+
+
+def _fold_payments(session: Session, after: Keyset, upto: Keyset) -> None:
+    # A payment changes status after it is created, the days of the changed
+    # payments are recomputed rather than adjusted
+    key = tuple_(col(Payment.updated_at), col(Payment.id))
+    day = cast(Payment.created_at, Date)
+    days = sorted(
+        session.execute(
+            select(distinct(day)).where(key > tuple_(*after), key <= tuple_(*upto))
+        ).scalars()
+    )
+    _recompute_payment_days(session, days)
+
+
+def _recompute_payment_days(session: Session, days: list[date]) -> None:
+    day = cast(Payment.created_at, Date)
+    if not days:
+        return
+    session.execute(
+        delete(PaymentDailyRollup).where(col(PaymentDailyRollup.day).in_(days))
+    )
+    totals = (
+        select(
+            day,
+            Payment.status,
+            func.count(),
+            func.sum(Payment.amount),
+        )
+        .where(
+            # Bounds the scan of ix_payment_created_at
+            col(Payment.created_at) >= days[0],
+            col(Payment.created_at) < days[-1] + timedelta(days=1),
+            day.in_(days),
+        )
+        .group_by(day, Payment.status)
+    )
+    session.execute(
+        insert(PaymentDailyRollup).from_select(
+            ["day", "status", "count", "amount"], totals
+        )
+    )
+
+
+def _rescan(session: Session, since: date) -> None:
+    """
+    Recounts the rollups of the days from `since` on from the source rows.
+
+    Rows get their timestamps before they are committed, one committed
+    after the watermark moved past it would never be folded otherwise.
+    Records are counted up to the watermark, the ones after it are folded
+    by the next refresh.
+    """
+    upto = _lock_watermark(session, RECORD_WATERMARK)
+    key = tuple_(col(Record.created_at), col(Record.id))
+    day = cast(Record.created_at, Date)
+    session.execute(
+        delete(RecordDailyRollup).where(col(RecordDailyRollup.day) >= since)
+    )
+    session.execute(
+        insert(RecordDailyRollup).from_select(
+            ["day", "record_type", "count"],
+            select(day, Record.record_type, func.count())
+            .where(col(Record.created_at) >= since, key <= tuple_(*upto))
+            .group_by(day, Record.record_type),
+        )
+    )
+    _lock_watermark(session, PAYMENT_WATERMARK)
+    day = cast(Payment.created_at, Date)
+    days = session.execute(
+        select(distinct(day)).where(col(Payment.created_at) >= since)
+    ).scalars()
+    session.execute(
+        delete(PaymentDailyRollup).where(col(PaymentDailyRollup.day) >= since)
+    )
+    _recompute_payment_days(session, sorted(days))
+    session.commit()
+
+
+def _refresh(
+    session: Session,
+    name: str,
+    position: Any,
+    id: Any,
+    fold: Callable[[Session, Keyset, Keyset], None],
+    *,
+    horizon: datetime,
+    batch_size: int,
+) -> int:
+    folded = 0
+    while True:
+        after = _lock_watermark(session, name)
+        chunk = _next_chunk(session, position, id, after, horizon, batch_size)
+        if chunk is None:
+            session.commit()
+            return folded
+        upto, rows = chunk
+        fold(session, after, upto)
+        session.execute(
+            RollupWatermark.__table__.update()  # type: ignore[attr-defined]
+            .where(col(RollupWatermark.name) == name)
+            .values(position=upto[0], last_id=upto[1])
+        )
+        session.commit()
+        folded += rows
+        if rows < batch_size:
+            return folded
+
+
+def refresh_rollups_db(
+    *, now: datetime | None = None, batch_size: int | None = None
+) -> RollupProgress:
+    """
+    Folds the rows written since the last refresh into the daily rollups.
+
+    Records are walked in (created_at, id) order and payments in
+    (updated_at, id) order from their watermark, `batch_size` rows per
+    transaction, up to ROLLUP_LAG_SECONDS before `now`. The cost of a
+    refresh follows the rows written since the previous one and those of the
+    last ROLLUP_RESCAN_DAYS, which are recounted, not the size of the
+    tables. Deleted rows stay counted outside of those days: the record
+    rollups outlive the record retention on purpose.
+    """
+    batch_size = batch_size or settings.ROLLUP_BATCH_SIZE
+    horizon = (now or datetime.utcnow()) - timedelta(
+        seconds=settings.ROLLUP_LAG_SECONDS
+    )
+    with Session(engine) as session:
+        records = _refresh(
+            session,
+            RECORD_WATERMARK,
+            col(Record.created_at),
+            col(Record.id),
+            _fold_records,
+            horizon=horizon,
+            batch_size=batch_size,
+        )
+        payments = _refresh(
+            session,
+            PAYMENT_WATERMARK,
+            col(Payment.updated_at),
+            col(Payment.id),
+            _fold_payments,
+            horizon=horizon,
+            batch_size=batch_size,
+        )
+        _rescan(session, horizon.date() - timedelta(days=settings.ROLLUP_RESCAN_DAYS))
+    logger.info(f"Folded {records} records and {payments} payments into rollups.")
+    return RollupProgress(records=records, payments=payments)
+
+
+def get_daily_summary_db(day: date) -> DailySummary:
+    """Totals of `day` as of the last rollup refresh."""
+    with Session(engine) as session:
+        records = session.exec(
+            select(RecordDailyRollup).where(col(RecordDailyRollup.day) == day)
+        ).all()
+        payments = session.exec(
+            select(PaymentDailyRollup).where(col(PaymentDailyRollup.day) == day)
+        ).all()
+        return DailySummary(
+            records={rollup.record_type: rollup.count for rollup in records},
+            payments={
+                rollup.status: (rollup.count, rollup.amount) for rollup in payments
+            },
+        )
@@ -1,9 +1,29 @@
+import csv
+import json
 import logging
+import tempfile
+import time
+import uuid
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, NamedTuple
 
 import requests
+from sqlalchemy import func, tuple_
+from sqlmodel import Session, col, delete, select
 
-from app.core.db import get_database_session
-from app.models import Record, User
+from app import crud
+from app.core.config import settings
+from app.core.db import engine, get_database_session
+from app.models import Record, User, UserAddress
+from app.services.cache import ALL_TAGS, invalidate_all, invalidate_tags
+from app.services.geoip_service import (
+    GeocodingError,
+    GeocodingRateLimited,
+    geocode_address,
+    normalize_address,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,41 +42,356 @@ def get_users_to_notify():
         return []  # Return an empty list in case of an error
 
 
-def cleanup_old_records_db(cutoff_date):
+class CleanupProgress(NamedTuple):
+    deleted: int
+    # (created_at, id) of the last record deleted, where the cleanup resumes
+    checkpoint: tuple[datetime, uuid.UUID] | None
+    done: bool
+
+
+def cleanup_old_records_db(
+    cutoff_date: datetime,
+    *,
+    resume_after: tuple[datetime, uuid.UUID] | None = None,
+    batch_size: int | None = None,
+    sleep_seconds: float | None = None,
+    max_seconds: float | None = None,
+    on_progress: Callable[[CleanupProgress], None] | None = None,
+) -> CleanupProgress:
     """
-    Deletes records older than the cutoff date from the database.
-    Returns the number of records deleted.
+    Deletes records older than the cutoff date from the database, in chunks.
+
+    Each chunk deletes up to `batch_size` records by primary key in its own
+    short transaction, walking the (created_at, id) index from
+    `resume_after`, and sleeps `sleep_seconds` before the next one. Rows
+    locked by someone else are skipped rather than waited for. Stops when
+    nothing older than the cutoff is left or after `max_seconds`, returning
+    the checkpoint to resume from. `on_progress` is called after each chunk.
     """
-    try:
-        with get_database_session() as session:
-            old_records = session.query(Record).filter(Record.created_at < cutoff_date).delete()
-            session.commit()  # Commit the transaction
-            logger.info(f"Deleted {old_records} records older than {cutoff_date}.")
-            return old_records
-    except Exception as e:
-        logger.error(f"Error cleaning up old records: {e}")
-        return 0  # Return 0 in case of an error
+    batch_size = batch_size or settings.RECORD_CLEANUP_BATCH_SIZE
+    if sleep_seconds is None:
+        sleep_seconds = settings.RECORD_CLEANUP_SLEEP_SECONDS
+    if max_seconds is None:
+        max_seconds = settings.RECORD_CLEANUP_MAX_SECONDS
+    deadline = time.monotonic() + max_seconds
+    progress = CleanupProgress(deleted=0, checkpoint=resume_after, done=False)
+    with Session(engine) as session:
+        while True:
+            chunk = select(Record.id).where(col(Record.created_at) < cutoff_date)
+            if progress.checkpoint is not None:
+                chunk = chunk.where(
+                    tuple_(col(Record.created_at), col(Record.id))
+                    > tuple_(*progress.checkpoint)
+                )
+            chunk = (
+                chunk.order_by(col(Record.created_at), col(Record.id))
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            statement = (
+                delete(Record)
+                .where(col(Record.id).in_(chunk.scalar_subquery()))
+                .returning(col(Record.created_at), col(Record.id))
+            )
+            rows = [(created_at, id) for created_at, id in session.execute(statement)]
+            session.commit()
+            progress = CleanupProgress(
+                deleted=progress.deleted + len(rows),
+                checkpoint=max(rows) if rows else progress.checkpoint,
+                done=len(rows) < batch_size,
+            )
+            if on_progress is not None:
+                on_progress(progress)
+            if progress.done or time.monotonic() >= deadline:
+                logger.info(
+                    f"Deleted {progress.deleted} records older than {cutoff_date}."
+                )
+                return progress
+            time.sleep(sleep_seconds)
+
+
+class ReportFile(NamedTuple):
+    path: Path
+    rows: int
+
+
+REPORT_COLUMNS = ("id", "record_type", "created_at", "data")
 
 
-def generate_report_db():
+def generate_report_db(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    *,
+    format: str | None = None,
+    directory: str | None = None,
+) -> ReportFile:
     """
-    Generates a daily report.
-    Returns the report content as a string.
+    Writes the records created in [start, end) to a CSV or JSON lines file.
+
+    Rows are streamed from a server-side cursor `REPORT_YIELD_PER` at a time
+    and written out as they arrive, so memory use does not grow with the
+    table. The file is created in `directory` (a temporary directory by
+    default) and left for the caller to delete.
     """
+    format = format or settings.REPORT_FORMAT
+    statement = select(
+        Record.id, Record.record_type, Record.created_at, Record.data
+    ).order_by(col(Record.created_at), col(Record.id))
+    if start is not None:
+        statement = statement.where(col(Record.created_at) >= start)
+    if end is not None:
+        statement = statement.where(col(Record.created_at) < end)
+    statement = statement.execution_options(yield_per=settings.REPORT_YIELD_PER)
+
+    rows = 0
+    file = tempfile.NamedTemporaryFile(
+        "w",
+        prefix="report-",
+        suffix=f".{format}",
+        dir=directory or settings.REPORT_DIR,
+        delete=False,
+        newline="",
+    )
     try:
-        with get_database_session() as session:
-            report_data = session.query(Record).all()  # Replace with your query for report data
+        with Session(engine) as session, file:
+            writer = csv.writer(file) if format == "csv" else None
+            if writer is not None:
+                writer.writerow(REPORT_COLUMNS)
+            for partition in session.execute(statement).partitions():
+                if writer is not None:
+                    writer.writerows(
+                        (id, record_type.value, created_at.isoformat(), data)
+                        for id, record_type, created_at, data in partition
+                    )
+                else:
+                    file.writelines(
+                        json.dumps(
+                            {
+                                "id": str(id),
+                                "record_type": record_type.value,
+                                "created_at": created_at.isoformat(),
+                                "data": data,
+                            }
+                        )
+                        + "\n"
+                        for id, record_type, created_at, data in partition
+                    )
+                rows += len(partition)
+    except BaseException:
+        # Nothing would remove a partial report
+        Path(file.name).unlink(missing_ok=True)
+        raise
+    logger.info(f"Report of {rows} records written to {file.name}.")
+    return ReportFile(path=Path(file.name), rows=rows)
 
-            # Example report content generation
-            report_content = "Daily Report\n\n"
-            for record in report_data:
-                report_content += f"{record.id}: {record.details}\n"  # Adjust as necessary
 
-            logger.info("Report generated successfully.")
-            return report_content
-    except Exception as e:
-        logger.error(f"Error generating report: {e}")
-        return "Error generating report"  # Return a default message in case of an error
+def prune_report_files(
+    *,
+    retention_days: int | None = None,
+    directory: str | None = None,
+    now: datetime | None = None,
+) -> list[Path]:
+    """
+    Deletes the report files of generate_report_db older than
+    `retention_days`, the ones too large to be attached. Returns their paths.
+    """
+    if retention_days is None:
+        retention_days = settings.REPORT_RETENTION_DAYS
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=retention_days)).timestamp()
+    report_dir = Path(directory or settings.REPORT_DIR or tempfile.gettempdir())
+    pruned = []
+    for path in report_dir.glob("report-*"):
+        if path.suffix in (".csv", ".jsonl") and path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            pruned.append(path)
+    if pruned:
+        logger.info(f"Deleted {len(pruned)} reports older than {retention_days} days.")
+    return pruned
+
+
+class GeocodingProgress(NamedTuple):
+    # Addresses given coordinates, API requests made and failed
+    updated: int
+    requested: int
+    failed: int
+    # Every address without coordinates was looked at
+    done: bool
+
+
+# pg_try_advisory_lock key held by the running geocode_user_addresses_db
+GEOCODING_LOCK_KEY = 0x67656F63
+
+
+def _rate_limiter(rate_per_second: float) -> Callable[[], None]:
+    """Returns a function sleeping until the next call is within the rate."""
+    next_call_at = 0.0
+
+    def wait() -> None:
+        nonlocal next_call_at
+        time.sleep(max(0.0, next_call_at - time.monotonic()))
+        next_call_at = time.monotonic() + 1 / rate_per_second
+
+    return wait
+
+
+def _geocode_batch(
+    addresses: list[dict[str, Any]],
+    coordinates: dict[str, tuple[float | None, float | None]],
+    *,
+    budget: int,
+    wait: Callable[[], None],
+    deadline: float,
+) -> tuple[list[dict[str, Any]], int, int, bool]:
+    """
+    Requests the addresses whose key is not in `coordinates`, adding the
+    results to it. Returns the geocodes to cache, the requests made and
+    failed, and whether the run has to stop.
+    """
+    geocodes: list[dict[str, Any]] = []
+    requested = failed = 0
+    for address in addresses:
+        key = address["key"]
+        if key in coordinates:
+            continue
+        if requested >= budget or time.monotonic() >= deadline:
+            return geocodes, requested, failed, True
+        wait()
+        requested += 1
+        try:
+            result = geocode_address(address)
+        except GeocodingRateLimited as e:
+            logger.warning(f"{e}, geocoding resumes on the next run.")
+            return geocodes, requested, failed + 1, True
+        except GeocodingError as e:
+            logger.warning(f"Could not geocode address {address['id']}: {e}")
+            failed += 1
+            # Not cached, but not requested again in this batch
+            coordinates[key] = (None, None)
+            continue
+        geocode = {
+            "address_key": key,
+            "latitude": result["latitude"] if result else None,
+            "longitude": result["longitude"] if result else None,
+            "formatted_address": result["formatted_address"] if result else None,
+            "geocoded_at": datetime.utcnow(),
+        }
+        geocodes.append(geocode)
+        coordinates[key] = (geocode["latitude"], geocode["longitude"])
+    return geocodes, requested, failed, False
+
+
+def geocode_user_addresses_db(
+    *,
+    batch_size: int | None = None,
+    rate_per_second: float | None = None,
+    max_requests: int | None = None,
+    max_run_seconds: float | None = None,
+) -> GeocodingProgress:
+    """
+    Fills in the coordinates of the user addresses that have none.
+
+    Addresses are walked by id, `batch_size` at a time. Each is looked up
+    by its normalized text in the geocode cache first; only addresses never
+    seen before reach the geocoding API, at most `rate_per_second` requests
+    per second and `max_requests` per run. Results, misses included, go to
+    the cache so an address is requested once whatever the number of users
+    sharing it. Failed requests are retried on the next run; the run stops
+    early when the API reports the key over its query limit or after
+    `max_run_seconds`.
+
+    No transaction stays open during the API requests: a batch is read,
+    requested, then written in a short transaction of its own. An advisory
+    lock keeps a single run going at a time, a run finding it taken does
+    nothing.
+    """
+    batch_size = batch_size or settings.GEOCODING_BATCH_SIZE
+    rate_per_second = rate_per_second or settings.GEOCODING_RATE_PER_SECOND
+    if max_requests is None:
+        max_requests = settings.GEOCODING_MAX_REQUESTS
+    if max_run_seconds is None:
+        max_run_seconds = settings.GEOCODING_MAX_RUN_SECONDS
+    if not settings.GOOGLE_MAPS_API_KEY:
+        logger.warning("Google Maps API key not configured, only cached addresses are located.")
+        max_requests = 0
+    deadline = time.monotonic() + max_run_seconds
+    wait = _rate_limiter(rate_per_second)
+
+    updated = requested = failed = 0
+    stopped = False
+    after: uuid.UUID | None = None
+    # Session-level lock, held outside of any transaction by its connection
+    with engine.connect() as lock_connection:
+        locked = lock_connection.scalar(
+            select(func.pg_try_advisory_lock(GEOCODING_LOCK_KEY))
+        )
+        lock_connection.commit()
+        if not locked:
+            logger.info("Geocoding already running, skipped.")
+            return GeocodingProgress(updated=0, requested=0, failed=0, done=False)
+        try:
+            while not stopped:
+                with Session(engine) as session:
+                    statement = select(UserAddress).where(
+                        col(UserAddress.latitude).is_(None)
+                    )
+                    if after is not None:
+                        statement = statement.where(col(UserAddress.id) > after)
+                    addresses = [
+                        {**address.model_dump(), "key": normalize_address(address.model_dump())}
+                        for address in session.exec(
+                            statement.order_by(col(UserAddress.id)).limit(batch_size)
+                        )
+                    ]
+                    if not addresses:
+                        break
+                    coordinates = {
+                        key: (geocode.latitude, geocode.longitude)
+                        for key, geocode in crud.get_geocodes(
+                            session=session,
+                            address_keys={address["key"] for address in addresses},
+                        ).items()
+                    }
+                after = addresses[-1]["id"]
+
+                geocodes, batch_requested, batch_failed, stopped = _geocode_batch(
+                    addresses,
+                    coordinates,
+                    budget=max_requests - requested,
+                    wait=wait,
+                    deadline=deadline,
+                )
+                requested += batch_requested
+                failed += batch_failed
+
+                located = {
+                    address["id"]: coordinates[address["key"]]
+                    for address in addresses
+                    if None not in coordinates.get(address["key"], (None, None))
+                }
+                with Session(engine) as session:
+                    crud.save_geocodes(session=session, geocodes=geocodes)
+                    if located:
+                        # Skips the addresses located or deleted meanwhile
+                        statement = select(UserAddress).where(
+                            col(UserAddress.id).in_(located),
+                            col(UserAddress.latitude).is_(None),
+                        )
+                        for address in session.exec(statement):
+                            address.latitude, address.longitude = located[address.id]
+                            session.add(address)
+                            updated += 1
+                    session.commit()
+        finally:
+            lock_connection.scalar(
+                select(func.pg_advisory_unlock(GEOCODING_LOCK_KEY))
+            )
+            lock_connection.commit()
+    logger.info(
+        f"Located {updated} user addresses with {requested} geocoding requests, {failed} failed."
+    )
+    return GeocodingProgress(
+        updated=updated, requested=requested, failed=failed, done=not stopped
+    )
 
 
 def check_system_health():
@@ -121,20 +456,17 @@ def create_backup():
     # Example: Call your database backup command or script
     pass  # Replace with your actual backup logic
 
-def clear_cache():
+def clear_cache(tags=None):
     """
-    Clear existing cached data.
-    Implement the logic to clear your cache here.
+    Purge cached data in Redis and in every API worker.
+    Only entries carrying one of `tags` are purged when given, everything otherwise.
+    Returns the tags purged, or "*" for everything.
     """
+    if tags:
+        logger.info(f"Purging cache tags {tags}...")
+        invalidate_tags(*tags)
+        return list(tags)
     logger.info("Clearing cache...")
-    # Implement your cache clearing logic here
-    pass  # Replace with your actual cache clearing logic
-
-def update_cache():
-    """
-    Update cache with fresh data.
-    Implement the logic to fetch and update cache here.
-    """
-    logger.info("Updating cache with fresh data...")
-    # Implement your cache updating logic here
-    pass  # Replace with your actual cache updating logic
+    deleted = invalidate_all()
+    logger.info(f"Deleted {deleted} cache keys.")
+    return [ALL_TAGS]
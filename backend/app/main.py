@@ -1,16 +1,32 @@
+import asyncio
+import contextlib
 import logging
 import sys
 
 import json_log_formatter  # For structured logging in JSON format
 import sentry_sdk
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordRequestForm
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.main import api_router
 from app.core.config import settings
-from app.core.security import authenticate_user, create_access_token, decode_token
+from app.core.db import async_engine
+from app.core.replicas import replica_router
+from app.core.security import (
+    PasswordHasherBusy,
+    authenticate_user,
+    create_access_token,
+    decode_token,
+    password_hasher,
+)
+from app.middleware.geoipMiddleware import GeoIPMiddleware
+from app.services.cache import listen_for_invalidations
+from app.services.geoip_service import shutdown_batch_lookups
+from app.services.message_queue import publisher
+from app.services.redis_pool import async_redis
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -35,15 +51,36 @@ if settings.all_cors_origins:
         allow_headers=["*"],
     )
 
+# request.state.location for the routes that read it
+app.add_middleware(GeoIPMiddleware)
+
 @app.on_event("startup")
 async def startup_event():
-    # Optionally, initialize resources
-    pass
+    # Shared async Redis pool, bound to the serving event loop
+    await async_redis.open()
+    # Purge cache tags invalidated by other workers
+    app.state.cache_invalidation = asyncio.create_task(listen_for_invalidations())
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    # Optionally, close resources
-    pass
+    app.state.cache_invalidation.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await app.state.cache_invalidation
+    # Pooled async connections are bound to the loop that is shutting down
+    await async_engine.dispose()
+    await replica_router.dispose()
+    await async_redis.close()
+    await publisher.close_async()
+    password_hasher.shutdown()
+    shutdown_batch_lookups()
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(_request: Request, _exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "Too many password operations in progress, retry shortly"},
+        headers={"Retry-After": "1"},
+    )
 
 # Optional: If you need to expose Celery info
 # @app.get("/celery-status/")
@@ -1,28 +1,101 @@
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+import fnmatch
+import re
+from collections.abc import Sequence
+from typing import Any
 
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
 from app.helpers.location_helpers import get_user_location
-from app.middleware.authentication import get_current_user
-from app.models import User
 
+LOCATION_KEY = "location"
+
+
+def _compile(patterns: Sequence[str]) -> re.Pattern[str] | None:
+    patterns = [pattern for pattern in patterns if pattern]
+    if not patterns:
+        return None
+    return re.compile("|".join(fnmatch.translate(pattern) for pattern in patterns))
+
+
+class LocationState(dict[str, Any]):
+    """
+    Request state whose `location` is only looked up when first read.
+
+    The location is the one of the user's geocoded address when the route
+    authenticated a user (request.state.user), of the client IP otherwise,
+    or None. It is looked up once per request.
+
+    The lookup queries the database and the GeoIP database synchronously:
+    reading request.state.location is for sync routes, which FastAPI runs in
+    a threadpool. Async routes await get_location() instead, reading it
+    there would block the event loop.
+    """
+
+    def __init__(self, state: dict[str, Any], client_ip: str | None) -> None:
+        super().__init__(state)
+        self.client_ip = client_ip
+
+    def __missing__(self, key: str) -> Any:
+        if key != LOCATION_KEY:
+            raise KeyError(key)
+        location = get_user_location(self.client_ip, self.get("user"))
+        self[key] = location
+        return location
+
+    async def location_async(self) -> dict | None:
+        if LOCATION_KEY not in self:
+            self[LOCATION_KEY] = await run_in_threadpool(
+                get_user_location, self.client_ip, self.get("user")
+            )
+        return self[LOCATION_KEY]
+
+
+async def get_location(connection: HTTPConnection) -> dict | None:
+    """
+    request.state.location for async routes, looked up in the threadpool.
+    None outside the paths GeoIPMiddleware applies to.
+    """
+    state = connection.scope.get("state")
+    if not isinstance(state, LocationState):
+        return None
+    return await state.location_async()
 
-class GeoIPMiddleware(BaseHTTPMiddleware):
-    """Middleware for detecting and logging user location based on IP or user address."""
 
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host
+class GeoIPMiddleware:
+    """
+    Makes request.state.location available to the routes under `include`
+    and not under `exclude`, fnmatch patterns of the request path.
 
-        # Assuming you have some method to get the currently authenticated user
-        user: User | None = await get_current_user(request)
+    Nothing is looked up until a route reads it, the middleware itself
+    only swaps the request state for a LocationState.
+    """
 
-        if user:
-            location_data = get_user_location(client_ip, user)
+    def __init__(
+        self,
+        app: ASGIApp,
+        include: Sequence[str] | None = None,
+        exclude: Sequence[str] | None = None,
+    ) -> None:
+        self.app = app
+        self.include = _compile(
+            settings.GEOIP_INCLUDE_PATHS if include is None else include
+        )
+        self.exclude = _compile(
+            settings.GEOIP_EXCLUDE_PATHS if exclude is None else exclude
+        )
 
-            if location_data:
-                print(f"User {client_ip} is located in {location_data.get('city', 'unknown')} (source: {location_data['source']})")
-                # Attach location data to the request
-                request.state.location = location_data
+    def applies_to(self, path: str) -> bool:
+        if self.include is None or not self.include.match(path):
+            return False
+        return self.exclude is None or not self.exclude.match(path)
 
-        # Continue processing the request
-        response = await call_next(request)
-        return response
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] in ("http", "websocket") and self.applies_to(scope["path"]):
+            client = scope.get("client")
+            scope["state"] = LocationState(
+                scope.get("state") or {}, client[0] if client else None
+            )
+        await self.app(scope, receive, send)
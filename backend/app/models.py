@@ -1,10 +1,14 @@
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 from enum import Enum
+from typing import Any
 
 from pydantic import EmailStr
+from sqlalchemy import Index, String, event, text
 from sqlmodel import Field, Relationship, SQLModel
 
+from app.core.geo import GEOHASH_PRECISION, geohash_encode
+
 
 # Shared properties
 class UserBase(SQLModel):
@@ -37,6 +41,9 @@ class UpdatePassword(SQLModel):
 
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
+    # Keyset pagination of GET /users/
+    __table_args__ = (Index("ix_user_email_id", "email", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
@@ -51,10 +58,29 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+# A user found by the nearby search, with the distance to their closest address
+class UserNearby(UserPublic):
+    distance_km: float
+
+class UsersNearby(SQLModel):
+    data: list[UserNearby]
 
 # New UserAddress Model
 class UserAddress(SQLModel, table=True):
+    # Addresses the geocoding task has not located yet
+    __table_args__ = (
+        Index(
+            "ix_useraddress_ungeocoded",
+            "id",
+            postgresql_where=text("latitude IS NULL"),
+        ),
+        # Prefix searches of the nearby user search
+        Index("ix_useraddress_geohash", "geohash"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="user.id", nullable=False, index=True)
     address_line_1: str = Field(max_length=255)
@@ -65,10 +91,33 @@ class UserAddress(SQLModel, table=True):
     postal_code: str = Field(max_length=20)
     latitude: float | None = Field(default=None)
     longitude: float | None = Field(default=None)
+    # Geohash of the coordinates, kept up to date on insert and update;
+    # "C" collation so LIKE 'prefix%' can use its index
+    geohash: str | None = Field(
+        default=None, sa_type=String(GEOHASH_PRECISION, collation="C")
+    )
 
     # Relationship back to User
     user: User = Relationship(back_populates="addresses")
 
+@event.listens_for(UserAddress, "before_insert")
+@event.listens_for(UserAddress, "before_update")
+def _set_geohash(_mapper: Any, _connection: Any, address: UserAddress) -> None:
+    # Only ORM flushes pass here, bulk writes have to set the geohash themselves
+    if address.latitude is None or address.longitude is None:
+        address.geohash = None
+    else:
+        address.geohash = geohash_encode(address.latitude, address.longitude)
+
+# Geocoding API results by normalized address, no coordinates when the
+# address had no match
+class GeocodeCache(SQLModel, table=True):
+    address_key: str = Field(primary_key=True, max_length=1536)
+    latitude: float | None = None
+    longitude: float | None = None
+    formatted_address: str | None = Field(default=None, max_length=512)
+    geocoded_at: datetime = Field(default_factory=datetime.utcnow)
+
 # Shared properties
 class ItemBase(SQLModel):
     title: str = Field(min_length=1, max_length=255)
@@ -84,6 +133,12 @@ class ItemUpdate(ItemBase):
 
 # Database model, database table inferred from class name
 class Item(ItemBase, table=True):
+    # Keyset pagination of GET /items/, for superusers and per owner
+    __table_args__ = (
+        Index("ix_item_title_id", "title", "id"),
+        Index("ix_item_owner_id_title_id", "owner_id", "title", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     title: str = Field(max_length=255)
     owner_id: uuid.UUID = Field(
@@ -98,7 +153,13 @@ class ItemPublic(ItemBase):
 
 class ItemsPublic(SQLModel):
     data: list[ItemPublic]
-    count: int
+    count: int | None
+    next_cursor: str | None = None
+
+# Row counts maintained alongside writes, keyed like "item:owner:<id>"
+class RowCount(SQLModel, table=True):
+    key: str = Field(primary_key=True, max_length=255)
+    count: int = Field(default=0)
 
 # Generic message
 class Message(SQLModel):
@@ -116,6 +177,60 @@ class TokenPayload(SQLModel):
 class NewPassword(SQLModel):
     token: str
     new_password: str = Field(min_length=8, max_length=40)
+
+# Cumulative latency histogram, bucket upper bounds in seconds
+class LatencyHistogram(SQLModel):
+    count: int
+    sum: float
+    buckets: dict[str, int]
+
+# Connection pool state of one engine in the serving process
+class DBPoolStats(SQLModel):
+    name: str
+    pool_size: int
+    max_overflow: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    timeouts: int
+    wait_time: LatencyHistogram
+
+# Load of the bcrypt process pool in the serving process
+class PasswordHasherStats(SQLModel):
+    workers: int
+    capacity: int
+    in_flight: int
+    queue_depth: int
+    rejected: int
+    latency: LatencyHistogram
+
+class CacheStats(SQLModel):
+    namespace: str
+    version: int
+    l1_hits: int
+    l2_hits: int
+    misses: int
+    errors: int
+    coalesced: int
+    early_refreshes: int
+    hit_rate: float
+    l2_latency: LatencyHistogram
+
+# Lookups of the GeoIP reader in the serving process
+class GeoIPStats(SQLModel):
+    path: str
+    cache_by_network: bool
+    cache_size: int
+    hits: int
+    misses: int
+    reloads: int
+    hit_rate: float
+    latency: LatencyHistogram
+
+class ServicePublic(SQLModel):
+    service_id: str
+    data: str
+
 # Payment status Enum
 class PaymentStatus(str, Enum):
     PENDING = "pending"
@@ -124,15 +239,26 @@ class PaymentStatus(str, Enum):
 
 # Payment
 class Payment(SQLModel, table=True):
+    __table_args__ = (
+        # Rollups walk the changed payments and recompute their days
+        Index("ix_payment_updated_at_id", "updated_at", "id"),
+        Index("ix_payment_created_at", "created_at"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
     amount: float = Field(gt=0)  # Greater than 0
     status: PaymentStatus = Field(default=PaymentStatus.PENDING)
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(
+        default_factory=datetime.utcnow,
+        sa_column_kwargs={"onupdate": datetime.utcnow},
+    )
     completed_at: datetime | None = None
     user: User | None = Relationship(back_populates="payments")
 
-# Log notifications sent to users, triggered by Celery
+# Log notifications sent to users, triggered by Celery. Optionally stored
+# partitioned by month on sent_at, see app.core.partitions
 class Notification(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="user.id", nullable=False)
@@ -140,18 +266,51 @@ class Notification(SQLModel, table=True):
     sent_at: datetime = Field(default_factory=datetime.utcnow)
     user: User | None = Relationship(back_populates="notifications")
 
+# One message for many users, given by id or by the filters
+class NotificationBroadcast(SQLModel):
+    message: str = Field(max_length=255)
+    user_ids: list[uuid.UUID] | None = None
+    is_active: bool | None = None
+    is_superuser: bool | None = None
+
+class NotificationBroadcastQueued(SQLModel):
+    task_id: str
+
 # Define an Enum for record types or report categories if needed
 class RecordType(str, Enum):
     TYPE_A = "Type A"
     TYPE_B = "Type B"
 
-# Define the Record model
+# Define the Record model, optionally stored partitioned by month on
+# created_at, see app.core.partitions
 class Record(SQLModel, table=True):
+    # Age based cleanup, walked in (created_at, id) order
+    __table_args__ = (Index("ix_record_created_at_id", "created_at", "id"),)
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     record_type: RecordType
     created_at: datetime = Field(default_factory=datetime.utcnow)
     data: str | None = Field(default=None, max_length=255)
 
+# Records created per day and type, see app.helpers.rollup_helpers
+class RecordDailyRollup(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+    record_type: RecordType = Field(primary_key=True)
+    count: int = Field(default=0)
+
+# Payments created per day by their current status
+class PaymentDailyRollup(SQLModel, table=True):
+    day: date = Field(primary_key=True)
+    status: PaymentStatus = Field(primary_key=True)
+    count: int = Field(default=0)
+    amount: float = Field(default=0)
+
+# (timestamp, id) of the last source row folded into the rollups
+class RollupWatermark(SQLModel, table=True):
+    name: str = Field(primary_key=True, max_length=255)
+    position: datetime
+    last_id: uuid.UUID
+
 # Social Media account connections
 class SocialConnection(SQLModel, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
@@ -0,0 +1,75 @@
+"""
+Store the record and notification tables range-partitioned by month, or
+back as plain tables.
+
+The tables are locked and their rows copied: run it in a maintenance
+window, after `alembic upgrade head`:
+
+    python app/partition_tables.py partition
+    python app/partition_tables.py unpartition
+"""
+
+import argparse
+import logging
+
+import sqlalchemy as sa
+
+from app.core.config import settings
+from app.core.db import engine
+from app.core.partitions import (
+    PARTITIONED_TABLES,
+    is_partitioned,
+    partition_table,
+    unpartition_table,
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def partition(connection: sa.Connection, tables: list[str]) -> list[str]:
+    changed = []
+    for table in tables:
+        if not sa.inspect(connection).has_table(table) or is_partitioned(
+            connection, table
+        ):
+            continue
+        partition_table(
+            connection,
+            table,
+            PARTITIONED_TABLES[table],
+            months_ahead=settings.PARTITION_PREMAKE_MONTHS,
+        )
+        changed.append(table)
+    return changed
+
+
+def unpartition(connection: sa.Connection, tables: list[str]) -> list[str]:
+    changed = []
+    for table in tables:
+        if is_partitioned(connection, table):
+            unpartition_table(connection, table)
+            changed.append(table)
+    return changed
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("action", choices=["partition", "unpartition"])
+    parser.add_argument(
+        "--table",
+        action="append",
+        choices=sorted(PARTITIONED_TABLES),
+        help="table to rebuild, all of them by default",
+    )
+    args = parser.parse_args(argv)
+    tables = args.table or list(PARTITIONED_TABLES)
+    action = partition if args.action == "partition" else unpartition
+    # One transaction: either every table is rebuilt or none is
+    with engine.begin() as connection:
+        changed = action(connection, tables)
+    logger.info(f"{args.action.capitalize()}ed {changed or 'no tables'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,1072 @@
+import asyncio
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from collections.abc import (
+    Awaitable,
+    Callable,
+    Collection,
+    Hashable,
+    Iterable,
+    Mapping,
+)
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, TypeVar, get_type_hints
+
 import redis
+from pydantic import TypeAdapter
+from pydantic_core import to_jsonable_python
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
 from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.services.redis_pool import async_redis, create_client
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+T = TypeVar("T")
+
+redis_client = create_client(decode_responses=True)
+
+# Cache payloads are bytes, msgpack output is not valid UTF-8
+cache_redis_client = create_client()
+
+
+class LRUCache:
+    """
+    Bounded, thread-safe in-process LRU whose entries expire after a TTL.
+
+    Entries use the cache wide `ttl` unless `set` is given its own; None
+    means they only leave the cache when evicted.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class Serializer(ABC):
+    """Turns JSON-compatible values (after pydantic's conversion) into bytes."""
+
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes: ...
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Any: ...
+
+
+class JSONSerializer(Serializer):
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(to_jsonable_python(value), separators=(",", ":")).encode()
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    def __init__(self) -> None:
+        if msgpack is None:
+            raise RuntimeError("CACHE_SERIALIZER=msgpack requires the msgpack package")
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(to_jsonable_python(value))
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data)
+
+
+SERIALIZERS: dict[str, type[Serializer]] = {
+    "json": JSONSerializer,
+    "msgpack": MsgpackSerializer,
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _type_adapter(type_: Any) -> TypeAdapter[Any]:
+    return TypeAdapter(type_)
+
+
+class CacheMetrics:
+    def __init__(self) -> None:
+        self.l1_hits = Counter()
+        self.l2_hits = Counter()
+        self.misses = Counter()
+        self.errors = Counter()
+        # Misses served by another request's load instead of their own
+        self.coalesced = Counter()
+        self.early_refreshes = Counter()
+        self.l2_latency = Histogram()
+
+    def snapshot(self) -> dict[str, Any]:
+        hits = self.l1_hits.value + self.l2_hits.value
+        lookups = hits + self.misses.value
+        return {
+            "l1_hits": self.l1_hits.value,
+            "l2_hits": self.l2_hits.value,
+            "misses": self.misses.value,
+            "errors": self.errors.value,
+            "coalesced": self.coalesced.value,
+            "early_refreshes": self.early_refreshes.value,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "l2_latency": self.l2_latency.snapshot(),
+        }
+
+
+class SingleFlight:
+    """Runs one call per key at a time, concurrent callers share its result."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, Future[Any]] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    def do(self, key: str, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Result of `fn` and whether this caller ran it."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if future is None:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result(), False
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, True
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines, calls are shared within an event loop."""
+
+    def __init__(self) -> None:
+        self._tasks: dict[tuple[asyncio.AbstractEventLoop, str], asyncio.Task[Any]] = {}
+
+    def in_flight(self, key: str) -> bool:
+        return (asyncio.get_running_loop(), key) in self._tasks
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get((loop, key))
+        leader = task is None
+        if task is None:
+            task = self._tasks[(loop, key)] = loop.create_task(fn())  # type: ignore[arg-type]
+            task.add_done_callback(lambda _: self._tasks.pop((loop, key), None))
+        # A cancelled caller must not cancel the load the others wait for
+        return await asyncio.shield(task), leader
+
+
+# Compare-and-delete, a lock is only released by the load that took it
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Tags index their entries in a sorted set of full keys scored by expiry
+# (ms), which expires with its last entry
+ADD_TAG_SCRIPT = """
+redis.call("zadd", KEYS[1], ARGV[2], ARGV[1])
+redis.call("zremrangebyscore", KEYS[1], "-inf", ARGV[3])
+local last = redis.call("zrange", KEYS[1], -1, -1, "withscores")
+if last[2] then
+    redis.call("pexpireat", KEYS[1], last[2])
+end
+"""
+
+# Deletes every entry of a tag and the tag itself
+PURGE_TAG_SCRIPT = """
+local keys = redis.call("zrange", KEYS[1], 0, -1)
+for i = 1, #keys, 500 do
+    redis.call("del", unpack(keys, i, math.min(i + 499, #keys)))
+end
+redis.call("del", KEYS[1])
+return #keys
+"""
+
+# Invalidating this tag purges every cache
+ALL_TAGS = "*"
+
+# Monotonic time until which Redis is skipped after an error, shared by all
+# caches since they talk to the same server
+_redis_down_until = 0.0
+
+
+def _redis_available() -> bool:
+    return settings.CACHE_REDIS_ENABLED and time.monotonic() >= _redis_down_until
+
+
+def _mark_redis_down(source: str, e: Exception) -> None:
+    global _redis_down_until
+    _redis_down_until = time.monotonic() + settings.CACHE_REDIS_RETRY_SECONDS
+    logger.error(
+        f"{source}: Redis unavailable, serving from process memory for "
+        f"{settings.CACHE_REDIS_RETRY_SECONDS}s: {e}"
+    )
+
+
+def tag_key(tag: str) -> str:
+    return f"{settings.CACHE_KEY_PREFIX}:tag:{tag}"
+
+
+# Runs early refreshes of sync loaders off the request path
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="cache-refresh"
+)
+
+# namespace -> Cache, for get_cache_stats
+caches: dict[str, "Cache"] = {}
+
+
+class Cache:
+    """
+    Namespaced two-tier cache: an in-process LRU (L1) in front of Redis (L2).
+
+    Keys are stored as "<CACHE_KEY_PREFIX>:<namespace>:v<version>:<key>", so
+    bumping `version` when the cached shape changes orphans every old entry.
+    Values are serialized with CACHE_SERIALIZER; pass `type_` to `get` to
+    validate them back into models. L1 entries live for CACHE_L1_TTL_SECONDS
+    at most as other workers cannot purge them. When Redis fails the cache
+    keeps working from L1 alone for CACHE_REDIS_RETRY_SECONDS.
+
+    `get_or_set` guards loaders against stampedes: concurrent misses in a
+    process share one load, with `lock` a Redis lock extends that to every
+    worker, and entries are refreshed in the background shortly before they
+    expire (XFetch, the larger `beta` the earlier) so hot keys never all
+    miss at once.
+
+    Entries may carry tags, `invalidate_tags` purges all entries of a tag
+    in every namespace and worker; the model hooks of
+    app.core.cache_invalidation do so on commit.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        *,
+        version: int = 1,
+        ttl: float | None = None,
+        l1_ttl: float | None = None,
+        serializer: Serializer | None = None,
+        lock: bool | None = None,
+        beta: float | None = None,
+    ) -> None:
+        self.namespace = namespace
+        self.version = version
+        self.ttl = settings.CACHE_DEFAULT_TTL_SECONDS if ttl is None else ttl
+        self.l1_ttl = settings.CACHE_L1_TTL_SECONDS if l1_ttl is None else l1_ttl
+        self.l1 = LRUCache(maxsize=settings.CACHE_L1_MAXSIZE)
+        self.serializer = serializer or SERIALIZERS[settings.CACHE_SERIALIZER]()
+        self.lock = settings.CACHE_LOCK_ENABLED if lock is None else lock
+        self.beta = settings.CACHE_EARLY_REFRESH_BETA if beta is None else beta
+        self.metrics = CacheMetrics()
+        self._flight = SingleFlight()
+        self._async_flight = AsyncSingleFlight()
+        self._background: set[asyncio.Task[Any]] = set()
+        # tag -> full keys in L1 carrying it
+        self._l1_tags = LRUCache(maxsize=settings.CACHE_L1_MAXSIZE, ttl=self.l1_ttl)
+        self._tags_lock = threading.Lock()
+        caches[namespace] = self
+
+    def make_key(self, key: str) -> str:
+        return f"{settings.CACHE_KEY_PREFIX}:{self.namespace}:v{self.version}:{key}"
+
+    def get(self, key: str, default: Any = None, *, type_: Any = None) -> Any:
+        data = self._get_entry(self.make_key(key))
+        if data is None:
+            self.metrics.misses.inc()
+            return default
+        return self._validate(self._decode(data)[0], type_)
+
+    async def get_async(
+        self, key: str, default: Any = None, *, type_: Any = None
+    ) -> Any:
+        data = await self._get_entry_async(self.make_key(key))
+        if data is None:
+            self.metrics.misses.inc()
+            return default
+        return self._validate(self._decode(data)[0], type_)
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        *,
+        ttl: float | None = None,
+        tags: Collection[str] = (),
+        delta: float = 0.0,
+    ) -> None:
+        """
+        Store `value`, purged early by `invalidate_tags` of any of `tags`.
+
+        `delta` is how long the value took to compute, for XFetch.
+        """
+        full_key, data, ttl = self._store_l1(key, value, ttl, delta, tags)
+        if _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    if tags:
+                        pipe = cache_redis_client.pipeline(transaction=False)
+                        self._queue_set(pipe, full_key, data, ttl, tags)
+                        pipe.execute()
+                    else:
+                        cache_redis_client.set(full_key, data, px=int(ttl * 1000))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    async def set_async(
+        self,
+        key: str,
+        value: Any,
+        *,
+        ttl: float | None = None,
+        tags: Collection[str] = (),
+        delta: float = 0.0,
+    ) -> None:
+        full_key, data, ttl = self._store_l1(key, value, ttl, delta, tags)
+        if _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    if tags:
+                        async with async_redis.client.pipeline(
+                            transaction=False
+                        ) as pipe:
+                            self._queue_set(pipe, full_key, data, ttl, tags)
+                            await pipe.execute()
+                    else:
+                        await async_redis.client.set(full_key, data, px=int(ttl * 1000))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def delete(self, key: str) -> None:
+        full_key = self.make_key(key)
+        self.l1.delete(full_key)
+        if _redis_available():
+            try:
+                cache_redis_client.delete(full_key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    async def delete_async(self, key: str) -> None:
+        full_key = self.make_key(key)
+        self.l1.delete(full_key)
+        if _redis_available():
+            try:
+                await async_redis.client.delete(full_key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def get_many(self, keys: Iterable[str], *, type_: Any = None) -> dict[str, Any]:
+        """Cached values of `keys`, leaving out misses; one MGET for L2."""
+        full_keys, found = self._get_many_l1(keys)
+        missing = [key for key in full_keys if key not in found]
+        if missing and _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    values = cache_redis_client.mget(
+                        [full_keys[key] for key in missing]
+                    )
+            except redis.RedisError as e:
+                self._redis_failed(e)
+            else:
+                self._merge_l2(full_keys, found, missing, values)
+        return self._many_result(full_keys, found, type_)
+
+    async def get_many_async(
+        self, keys: Iterable[str], *, type_: Any = None
+    ) -> dict[str, Any]:
+        full_keys, found = self._get_many_l1(keys)
+        missing = [key for key in full_keys if key not in found]
+        if missing and _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    values = await async_redis.client.mget(
+                        [full_keys[key] for key in missing]
+                    )
+            except redis.RedisError as e:
+                self._redis_failed(e)
+            else:
+                self._merge_l2(full_keys, found, missing, values)
+        return self._many_result(full_keys, found, type_)
+
+    def set_many(self, items: Mapping[str, Any], *, ttl: float | None = None) -> None:
+        """Store every item of `items`, in one pipelined round-trip to Redis."""
+        entries = [
+            self._store_l1(key, value, ttl, 0.0, ()) for key, value in items.items()
+        ]
+        if entries and _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    pipe = cache_redis_client.pipeline(transaction=False)
+                    for full_key, data, entry_ttl in entries:
+                        pipe.set(full_key, data, px=int(entry_ttl * 1000))
+                    pipe.execute()
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    async def set_many_async(
+        self, items: Mapping[str, Any], *, ttl: float | None = None
+    ) -> None:
+        entries = [
+            self._store_l1(key, value, ttl, 0.0, ()) for key, value in items.items()
+        ]
+        if entries and _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    async with async_redis.client.pipeline(transaction=False) as pipe:
+                        for full_key, data, entry_ttl in entries:
+                            pipe.set(full_key, data, px=int(entry_ttl * 1000))
+                        await pipe.execute()
+            except redis.RedisError as e:
+                self._redis_failed(e)
+
+    def get_or_set(
+        self,
+        key: str,
+        loader: Callable[[], T],
+        *,
+        ttl: float | None = None,
+        tags: Collection[str] = (),
+        type_: Any = None,
+        early_refresh: bool = True,
+        refresh_loader: Callable[[], T] | None = None,
+    ) -> T:
+        """
+        Cached value of `key`, calling `loader` to fill it on a miss.
+
+        Early refreshes call `refresh_loader`, `loader` by default, on a
+        background thread once this call has returned, so it must not use
+        resources of the caller; `early_refresh=False` turns them off.
+        """
+        full_key = self.make_key(key)
+        data = self._get_entry(full_key)
+        if data is not None:
+            value, delta, expires_at = self._decode(data)
+            if (
+                early_refresh
+                and self._refresh_due(delta, expires_at)
+                and not self._flight.in_flight(full_key)
+            ):
+                self.metrics.early_refreshes.inc()
+                _refresh_executor.submit(
+                    self._refresh, key, refresh_loader or loader, ttl, tags, type_
+                ).add_done_callback(self._log_refresh_error)
+            return self._validate(value, type_)
+        self.metrics.misses.inc()
+        value, leader = self._flight.do(
+            full_key, lambda: self._load(key, loader, ttl, tags, type_)
+        )
+        if not leader:
+            self.metrics.coalesced.inc()
+        return value
+
+    async def get_or_set_async(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[T]],
+        *,
+        ttl: float | None = None,
+        tags: Collection[str] = (),
+        type_: Any = None,
+        early_refresh: bool = True,
+        refresh_loader: Callable[[], Awaitable[T]] | None = None,
+    ) -> T:
+        """get_or_set for async loaders, early refreshes run as tasks."""
+        full_key = self.make_key(key)
+        data = await self._get_entry_async(full_key)
+        if data is not None:
+            value, delta, expires_at = self._decode(data)
+            if (
+                early_refresh
+                and self._refresh_due(delta, expires_at)
+                and not self._async_flight.in_flight(full_key)
+            ):
+                self.metrics.early_refreshes.inc()
+                task = asyncio.create_task(
+                    self._refresh_async(key, refresh_loader or loader, ttl, tags, type_)
+                )
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+                task.add_done_callback(self._log_refresh_error)
+            return self._validate(value, type_)
+        self.metrics.misses.inc()
+        value, leader = await self._async_flight.do(
+            full_key, lambda: self._load_async(key, loader, ttl, tags, type_)
+        )
+        if not leader:
+            self.metrics.coalesced.inc()
+        return value
+
+    def _refresh(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: float | None,
+        tags: Collection[str],
+        type_: Any,
+    ) -> None:
+        self._flight.do(
+            self.make_key(key),
+            lambda: self._load(key, loader, ttl, tags, type_, wait=False),
+        )
+
+    async def _refresh_async(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float | None,
+        tags: Collection[str],
+        type_: Any,
+    ) -> None:
+        await self._async_flight.do(
+            self.make_key(key),
+            lambda: self._load_async(key, loader, ttl, tags, type_, wait=False),
+        )
+
+    def _load(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: float | None,
+        tags: Collection[str],
+        type_: Any,
+        *,
+        wait: bool = True,
+    ) -> Any:
+        """
+        Call `loader` and store its result, once across workers with `lock`.
+
+        When another worker holds the lock, the load waits for it to fill
+        the key, or gives up right away when `wait` is false.
+        """
+        full_key = self.make_key(key)
+        if not (self.lock and _redis_available()):
+            return self._compute(key, loader, ttl, tags)
+        lock_key, token = f"lock:{full_key}", uuid.uuid4().hex
+        lock_ms = int(settings.CACHE_LOCK_TIMEOUT_SECONDS * 1000)
+        try:
+            acquired = cache_redis_client.set(lock_key, token, nx=True, px=lock_ms)
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return self._compute(key, loader, ttl, tags)
+        if acquired:
+            try:
+                return self._compute(key, loader, ttl, tags)
+            finally:
+                try:
+                    cache_redis_client.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except redis.RedisError as e:
+                    self._redis_failed(e)
+        if not wait:
+            return None
+        self.metrics.coalesced.inc()
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT_SECONDS
+        delay = 0.01
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            try:
+                data = cache_redis_client.get(full_key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                break
+            if data is not None:
+                self._l2_result(full_key, data)
+                return self._validate(self._decode(data)[0], type_)
+        # The lock holder died or is too slow, load it ourselves
+        return self._compute(key, loader, ttl, tags)
+
+    async def _load_async(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float | None,
+        tags: Collection[str],
+        type_: Any,
+        *,
+        wait: bool = True,
+    ) -> Any:
+        full_key = self.make_key(key)
+        if not (self.lock and _redis_available()):
+            return await self._compute_async(key, loader, ttl, tags)
+        lock_key, token = f"lock:{full_key}", uuid.uuid4().hex
+        lock_ms = int(settings.CACHE_LOCK_TIMEOUT_SECONDS * 1000)
+        try:
+            acquired = await async_redis.client.set(
+                lock_key, token, nx=True, px=lock_ms
+            )
+        except redis.RedisError as e:
+            self._redis_failed(e)
+            return await self._compute_async(key, loader, ttl, tags)
+        if acquired:
+            try:
+                return await self._compute_async(key, loader, ttl, tags)
+            finally:
+                try:
+                    await async_redis.client.eval(
+                        RELEASE_LOCK_SCRIPT, 1, lock_key, token
+                    )
+                except redis.RedisError as e:
+                    self._redis_failed(e)
+        if not wait:
+            return None
+        self.metrics.coalesced.inc()
+        deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT_SECONDS
+        delay = 0.01
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.2)
+            try:
+                data = await async_redis.client.get(full_key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+                break
+            if data is not None:
+                self._l2_result(full_key, data)
+                return self._validate(self._decode(data)[0], type_)
+        return await self._compute_async(key, loader, ttl, tags)
+
+    def _compute(
+        self,
+        key: str,
+        loader: Callable[[], Any],
+        ttl: float | None,
+        tags: Collection[str],
+    ) -> Any:
+        start = time.monotonic()
+        value = loader()
+        self.set(key, value, ttl=ttl, tags=tags, delta=time.monotonic() - start)
+        return value
+
+    async def _compute_async(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        ttl: float | None,
+        tags: Collection[str],
+    ) -> Any:
+        start = time.monotonic()
+        value = await loader()
+        await self.set_async(
+            key, value, ttl=ttl, tags=tags, delta=time.monotonic() - start
+        )
+        return value
+
+    def _refresh_due(self, delta: float, expires_at: float) -> bool:
+        # XFetch: recompute early with a probability rising as expiry nears,
+        # sooner for values that are slow to compute
+        if self.beta <= 0 or delta <= 0:
+            return False
+        jitter = -math.log(1.0 - random.random())
+        return time.time() + delta * self.beta * jitter >= expires_at
+
+    def _log_refresh_error(self, future: "Future[Any] | asyncio.Task[Any]") -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(
+                f"Cache {self.namespace}: background refresh failed: {future.exception()}"
+            )
+
+    def _get_entry(self, full_key: str) -> bytes | None:
+        data = self._get_l1(full_key)
+        if data is None and _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    data = cache_redis_client.get(full_key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+            else:
+                data = self._l2_result(full_key, data)
+        return data
+
+    async def _get_entry_async(self, full_key: str) -> bytes | None:
+        data = self._get_l1(full_key)
+        if data is None and _redis_available():
+            try:
+                with self.metrics.l2_latency.time():
+                    data = await async_redis.client.get(full_key)
+            except redis.RedisError as e:
+                self._redis_failed(e)
+            else:
+                data = self._l2_result(full_key, data)
+        return data
+
+    def _get_many_l1(
+        self, keys: Iterable[str]
+    ) -> tuple[dict[str, str], dict[str, bytes]]:
+        full_keys = {key: self.make_key(key) for key in keys}
+        found = {}
+        for key, full_key in full_keys.items():
+            data = self._get_l1(full_key)
+            if data is not None:
+                found[key] = data
+        return full_keys, found
+
+    def _merge_l2(
+        self,
+        full_keys: dict[str, str],
+        found: dict[str, bytes],
+        missing: list[str],
+        values: list[bytes | None],
+    ) -> None:
+        for key, data in zip(missing, values, strict=True):
+            data = self._l2_result(full_keys[key], data)
+            if data is not None:
+                found[key] = data
+
+    def _many_result(
+        self, full_keys: dict[str, str], found: dict[str, bytes], type_: Any
+    ) -> dict[str, Any]:
+        self.metrics.misses.inc(len(full_keys) - len(found))
+        return {
+            key: self._validate(self._decode(data)[0], type_)
+            for key, data in found.items()
+        }
+
+    def _get_l1(self, full_key: str) -> bytes | None:
+        data: bytes | None = self.l1.get(full_key)
+        if data is not None:
+            self.metrics.l1_hits.inc()
+        return data
+
+    def _l2_result(self, full_key: str, data: bytes | None) -> bytes | None:
+        if data is not None:
+            self.metrics.l2_hits.inc()
+            if self.l1_ttl > 0:
+                self.l1.set(full_key, data, ttl=self.l1_ttl)
+        return data
+
+    def _decode(self, data: bytes) -> tuple[Any, float, float]:
+        """Entries are stored as [value, compute time, expiry timestamp]."""
+        value, delta, expires_at = self.serializer.loads(data)
+        return value, delta, expires_at
+
+    def _validate(self, value: Any, type_: Any) -> Any:
+        if type_ is not None:
+            value = _type_adapter(type_).validate_python(value)
+        return value
+
+    def _store_l1(
+        self,
+        key: str,
+        value: Any,
+        ttl: float | None,
+        delta: float,
+        tags: Collection[str],
+    ) -> tuple[str, bytes, float]:
+        full_key = self.make_key(key)
+        ttl = self.ttl if ttl is None else ttl
+        data = self.serializer.dumps([value, delta, time.time() + ttl])
+        if self.l1_ttl > 0:
+            self.l1.set(full_key, data, ttl=min(ttl, self.l1_ttl))
+            with self._tags_lock:
+                for tag in tags:
+                    keys = self._l1_tags.get(tag) or set()
+                    keys.add(full_key)
+                    # Kept as long as the newest L1 entry carrying the tag
+                    self._l1_tags.set(tag, keys)
+        return full_key, data, ttl
+
+    def _queue_set(
+        self, pipe: Any, full_key: str, data: bytes, ttl: float, tags: Collection[str]
+    ) -> None:
+        now_ms = int(time.time() * 1000)
+        pipe.set(full_key, data, px=int(ttl * 1000))
+        for tag in tags:
+            pipe.eval(
+                ADD_TAG_SCRIPT,
+                1,
+                tag_key(tag),
+                full_key,
+                now_ms + int(ttl * 1000),
+                now_ms,
+            )
+
+    def _purge_l1_tags(self, tags: Collection[str]) -> None:
+        if ALL_TAGS in tags:
+            self.l1.clear()
+            self._l1_tags.clear()
+            return
+        with self._tags_lock:
+            for tag in tags:
+                for full_key in self._l1_tags.get(tag) or ():
+                    self.l1.delete(full_key)
+                self._l1_tags.delete(tag)
+
+    def _redis_failed(self, e: Exception) -> None:
+        self.metrics.errors.inc()
+        _mark_redis_down(f"Cache {self.namespace}", e)
+
+
+def get_cache_stats() -> list[dict[str, Any]]:
+    return [
+        {"namespace": namespace, "version": cache.version, **cache.metrics.snapshot()}
+        for namespace, cache in caches.items()
+    ]
+
+
+# Called with the invalidated tags in every worker, for in-process state
+# kept outside of Cache
+_invalidation_callbacks: list[Callable[[Collection[str]], None]] = []
+
+
+def on_invalidate(callback: Callable[[Collection[str]], None]) -> None:
+    _invalidation_callbacks.append(callback)
+
+
+def _purge_local(tags: Collection[str]) -> None:
+    for cache in list(caches.values()):
+        cache._purge_l1_tags(tags)
+    for callback in _invalidation_callbacks:
+        callback(tags)
+
+
+def invalidate_tags(*tags: str) -> None:
+    """
+    Purge every entry tagged with any of `tags`, from Redis and from the
+    in-process tier of every worker (through CACHE_INVALIDATION_CHANNEL).
+    """
+    if not tags:
+        return
+    _purge_local(tags)
+    if not _redis_available():
+        return
+    try:
+        pipe = cache_redis_client.pipeline(transaction=False)
+        for tag in tags:
+            pipe.eval(PURGE_TAG_SCRIPT, 1, tag_key(tag))
+        pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, json.dumps(tags))
+        pipe.execute()
+    except redis.RedisError as e:
+        _mark_redis_down("Cache invalidation", e)
+
+
+async def invalidate_tags_async(*tags: str) -> None:
+    if not tags:
+        return
+    _purge_local(tags)
+    if not _redis_available():
+        return
+    try:
+        async with async_redis.client.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.eval(PURGE_TAG_SCRIPT, 1, tag_key(tag))
+            pipe.publish(settings.CACHE_INVALIDATION_CHANNEL, json.dumps(tags))
+            await pipe.execute()
+    except redis.RedisError as e:
+        _mark_redis_down("Cache invalidation", e)
+
+
+def invalidate_all() -> int:
+    """Drop every cache entry of every namespace, returns the Redis keys deleted."""
+    _purge_local((ALL_TAGS,))
+    deleted = 0
+    if not _redis_available():
+        return deleted
+    try:
+        batch = []
+        for key in cache_redis_client.scan_iter(
+            match=f"{settings.CACHE_KEY_PREFIX}:*", count=500
+        ):
+            batch.append(key)
+            if len(batch) == 500:
+                deleted += cache_redis_client.delete(*batch)
+                batch.clear()
+        if batch:
+            deleted += cache_redis_client.delete(*batch)
+        cache_redis_client.publish(
+            settings.CACHE_INVALIDATION_CHANNEL, json.dumps([ALL_TAGS])
+        )
+    except redis.RedisError as e:
+        _mark_redis_down("Cache invalidation", e)
+    return deleted
+
+
+async def listen_for_invalidations() -> None:
+    """
+    Apply the invalidations published by other workers to this process.
+
+    Runs for the lifetime of the app; if the subscription drops, everything
+    cached in process is dropped too since purges may have been missed.
+    """
+    while True:
+        subscribed = False
+        try:
+            async with async_redis.client.pubsub() as pubsub:
+                await pubsub.subscribe(settings.CACHE_INVALIDATION_CHANNEL)
+                subscribed = True
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=1.0
+                    )
+                    if message is not None:
+                        _purge_local(json.loads(message["data"]))
+        except redis.RedisError as e:
+            logger.error(f"Cache invalidation subscription failed: {e}")
+            if subscribed:
+                _purge_local((ALL_TAGS,))
+        await asyncio.sleep(settings.CACHE_REDIS_RETRY_SECONDS)
+
+
+def cached(
+    cache: Cache,
+    *,
+    key: Callable[..., str] | None = None,
+    ttl: float | None = None,
+    tags: Callable[..., Collection[str]] | None = None,
+    ignore: Collection[str] = ("session",),
+) -> Callable[[F], F]:
+    """
+    Cache the return value of a sync or async function in `cache`.
+
+    The key is `key(*args, **kwargs)`, by default "name=value" pairs of the
+    call arguments except those in `ignore`, and the entry is tagged with
+    `tags(*args, **kwargs)`. Hits are validated back into the function's
+    return annotation so callers get the same type either way. Loads go
+    through `Cache.get_or_set`, so they are stampede-safe.
+
+    Early refreshes run after the call has returned, when the caller's
+    session may be closed: they open sessions of their own on the same
+    engine for the ignored session arguments. Calls with other ignored
+    arguments are not refreshed early.
+    """
+
+    def decorator(func: F) -> F:
+        signature = inspect.signature(func)
+        return_type = get_type_hints(func).get("return")
+        if return_type is Any:
+            return_type = None
+
+        def bind(args: Any, kwargs: Any) -> inspect.BoundArguments:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return bound
+
+        def make_key(bound: inspect.BoundArguments) -> str:
+            if key is not None:
+                return key(*bound.args, **bound.kwargs)
+            return ":".join(
+                f"{name}={value}"
+                for name, value in bound.arguments.items()
+                if name not in ignore
+            )
+
+        def refreshable(bound: inspect.BoundArguments, session_type: type[Any]) -> bool:
+            return all(
+                value is None or isinstance(value, session_type)
+                for name, value in bound.arguments.items()
+                if name in ignore
+            )
+
+        if inspect.iscoroutinefunction(func):
+
+            async def refresh_async(bound: inspect.BoundArguments) -> Any:
+                fresh = signature.bind(*bound.args, **bound.kwargs)
+                async with contextlib.AsyncExitStack() as stack:
+                    for name in ignore:
+                        session = fresh.arguments.get(name)
+                        if session is not None:
+                            fresh.arguments[name] = await stack.enter_async_context(
+                                type(session)(session.bind)
+                            )
+                    return await func(*fresh.args, **fresh.kwargs)
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                bound = bind(args, kwargs)
+                return await cache.get_or_set_async(
+                    make_key(bound),
+                    lambda: func(*args, **kwargs),
+                    ttl=ttl,
+                    tags=tags(*args, **kwargs) if tags else (),
+                    type_=return_type,
+                    early_refresh=refreshable(bound, AsyncSession),
+                    refresh_loader=lambda: refresh_async(bound),
+                )
+
+            return async_wrapper  # type: ignore[return-value]
+
+        def refresh(bound: inspect.BoundArguments) -> Any:
+            fresh = signature.bind(*bound.args, **bound.kwargs)
+            with contextlib.ExitStack() as stack:
+                for name in ignore:
+                    session = fresh.arguments.get(name)
+                    if session is not None:
+                        fresh.arguments[name] = stack.enter_context(
+                            type(session)(session.bind)
+                        )
+                return func(*fresh.args, **fresh.kwargs)
 
-redis_client = redis.Redis(host= settings.REDIS_HOST, port= settings.REDIS_PORT, decode_responses=True)
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            bound = bind(args, kwargs)
+            return cache.get_or_set(
+                make_key(bound),
+                lambda: func(*args, **kwargs),
+                ttl=ttl,
+                tags=tags(*args, **kwargs) if tags else (),
+                type_=return_type,
+                early_refresh=refreshable(bound, Session),
+                refresh_loader=lambda: refresh(bound),
+            )
 
-def set_cache(key: str, value: str, expire: int = 3600):
-    redis_client.set(key, value, ex=expire)
+        return wrapper  # type: ignore[return-value]
 
-def get_cache(key: str):
-    return redis_client.get(key)
\ No newline at end of file
+    return decorator
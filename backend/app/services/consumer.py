@@ -0,0 +1,324 @@
+import asyncio
+import contextlib
+import logging
+import signal
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import aio_pika
+from aio_pika.abc import (
+    AbstractChannel,
+    AbstractIncomingMessage,
+    AbstractQueue,
+    AbstractRobustConnection,
+)
+
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.services import message_queue
+from app.services.message_queue import Publisher
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[AbstractIncomingMessage], Awaitable[None]]
+
+# Headers carried by retried messages
+RETRY_HEADER = "x-retry"
+ROUTING_KEY_HEADER = "x-original-routing-key"
+
+
+def retry_queue_name(queue: str, delay: int) -> str:
+    # Named after the delay, changing the delays declares new queues rather
+    # than clashing with the x-message-ttl of the existing ones
+    return f"{queue}.retry.{delay}s"
+
+
+def dead_letter_queue_name(queue: str) -> str:
+    return f"{queue}.dead"
+
+
+class QueueMetrics:
+    def __init__(self) -> None:
+        self.started_at = time.monotonic()
+        self.processed = Counter()
+        self.failed = Counter()
+        self.retried = Counter()
+        self.dead_lettered = Counter()
+        # Handler run time, acknowledgement included
+        self.latency = Histogram()
+
+    def snapshot(self) -> dict[str, Any]:
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "processed": self.processed.value,
+            "failed": self.failed.value,
+            "retried": self.retried.value,
+            "dead_lettered": self.dead_lettered.value,
+            # Messages handled per second since the consumer started
+            "throughput": self.processed.value / elapsed if elapsed else 0.0,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class Subscription:
+    """Handlers of one queue and the exchanges it is bound to."""
+
+    def __init__(self, queue: str) -> None:
+        self.queue = queue
+        # Keyed by routing key, None catches the keys without a handler
+        self.handlers: dict[str | None, Handler] = {}
+        self.bindings: list[tuple[str, aio_pika.ExchangeType, str]] = []
+        self.concurrency = settings.RABBITMQ_CONSUMER_CONCURRENCY
+
+    def resolve(self, routing_key: str | None) -> Handler | None:
+        return self.handlers.get(routing_key) or self.handlers.get(None)
+
+
+class _RunningQueue:
+    def __init__(
+        self,
+        subscription: Subscription,
+        channel: AbstractChannel,
+        queue: AbstractQueue,
+    ) -> None:
+        self.subscription = subscription
+        self.channel = channel
+        self.queue = queue
+        # Delivered messages waiting for a handler task, bounded by prefetch
+        self.buffer: asyncio.Queue[AbstractIncomingMessage] = asyncio.Queue()
+        self.consumer_tag: str | None = None
+        self.workers: list[asyncio.Task[None]] = []
+
+
+class ConsumerRunner:
+    """
+    Runs the registered queue handlers until SIGTERM.
+
+    Each queue gets its own channel with RABBITMQ_PREFETCH_COUNT unacked
+    messages and `concurrency` handler tasks. A message is acked once its
+    handler returns. When the handler raises, the message is republished to
+    a retry queue whose TTL dead-letters it back into the original queue
+    after the next of RABBITMQ_RETRY_DELAYS_SECONDS; once the delays are
+    exhausted it is parked in "<queue>.dead".
+
+    On SIGTERM or SIGINT deliveries stop, the messages already received are
+    handled for up to RABBITMQ_DRAIN_TIMEOUT_SECONDS and the rest are left
+    unacked for the broker to redeliver.
+    """
+
+    def __init__(
+        self, url: str | None = None, *, publisher: Publisher | None = None
+    ) -> None:
+        self.url = url or settings.RABBITMQ_URL
+        # Republishes the failed messages
+        self.publisher = publisher or message_queue.publisher
+        self.subscriptions: dict[str, Subscription] = {}
+        self.metrics: dict[str, QueueMetrics] = {}
+        self._stopping: asyncio.Event | None = None
+
+    def handler(
+        self,
+        queue: str,
+        *,
+        routing_key: str | None = None,
+        exchange: str | None = None,
+        exchange_type: aio_pika.ExchangeType = aio_pika.ExchangeType.DIRECT,
+        concurrency: int | None = None,
+    ) -> Callable[[Handler], Handler]:
+        """
+        Register the decorated coroutine as the handler of `queue`.
+
+        With `routing_key` it only gets the messages published with that key,
+        the handler registered without one gets the others. With `exchange`
+        the queue is bound to it for `routing_key`, or for its own name.
+        """
+
+        def register(func: Handler) -> Handler:
+            subscription = self.subscriptions.get(queue)
+            if subscription is None:
+                subscription = self.subscriptions[queue] = Subscription(queue)
+                self.metrics[queue] = QueueMetrics()
+            if routing_key in subscription.handlers:
+                raise ValueError(
+                    f"A handler is already registered for queue {queue!r} "
+                    f"and routing key {routing_key!r}"
+                )
+            subscription.handlers[routing_key] = func
+            if exchange:
+                subscription.bindings.append(
+                    (exchange, exchange_type, routing_key or queue)
+                )
+            if concurrency:
+                subscription.concurrency = concurrency
+            return func
+
+        return register
+
+    def stop(self) -> None:
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        signals = (signal.SIGTERM, signal.SIGINT)
+        for sig in signals:
+            # Only possible from the main thread
+            with contextlib.suppress(NotImplementedError, RuntimeError, ValueError):
+                loop.add_signal_handler(sig, self.stop)
+        connection = await aio_pika.connect_robust(self.url)
+        stats = asyncio.create_task(self._log_stats())
+        try:
+            running = [
+                await self._start(connection, subscription)
+                for subscription in self.subscriptions.values()
+            ]
+            logger.info(f"Consuming from {', '.join(self.subscriptions)}")
+            await self._stopping.wait()
+            await self._drain(running)
+        finally:
+            stats.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await stats
+            await self.publisher.close_async()
+            await connection.close()
+            for sig in signals:
+                with contextlib.suppress(NotImplementedError, RuntimeError, ValueError):
+                    loop.remove_signal_handler(sig)
+            self._log_snapshot()
+
+    async def _start(
+        self, connection: AbstractRobustConnection, subscription: Subscription
+    ) -> _RunningQueue:
+        channel = await connection.channel()
+        await channel.set_qos(prefetch_count=settings.RABBITMQ_PREFETCH_COUNT)
+        queue = await channel.declare_queue(subscription.queue, durable=True)
+        for exchange_name, exchange_type, routing_key in subscription.bindings:
+            exchange = await channel.declare_exchange(
+                exchange_name, exchange_type, durable=True
+            )
+            await queue.bind(exchange, routing_key=routing_key)
+        running = _RunningQueue(subscription, channel, queue)
+        running.workers = [
+            asyncio.create_task(self._work(running))
+            for _ in range(subscription.concurrency)
+        ]
+        running.consumer_tag = await queue.consume(running.buffer.put)
+        return running
+
+    async def _drain(self, running: list[_RunningQueue]) -> None:
+        for queue in running:
+            if queue.consumer_tag is not None:
+                await queue.queue.cancel(queue.consumer_tag)
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.buffer.join() for queue in running)),
+                timeout=settings.RABBITMQ_DRAIN_TIMEOUT_SECONDS,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Consumers did not drain in time, unacked messages are redelivered"
+            )
+        workers = [worker for queue in running for worker in queue.workers]
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in running:
+            await queue.channel.close()
+
+    async def _work(self, running: _RunningQueue) -> None:
+        while True:
+            message = await running.buffer.get()
+            try:
+                await self.process(running.subscription, message)
+            finally:
+                running.buffer.task_done()
+
+    async def process(
+        self, subscription: Subscription, message: AbstractIncomingMessage
+    ) -> None:
+        """Run the handler of `message`, acking or retrying it."""
+        metrics = self.metrics[subscription.queue]
+        # Retried messages come back through the default exchange
+        routing_key = (message.headers or {}).get(
+            ROUTING_KEY_HEADER, message.routing_key
+        )
+        handler = subscription.resolve(routing_key)
+        with metrics.latency.time():
+            try:
+                if handler is None:
+                    raise LookupError(f"No handler for routing key {routing_key!r}")
+                await handler(message)
+            except Exception as e:
+                metrics.failed.inc()
+                logger.error(
+                    f"Handling a message from {subscription.queue} failed: {e}"
+                )
+                await self._retry(subscription.queue, message, routing_key)
+                return
+            await message.ack()
+        metrics.processed.inc()
+
+    async def _retry(
+        self, queue: str, message: AbstractIncomingMessage, routing_key: Any
+    ) -> None:
+        metrics = self.metrics[queue]
+        headers = dict(message.headers or {})
+        attempt = int(headers.get(RETRY_HEADER, 0))  # type: ignore[arg-type]
+        delays = settings.RABBITMQ_RETRY_DELAYS_SECONDS
+        headers[ROUTING_KEY_HEADER] = routing_key
+        try:
+            if attempt < len(delays):
+                delay = int(delays[attempt])
+                target = retry_queue_name(queue, delay)
+                await self.publisher.declare_queue(
+                    target,
+                    arguments={
+                        "x-message-ttl": delay * 1000,
+                        # Expired messages go back to the original queue
+                        "x-dead-letter-exchange": "",
+                        "x-dead-letter-routing-key": queue,
+                    },
+                )
+                headers[RETRY_HEADER] = attempt + 1
+            else:
+                target = dead_letter_queue_name(queue)
+            await self.publisher.publish_async(target, message.body, headers=headers)
+        except Exception as e:
+            # Keep the message rather than lose it, it is redelivered now
+            logger.error(f"Could not retry a message from {queue}: {e}")
+            await message.nack(requeue=True)
+            return
+        if attempt < len(delays):
+            metrics.retried.inc()
+        else:
+            metrics.dead_lettered.inc()
+        await message.ack()
+
+    async def _log_stats(self) -> None:
+        interval = settings.RABBITMQ_CONSUMER_STATS_INTERVAL_SECONDS
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            self._log_snapshot()
+
+    def _log_snapshot(self) -> None:
+        for queue, metrics in self.metrics.items():
+            stats = metrics.snapshot()
+            latency = stats.pop("latency")
+            logger.info(f"Queue {queue}: {stats}, latency {latency}")
+
+
+consumer = ConsumerRunner()
+
+
+@consumer.handler("notifications")
+async def handle_notification(message: AbstractIncomingMessage) -> None:
+    logger.info(f"Notification: {message.body.decode()}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(consumer.run())
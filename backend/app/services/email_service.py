@@ -1,15 +1,18 @@
 import logging
 import smtplib
+from collections.abc import Sequence
+from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from pathlib import Path
 
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
-def send_email(to_email, subject, body):
+def send_email(to_email, subject, body, attachments: Sequence[Path] = ()):
     """
-    Sends an email to the specified recipient.
+    Sends an email to the specified recipient, with `attachments` as files.
     """
     from_email = settings.EMAILS_FROM_EMAIL  # Set your email address
     password = settings.SMTP_PASSWORD  # Set your email password
@@ -21,6 +24,10 @@ def send_email(to_email, subject, body):
     msg['Subject'] = subject
 
     msg.attach(MIMEText(body, 'plain'))
+    for path in attachments:
+        part = MIMEApplication(path.read_bytes(), Name=path.name)
+        part['Content-Disposition'] = f'attachment; filename="{path.name}"'
+        msg.attach(part)
 
     try:
         # Connect to the email server
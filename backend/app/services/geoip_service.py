@@ -1,58 +1,357 @@
-import geoip2.database
+import ipaddress
+import logging
+import math
+import multiprocessing
 import os
+import threading
+import time
+import unicodedata
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import Any, NamedTuple
+
+import geoip2.database
+import geoip2.errors
+import geoip2.models
+import maxminddb
 import requests
 
-# Path to the GeoLite2 City database
+from app.core.config import settings
+from app.core.metrics import Counter, Histogram
+from app.services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Path to the GeoLite2 City database, unless GEOIP_DB_PATH is set
 GEOIP_DB_PATH = os.path.join(os.path.dirname(__file__), "data/geoip/GeoLite2-City.mmdb")
 
-GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
+GOOGLE_GEOCODING_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+# Cached for addresses the database does not know
+_NOT_FOUND = object()
+
+
+def cache_key(ip_address: str, by_network: bool = False) -> str:
+    """
+    Normalized `ip_address`, or its /24 (IPv4) or /48 (IPv6) network.
+    Raises ValueError for anything but an IP address.
+    """
+    address = ipaddress.ip_address(ip_address)
+    if not by_network:
+        return str(address)
+    prefix = 24 if address.version == 4 else 48
+    return str(ipaddress.ip_network(f"{address}/{prefix}", strict=False))
+
+
+def _location(response: geoip2.models.City) -> dict[str, Any]:
+    return {
+        "country": response.country.name,
+        "country_iso_code": response.country.iso_code,
+        "region": response.subdivisions.most_specific.name,
+        "city": response.city.name,
+        "postal_code": response.postal.code,
+        "latitude": response.location.latitude,
+        "longitude": response.location.longitude,
+    }
+
+
+class GeoIPMetrics:
+    def __init__(self) -> None:
+        self.hits = Counter()
+        self.misses = Counter()
+        self.reloads = Counter()
+        # Database lookups, the misses of the cache
+        self.latency = Histogram()
+
+    def snapshot(self) -> dict[str, Any]:
+        lookups = self.hits.value + self.misses.value
+        return {
+            "hits": self.hits.value,
+            "misses": self.misses.value,
+            "reloads": self.reloads.value,
+            "hit_rate": self.hits.value / lookups if lookups else 0.0,
+            "latency": self.latency.snapshot(),
+        }
+
+
+class GeoIPReader:
+    """
+    GeoLite2 City database shared by the whole process.
+
+    The file is opened once and memory mapped, lookups read the mapping in
+    place. Results, misses included, are kept in an LRU of `cache_size`
+    addresses; with `cache_by_network` the key is the /24 or /48 network
+    instead, trading precision for a far better hit rate. The file is
+    checked at most every `reload_check_seconds` and reopened, with the
+    cache cleared, once it has been replaced.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        *,
+        cache_size: int | None = None,
+        cache_by_network: bool | None = None,
+        reload_check_seconds: float | None = None,
+    ) -> None:
+        self.path = path or settings.GEOIP_DB_PATH or GEOIP_DB_PATH
+        self.cache = LRUCache(maxsize=cache_size or settings.GEOIP_CACHE_SIZE)
+        self.cache_by_network = (
+            settings.GEOIP_CACHE_BY_NETWORK
+            if cache_by_network is None
+            else cache_by_network
+        )
+        self.reload_check_seconds = (
+            settings.GEOIP_RELOAD_CHECK_SECONDS
+            if reload_check_seconds is None
+            else reload_check_seconds
+        )
+        self.metrics = GeoIPMetrics()
+        self._lock = threading.Lock()
+        self._reader: geoip2.database.Reader | None = None
+        # (mtime, inode, size) of the file the reader was opened from
+        self._signature: tuple[int, int, int] | None = None
+        self._checked_at = -math.inf
+
+    def _current_reader(self) -> geoip2.database.Reader:
+        if time.monotonic() - self._checked_at < self.reload_check_seconds:
+            assert self._reader is not None
+            return self._reader
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.reload_check_seconds:
+                assert self._reader is not None
+                return self._reader
+            try:
+                stat = os.stat(self.path)
+                signature = (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+                if signature != self._signature:
+                    reader = geoip2.database.Reader(
+                        self.path, mode=maxminddb.MODE_MMAP
+                    )
+                    if self._reader is not None:
+                        self.metrics.reloads.inc()
+                        logger.info(f"Reloaded the GeoIP database {self.path}")
+                    # The previous reader is not closed, lookups in flight
+                    # may still use it; its mapping goes with the last of them
+                    self._reader, self._signature = reader, signature
+                    self.cache.clear()
+            except (OSError, maxminddb.InvalidDatabaseError) as e:
+                # Half copied file: keep the current one and check again later
+                if self._reader is None:
+                    raise
+                logger.error(f"Could not reload the GeoIP database {self.path}: {e}")
+            self._checked_at = now
+            return self._reader
+
+    def lookup(self, ip_address: str) -> dict[str, Any] | None:
+        """
+        Location of `ip_address`, None when the database does not know it.
+        Raises ValueError for an invalid address and OSError when the
+        database cannot be opened.
+        """
+        key = cache_key(ip_address, self.cache_by_network)
+        reader = self._current_reader()
+        location = self.cache.get(key, _NOT_FOUND)
+        if location is not _NOT_FOUND:
+            self.metrics.hits.inc()
+            return dict(location) if location is not None else None
+        self.metrics.misses.inc()
+        with self.metrics.latency.time():
+            try:
+                location = _location(reader.city(ip_address))
+            except geoip2.errors.AddressNotFoundError:
+                location = None
+        self.cache.set(key, location)
+        return dict(location) if location is not None else None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "cache_by_network": self.cache_by_network,
+            "cache_size": len(self.cache),
+            **self.metrics.snapshot(),
+        }
+
+
+# Opened on the first lookup
+geoip_reader = GeoIPReader()
+
 
 def get_location_by_ip(ip_address: str) -> dict | None:
     """Get geographical location information from an IP address."""
     try:
-        # Open the GeoLite2 database
-        with geoip2.database.Reader(GEOIP_DB_PATH) as reader:
-            response = reader.city(ip_address)
-            location_data = {
-                "country": response.country.name,
-                "country_iso_code": response.country.iso_code,
-                "region": response.subdivisions.most_specific.name,
-                "city": response.city.name,
-                "postal_code": response.postal.code,
-                "latitude": response.location.latitude,
-                "longitude": response.location.longitude,
-            }
-            return location_data
-    except geoip2.errors.AddressNotFoundError:
-        print(f"IP address {ip_address} not found in GeoIP database.")
+        location_data = geoip_reader.lookup(ip_address)
+    except ValueError:
+        logger.warning(f"Invalid IP address {ip_address!r}")
         return None
     except Exception as e:
-        print(f"Error retrieving location for {ip_address}: {e}")
+        logger.error(f"Error retrieving location for {ip_address}: {e}")
+        return None
+    if location_data is None:
+        logger.info(f"IP address {ip_address} not found in GeoIP database.")
+    return location_data
+
+class IPLocation(NamedTuple):
+    ip: str
+    location: dict[str, Any] | None
+    # Why the address could not be looked up
+    error: str | None = None
+
+
+# Executed by the lookup processes, must stay a module level function
+def _lookup_chunk(ip_addresses: list[str]) -> list[IPLocation]:
+    results = []
+    for ip_address in ip_addresses:
+        try:
+            results.append(IPLocation(ip_address, geoip_reader.lookup(ip_address)))
+        except ValueError:
+            results.append(IPLocation(ip_address, None, "invalid address"))
+        except Exception as e:
+            results.append(IPLocation(ip_address, None, str(e)))
+    return results
+
+
+_batch_lock = threading.Lock()
+_batch_executor: Executor | None = None
+
+
+def _get_batch_executor(workers: int) -> Executor | None:
+    global _batch_executor
+    # Like the password hasher, inline in Celery prefork children
+    if workers <= 0 or multiprocessing.current_process().daemon:
         return None
+    with _batch_lock:
+        if _batch_executor is None:
+            # spawn: forking a threaded server process is not safe
+            _batch_executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _batch_executor
+
+
+def shutdown_batch_lookups() -> None:
+    global _batch_executor
+    with _batch_lock:
+        executor, _batch_executor = _batch_executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _distinct_chunks(ip_addresses: Iterable[str], chunk_size: int) -> Iterator[list[str]]:
+    seen: set[str] = set()
+    chunk: list[str] = []
+    for ip_address in ip_addresses:
+        ip_address = ip_address.strip()
+        if not ip_address or ip_address in seen:
+            continue
+        seen.add(ip_address)
+        chunk.append(ip_address)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def lookup_many(
+    ip_addresses: Iterable[str],
+    *,
+    workers: int | None = None,
+    chunk_size: int | None = None,
+) -> Iterator[IPLocation]:
+    """
+    Locate every distinct address of `ip_addresses`, in first seen order.
+
+    Chunks of `chunk_size` addresses are looked up by a pool of `workers`
+    processes, each memory mapping the same database file so its pages are
+    shared. At most two chunks per worker are in flight: results come out
+    while the rest are looked up and a long input is never held in full.
+    With 0 workers the lookups run in the calling thread.
+    """
+    if workers is None:
+        workers = settings.GEOIP_BATCH_WORKERS
+    chunks = _distinct_chunks(ip_addresses, chunk_size or settings.GEOIP_BATCH_CHUNK_SIZE)
+    executor = _get_batch_executor(workers)
+    if executor is None:
+        for chunk in chunks:
+            yield from _lookup_chunk(chunk)
+        return
+    pending: deque[Future[list[IPLocation]]] = deque()
+    try:
+        for chunk in chunks:
+            pending.append(executor.submit(_lookup_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        # The consumer went away
+        for future in pending:
+            future.cancel()
+
+
+class GeocodingError(Exception):
+    """The geocoding API did not answer, the address can be retried later."""
+
+
+class GeocodingRateLimited(GeocodingError):
+    """The API key is over its query limit."""
+
+
+def address_text(address: dict) -> str:
+    parts = (
+        address.get("address_line_1"),
+        address.get("address_line_2"),
+        address.get("city"),
+        address.get("state"),
+        address.get("country"),
+        address.get("postal_code"),
+    )
+    return ", ".join(part.strip() for part in parts if part and part.strip())
+
+
+def normalize_address(address: dict) -> str:
+    """Key of `address` in the geocode cache, blind to case and spacing."""
+    text = unicodedata.normalize("NFKC", address_text(address)).casefold()
+    return " ".join(text.split())
+
 
 def geocode_address(address: dict) -> dict | None:
-    """Geocode the user-provided address to latitude and longitude using Google Maps API."""
-    if not GOOGLE_MAPS_API_KEY:
+    """
+    Geocode the user-provided address to latitude and longitude using Google Maps API.
+
+    Returns None when the address has no match and raises GeocodingError when
+    the API failed or timed out. Blocking, only called by the geocoding task;
+    requests read the coordinates it stored.
+    """
+    if not settings.GOOGLE_MAPS_API_KEY:
         raise ValueError("Google Maps API key not configured.")
 
-    address_str = f"{address['address_line_1']}, {address.get('city', '')}, {address.get('state', '')}, {address['country']}, {address.get('postal_code', '')}"
     try:
         response = requests.get(
-            f"https://maps.googleapis.com/maps/api/geocode/json",
-            params={"address": address_str, "key": GOOGLE_MAPS_API_KEY},
+            GOOGLE_GEOCODING_URL,
+            params={"address": address_text(address), "key": settings.GOOGLE_MAPS_API_KEY},
+            timeout=settings.GEOCODING_TIMEOUT_SECONDS,
         )
+        response.raise_for_status()
         response_data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise GeocodingError(f"Error occurred while geocoding address: {e}") from e
 
-        if response_data['status'] == 'OK':
-            location = response_data['results'][0]['geometry']['location']
-            return {
-                "latitude": location['lat'],
-                "longitude": location['lng'],
-                "formatted_address": response_data['results'][0]['formatted_address'],
-            }
-        else:
-            print(f"Error geocoding address: {response_data['status']}")
-            return None
-    except Exception as e:
-        print(f"Error occurred while geocoding address: {e}")
+    status = response_data.get("status")
+    if status == "OK":
+        result = response_data["results"][0]
+        location = result["geometry"]["location"]
+        return {
+            "latitude": location["lat"],
+            "longitude": location["lng"],
+            "formatted_address": result["formatted_address"],
+        }
+    if status == "ZERO_RESULTS":
         return None
+    if status == "OVER_QUERY_LIMIT":
+        raise GeocodingRateLimited(f"Error geocoding address: {status}")
+    raise GeocodingError(f"Error geocoding address: {status}")
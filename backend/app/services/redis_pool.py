@@ -0,0 +1,109 @@
+import asyncio
+import contextlib
+import logging
+import threading
+import weakref
+from typing import Any
+
+import redis
+import redis.asyncio
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def pool_options() -> dict[str, Any]:
+    """Connection pool limits shared by the sync and async clients."""
+    return {
+        "host": settings.REDIS_HOST,
+        "port": settings.REDIS_PORT,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        # How long to wait for a free connection before raising ConnectionError
+        "timeout": settings.REDIS_POOL_TIMEOUT_SECONDS,
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        "socket_connect_timeout": settings.REDIS_SOCKET_TIMEOUT_SECONDS,
+        "health_check_interval": settings.REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def create_client(*, decode_responses: bool = False) -> redis.Redis:
+    pool = redis.BlockingConnectionPool(
+        **pool_options(), decode_responses=decode_responses
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+class AsyncRedisPool:
+    """
+    Process-wide async Redis clients, one bounded connection pool per event
+    loop.
+
+    Connections belong to the event loop that opened them, so each loop
+    using it (the app's, Celery tasks', scripts') gets a client of its own.
+    The app opens its client in its startup hook and closes it on shutdown;
+    the clients of other loops are closed when asyncio.run() cancels the
+    loop's remaining tasks on exit. Responses are bytes.
+    """
+
+    def __init__(self) -> None:
+        self._clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, tuple[redis.asyncio.Redis, asyncio.Task[None]]
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> redis.asyncio.Redis:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                # The connections of closed loops can't be awaited anymore,
+                # their transports close the sockets once they are dropped
+                for closed in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[closed]
+                client = redis.asyncio.Redis(
+                    connection_pool=redis.asyncio.BlockingConnectionPool(
+                        **pool_options()
+                    )
+                )
+                entry = self._clients[loop] = (
+                    client,
+                    loop.create_task(_close_on_cancel(client)),
+                )
+        return entry[0]
+
+    async def open(self) -> None:
+        client = self.client
+        try:
+            await client.ping()
+        except redis.RedisError as e:
+            # Redis backed features degrade, the app still serves
+            logger.error(f"Redis is not reachable on startup: {e}")
+
+    async def close(self) -> None:
+        """Close the client of the running loop."""
+        with self._lock:
+            entry = self._clients.pop(asyncio.get_running_loop(), None)
+        if entry is None:
+            return
+        _, closer = entry
+        closer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await closer
+
+
+async def _close_on_cancel(client: redis.asyncio.Redis) -> None:
+    # Waits for close() or the loop's shutdown to cancel it
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await _close_client(client)
+
+
+async def _close_client(client: redis.asyncio.Redis) -> None:
+    await client.aclose()
+    await client.connection_pool.disconnect()
+
+
+async_redis = AsyncRedisPool()
@@ -1,24 +1,38 @@
+import json
 import logging
+import socket
 import time
+import uuid
+from collections.abc import Iterable
 from datetime import datetime, timedelta
 
-from sqlalchemy.orm import Session
+from sqlmodel import Session
 
-from app.core.db import SessionLocal
+from app import crud
+from app.core.config import settings
+from app.core.db import SessionLocal, engine
+from app.core.partitions import (
+    PARTITIONED_TABLES,
+    is_partitioned,
+    maintain_table_partitions,
+)
+from app.helpers.rollup_helpers import get_daily_summary_db, refresh_rollups_db
 from app.helpers.task_helpers import (
+    CleanupProgress,
     check_system_health,
     cleanup_old_records_db,
     clear_cache,
     create_backup,
     fetch_api_data,
     generate_report_db,
-    update_cache,
+    geocode_user_addresses_db,
+    prune_report_files,
 )
 from app.models import Notification, Record, User
 from app.workers.celery_worker import celery_worker
 
 from .email_service import send_email  # Assuming you have an email service
-from .message_queue import send_message
+from .message_queue import publisher, send_message
 
 logger = logging.getLogger(__name__)
 
@@ -60,6 +74,61 @@ def send_notification_task(user_id: int, message: str):
     print(f"Sent notification to user {user_id}: {message}")
     return {"status": "notification_sent", "user_id": user_id, "message": message}
 
+@celery_worker.task
+def broadcast_notification_task(
+    message: str,
+    user_ids: list[str] | None = None,
+    filters: dict[str, bool] | None = None,
+):
+    """
+    Notifies many users at once, given by id or by `filters` on User columns.
+
+    Users are handled NOTIFICATION_BROADCAST_CHUNK_SIZE at a time: one query
+    checking they exist, one bulk INSERT and one commit per chunk, then the
+    chunk's messages are published in one batch.
+    """
+    chunk_size = settings.NOTIFICATION_BROADCAST_CHUNK_SIZE
+    notified = skipped = unpublished = 0
+    with Session(engine) as session:
+        chunks: Iterable[list[uuid.UUID]]
+        if user_ids is not None:
+            ids = [uuid.UUID(user_id) for user_id in dict.fromkeys(user_ids)]
+            chunks = (ids[i : i + chunk_size] for i in range(0, len(ids), chunk_size))
+        else:
+            chunks = crud.iter_user_id_chunks(
+                session=session, chunk_size=chunk_size, **(filters or {})
+            )
+        for chunk in chunks:
+            created = crud.create_notifications(
+                session=session, user_ids=chunk, message=message
+            )
+            session.commit()
+            notified += len(created)
+            skipped += len(chunk) - len(created)
+            bodies = [
+                json.dumps(
+                    {
+                        "notification_id": str(notification_id),
+                        "user_id": str(user_id),
+                        "message": message,
+                    }
+                )
+                for notification_id, user_id in created
+            ]
+            try:
+                publisher.publish_many("notifications", bodies)
+            except Exception as e:
+                # The notifications are stored, only their delivery is missing
+                unpublished += len(bodies)
+                logger.error(f"Error publishing broadcast notifications: {e}")
+    logger.info(f"Broadcast notified {notified} users, skipped {skipped} unknown ids")
+    return {
+        "status": "broadcast_sent",
+        "notified": notified,
+        "skipped": skipped,
+        "unpublished": unpublished,
+    }
+
 @celery_worker.task
 def generate_report(report_id: int):
     # Simulate report generation
@@ -68,22 +137,111 @@ def generate_report(report_id: int):
     print(f"Generated report with ID: {report_id}")
     return {"status": "report_generated", "report_id": report_id}
 
-@celery_worker.task
-def cloeanup_old_records():
+@celery_worker.task(bind=True)
+def cleanup_old_records(
+    self, resume_after: list[str] | None = None, cutoff: str | None = None
+):
     """
-    Cleans up old records from the database.
+    Cleans up records older than RECORD_RETENTION_DAYS from the database.
     This task runs every hour as scheduled in beat_schedule.
+
+    Records are deleted in short chunks for at most RECORD_CLEANUP_MAX_SECONDS.
+    If some are left the task queues itself again, resuming after the last
+    record deleted with the same cutoff, so a backlog is worked off in steps.
+    Progress is reported through the PROGRESS task state.
     """
-    logger.info("Starting cleanup of old records...")
+    cutoff_date = (
+        datetime.fromisoformat(cutoff)
+        if cutoff
+        else datetime.utcnow() - timedelta(days=settings.RECORD_RETENTION_DAYS)
+    )
+    checkpoint = (
+        (datetime.fromisoformat(resume_after[0]), uuid.UUID(resume_after[1]))
+        if resume_after
+        else None
+    )
+    logger.info(f"Starting cleanup of records older than {cutoff_date}...")
+
+    def report(progress: CleanupProgress) -> None:
+        logger.info(f"Deleted {progress.deleted} old records so far.")
+        if self.request.id:
+            self.update_state(state="PROGRESS", meta={"deleted": progress.deleted})
 
     try:
-        cutoff_date = datetime.now() - timedelta(days=30)  # Example: Delete records older than 30 days
-        records_deleted = cleanup_old_records_db(cutoff_date)  # Implement this function in your database module
-        logger.info(f"Deleted {records_deleted} old records from the database.")
+        progress = cleanup_old_records_db(
+            cutoff_date, resume_after=checkpoint, on_progress=report
+        )
     except Exception as e:
         logger.error(f"Error during cleanup of old records: {e}")
+        return {"status": "error", "cutoff": cutoff_date.isoformat()}
+
+    if not progress.done and progress.checkpoint is not None:
+        created_at, record_id = progress.checkpoint
+        cleanup_old_records.apply_async(
+            kwargs={
+                "resume_after": [created_at.isoformat(), str(record_id)],
+                "cutoff": cutoff_date.isoformat(),
+            }
+        )
+        logger.info("Cleanup time budget used up, continuing in a new task.")
+    else:
+        logger.info("Finished cleanup of old records.")
+    return {
+        "status": "done" if progress.done else "resumed",
+        "deleted": progress.deleted,
+        "cutoff": cutoff_date.isoformat(),
+    }
+
+@celery_worker.task
+def maintain_partitions():
+    """
+    Creates the monthly partitions of the next PARTITION_PREMAKE_MONTHS and
+    drops those past retention, for the tables stored partitioned.
+    This task runs every day as scheduled in beat_schedule.
+    """
+    retention_days = {
+        "record": settings.RECORD_RETENTION_DAYS,
+        "notification": settings.NOTIFICATION_RETENTION_DAYS,
+    }
+    created: list[str] = []
+    dropped: list[str] = []
+    # Autocommit: expired partitions are detached concurrently
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for table in PARTITIONED_TABLES:
+            if not is_partitioned(connection, table):
+                continue
+            table_created, table_dropped = maintain_table_partitions(
+                connection,
+                table,
+                today=datetime.utcnow().date(),
+                months_ahead=settings.PARTITION_PREMAKE_MONTHS,
+                retention_days=retention_days.get(table),
+            )
+            created += table_created
+            dropped += table_dropped
+    if created or dropped:
+        logger.info(f"Created partitions {created}, dropped partitions {dropped}.")
+    return {"status": "partitions_maintained", "created": created, "dropped": dropped}
 
-    logger.info("Finished cleanup of old records.")
+@celery_worker.task
+def refresh_rollups():
+    """
+    Folds the records and payments written since the last run into the
+    daily rollups read by the reports.
+    This task runs every fifteen minutes as scheduled in beat_schedule.
+    """
+    progress = refresh_rollups_db()
+    return {"status": "rollups_refreshed", **progress._asdict()}
+
+@celery_worker.task
+def geocode_user_addresses():
+    """
+    Locates the user addresses without coordinates, through the geocode
+    cache and, for new addresses, the rate limited geocoding API.
+    This task runs every ten minutes as scheduled in beat_schedule.
+    """
+    progress = geocode_user_addresses_db()
+    return {"status": "addresses_geocoded", **progress._asdict()}
 
 @celery_worker.task
 def backup_database():
@@ -92,31 +250,68 @@ def backup_database():
     print("Database backup completed.")
 
 @celery_worker.task
-def refresh_cache():
-    # Logic to refresh cached data
-    clear_cache()
-    update_cache()
-    print("Cache refreshed.")
+def refresh_cache(tags: list[str] | None = None):
+    # Entries are reloaded lazily on their next read
+    purged = clear_cache(tags)
+    return {"status": "cache_refreshed", "tags": purged}
 
 @celery_worker.task
 def generate_daily_report():
     """
-    Generates a daily report.
-    This task runs every day at midnight as scheduled in beat_schedule.
+    Generates a report of the records and payments created yesterday (UTC).
+    This task runs every day just after midnight as scheduled in beat_schedule.
+
+    The totals come from the daily rollups, brought up to date first, so
+    they cost no more than the rows written since the last refresh.
+
+    The report is streamed to a REPORT_FORMAT file, attached to the email
+    when it fits REPORT_ATTACHMENT_MAX_BYTES and referred to by host and
+    path otherwise; those are deleted after REPORT_RETENTION_DAYS.
     """
     logger.info("Generating daily report...")
 
+    end = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    start = end - timedelta(days=1)
     try:
-        report = generate_report_db()  # Implement this function in your database module
+        prune_report_files()
+        # Catch up on the rows written since the last refresh only
+        refresh_rollups_db()
+        summary = get_daily_summary_db(start.date())
+        report = generate_report_db(start, end)
         logger.info("Daily report generated successfully.")
-
-        # Optionally, send the report via email
-        send_email("admin@example.com", "Daily Report", report)  # Customize the recipient and content
-        logger.info("Daily report sent to admin via email.")
     except Exception as e:
         logger.error(f"Error generating daily report: {e}")
+        return {"status": "error"}
+
+    body = f"Records created on {start:%Y-%m-%d}: {sum(summary.records.values())}.\n"
+    for record_type, count in sorted(summary.records.items()):
+        body += f"  {record_type.value}: {count}\n"
+    body += f"Payments created on {start:%Y-%m-%d}:\n"
+    for status, (count, amount) in sorted(summary.payments.items()):
+        body += f"  {status.value}: {count}, {amount:.2f}\n"
+    attachments = []
+    if report.path.stat().st_size <= settings.REPORT_ATTACHMENT_MAX_BYTES:
+        attachments.append(report.path)
+    else:
+        body += (
+            "The report is too large to attach, it is at "
+            f"{socket.gethostname()}:{report.path} for "
+            f"{settings.REPORT_RETENTION_DAYS} days.\n"
+        )
+    try:
+        send_email(settings.REPORT_EMAIL_TO, "Daily Report", body, attachments)
+        logger.info("Daily report sent to admin via email.")
+    finally:
+        if attachments:
+            # Kept when only referred to by path
+            report.path.unlink(missing_ok=True)
 
     logger.info("Finished generating daily report.")
+    return {
+        "status": "report_generated",
+        "rows": report.rows,
+        "attached": bool(attachments),
+    }
 
 @celery_worker.task
 def heartbeat_check():
@@ -0,0 +1,114 @@
+import json
+from pathlib import Path
+
+import geoip2.database
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.services import geoip_service
+from app.services.geoip_service import GeoIPReader
+from app.tests.utils.geoip import FakeReader
+
+URL = f"{settings.API_V1_STR}/geoip/lookup/"
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(geoip2.database, "Reader", FakeReader)
+    path = tmp_path / "GeoLite2-City.mmdb"
+    path.write_text("Kingston")
+    monkeypatch.setattr(geoip_service, "geoip_reader", GeoIPReader(str(path)))
+    # The spawned lookup processes would not see the fake reader
+    monkeypatch.setattr(settings, "GEOIP_BATCH_WORKERS", 0)
+
+
+def read_lines(text: str) -> list[dict]:
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def test_lookup_json_array(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        URL,
+        headers=superuser_token_headers,
+        json=["203.0.113.7", "10.0.0.1", "203.0.113.7", "bad"],
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    results = read_lines(r.text)
+    assert [result["ip"] for result in results] == ["203.0.113.7", "10.0.0.1", "bad"]
+    assert results[0]["location"]["city"] == "Kingston"
+    assert results[1] == {"ip": "10.0.0.1", "location": None, "error": None}
+    assert results[2]["error"] == "invalid address"
+
+
+def test_lookup_newline_delimited(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    body = "203.0.113.7\r\n203.0.113.8\n\n203.0.113.7\n"
+    r = client.post(
+        URL,
+        headers={**superuser_token_headers, "Content-Type": "text/plain"},
+        content=body,
+    )
+    assert r.status_code == 200
+    assert [result["ip"] for result in read_lines(r.text)] == [
+        "203.0.113.7",
+        "203.0.113.8",
+    ]
+
+    r = client.post(
+        URL,
+        headers=superuser_token_headers,
+        files={"file": ("ips.txt", body.encode(), "text/plain")},
+    )
+    assert r.status_code == 200
+    assert len(read_lines(r.text)) == 2
+
+
+def test_lookup_rejects_bad_input(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    r = client.post(URL, headers=superuser_token_headers, json={"ip": "203.0.113.7"})
+    assert r.status_code == 422
+
+    monkeypatch.setattr(settings, "GEOIP_BATCH_MAX_ADDRESSES", 2)
+    r = client.post(URL, headers=superuser_token_headers, json=["1.1.1.1"] * 3)
+    assert r.status_code == 413
+
+
+def test_lookup_rejects_large_body(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "GEOIP_BATCH_MAX_BYTES", 100)
+    body = "203.0.113.7\n" * 10
+    headers = {**superuser_token_headers, "Content-Type": "text/plain"}
+    r = client.post(URL, headers=headers, content=body)
+    assert r.status_code == 413
+
+    # Without a Content-Length the body is only read up to the limit
+    r = client.post(URL, headers=headers, content=iter([body.encode()] * 2))
+    assert r.status_code == 413
+
+    r = client.post(
+        URL,
+        headers=superuser_token_headers,
+        files={"file": ("ips.txt", body.encode(), "text/plain")},
+    )
+    assert r.status_code == 413
+
+    r = client.post(URL, headers=headers, content=body[:96])
+    assert r.status_code == 200
+
+
+def test_lookup_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.post(URL, headers=normal_user_token_headers, json=["203.0.113.7"])
+    assert r.status_code == 403
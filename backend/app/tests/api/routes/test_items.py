@@ -1,8 +1,10 @@
 import uuid
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
+from sqlmodel import Session, text
 
+from app.api.pagination import encode_cursor
 from app.core.config import settings
 from app.tests.utils.item import create_random_item
 
@@ -79,6 +81,106 @@ def test_read_items(
     assert len(content["data"]) >= 2
 
 
+def test_read_items_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/"
+    response = client.get(url, headers=superuser_token_headers)
+    expected = [item["id"] for item in response.json()["data"]]
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, headers=superuser_token_headers, params=params)
+        assert response.status_code == 200
+        content = response.json()
+        seen += [item["id"] for item in content["data"]]
+        cursor = content["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not-a-cursor",
+        # Valid cursors of a non-string sort key
+        encode_cursor(1, uuid.uuid4()),
+        encode_cursor(None, uuid.uuid4()),
+    ],
+)
+def test_read_items_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], cursor: str
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"cursor": cursor},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_read_items_without_count(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    create_random_item(db)
+    response = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=superuser_token_headers,
+        params={"include_count": False},
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["count"] is None
+    assert len(content["data"]) >= 1
+
+
+def test_read_items_cached_count(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    exact = client.get(url, headers=normal_user_token_headers).json()["count"]
+    monkeypatch.setattr(settings, "LIST_COUNT_STRATEGY", "cached")
+    response = client.get(url, headers=normal_user_token_headers)
+    assert response.json()["count"] == exact
+
+    data = {"title": "Counted", "description": "Item"}
+    item = client.post(url, headers=normal_user_token_headers, json=data).json()
+    response = client.get(url, headers=normal_user_token_headers)
+    assert response.json()["count"] == exact + 1
+
+    client.delete(f"{url}{item['id']}", headers=normal_user_token_headers)
+    response = client.get(url, headers=normal_user_token_headers)
+    assert response.json()["count"] == exact
+
+
+def test_read_items_estimated_count(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    create_random_item(db)
+    url = f"{settings.API_V1_STR}/items/"
+    exact = client.get(url, headers=superuser_token_headers).json()["count"]
+    db.exec(text("ANALYZE item"))  # type: ignore[call-overload]
+    monkeypatch.setattr(settings, "LIST_COUNT_STRATEGY", "estimated")
+    response = client.get(url, headers=superuser_token_headers)
+    assert response.json()["count"] == exact
+    # Filtered by owner, from the EXPLAIN row estimate
+    response = client.get(url, headers=normal_user_token_headers)
+    assert response.status_code == 200
+    assert response.json()["count"] >= 0
+
+
 def test_update_item(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -96,6 +198,21 @@ def test_update_item(
     assert content["id"] == str(item.id)
     assert content["owner_id"] == str(item.owner_id)
 
+    # The cached read of the item is purged by the update
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}", headers=superuser_token_headers
+    )
+    assert response.json()["title"] == data["title"]
+    client.put(
+        f"{settings.API_V1_STR}/items/{item.id}",
+        headers=superuser_token_headers,
+        json={"title": "Updated again"},
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/items/{item.id}", headers=superuser_token_headers
+    )
+    assert response.json()["title"] == "Updated again"
+
 
 def test_update_item_not_found(
     client: TestClient, superuser_token_headers: dict[str, str]
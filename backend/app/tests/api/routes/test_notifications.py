@@ -0,0 +1,79 @@
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.services.tasks import broadcast_notification_task
+
+
+@pytest.fixture
+def queued(monkeypatch: pytest.MonkeyPatch) -> list[tuple[Any, ...]]:
+    calls: list[tuple[Any, ...]] = []
+
+    def delay(*args: Any) -> SimpleNamespace:
+        calls.append(args)
+        return SimpleNamespace(id="task-id")
+
+    monkeypatch.setattr(broadcast_notification_task, "delay", delay)
+    return calls
+
+
+def test_broadcast_by_ids(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    queued: list[tuple[Any, ...]],
+) -> None:
+    user_id = uuid.uuid4()
+    r = client.post(
+        f"{settings.API_V1_STR}/notifications/broadcast/",
+        headers=superuser_token_headers,
+        json={"message": "Hello", "user_ids": [str(user_id)]},
+    )
+    assert r.status_code == 202
+    assert r.json() == {"task_id": "task-id"}
+    assert queued == [("Hello", [str(user_id)], {})]
+
+
+def test_broadcast_by_filter(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    queued: list[tuple[Any, ...]],
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/notifications/broadcast/",
+        headers=superuser_token_headers,
+        json={"message": "Hello", "is_active": True},
+    )
+    assert r.status_code == 202
+    assert queued == [("Hello", None, {"is_active": True})]
+
+
+def test_broadcast_ids_and_filter(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    queued: list[tuple[Any, ...]],
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/notifications/broadcast/",
+        headers=superuser_token_headers,
+        json={"message": "Hello", "user_ids": [], "is_active": True},
+    )
+    assert r.status_code == 400
+    assert queued == []
+
+
+def test_broadcast_requires_superuser(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    queued: list[tuple[Any, ...]],
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/notifications/broadcast/",
+        headers=normal_user_token_headers,
+        json={"message": "Hello"},
+    )
+    assert r.status_code == 403
+    assert queued == []
@@ -0,0 +1,14 @@
+from fastapi.testclient import TestClient
+
+from app.api.v1.endpoints.services import service_cache
+from app.core.config import settings
+
+
+def test_get_service(client: TestClient) -> None:
+    r = client.get(f"{settings.API_V1_STR}/services/service/42")
+    assert r.status_code == 200
+    assert r.json() == {"service_id": "42", "data": "Service Data"}
+    hits = service_cache.metrics.l1_hits.value
+    r = client.get(f"{settings.API_V1_STR}/services/service/42")
+    assert r.json() == {"service_id": "42", "data": "Service Data"}
+    assert service_cache.metrics.l1_hits.value == hits + 1
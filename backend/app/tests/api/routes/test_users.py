@@ -1,13 +1,15 @@
 import uuid
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlmodel import Session, col, delete, select, text
 
 from app import crud
 from app.core.config import settings
 from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.models import RowCount, User, UserAddress, UserCreate
+from app.tests.utils.user import user_authentication_headers
 from app.tests.utils.utils import random_email, random_lower_string
 
 
@@ -168,6 +170,55 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+    url = f"{settings.API_V1_STR}/users/"
+    r = client.get(url, headers=superuser_token_headers)
+    emails = [user["email"] for user in r.json()["data"]]
+    expected = db.exec(
+        select(User.email).order_by(User.email, User.id).limit(len(emails))
+    ).all()
+    assert emails == expected
+
+    r = client.get(url, headers=superuser_token_headers, params={"limit": 2})
+    first = r.json()
+    assert [user["email"] for user in first["data"]] == emails[:2]
+    r = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={"limit": 2, "cursor": first["next_cursor"]},
+    )
+    assert [user["email"] for user in r.json()["data"]] == emails[2:4]
+
+
+def test_retrieve_users_cached_count(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    url = f"{settings.API_V1_STR}/users/"
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    crud.create_user(session=db, user_create=user_in)
+    # Whole tables have no counter, creating a user writes no rowcount
+    assert db.get(RowCount, "user") is None
+
+    db.exec(text('ANALYZE "user"'))  # type: ignore[call-overload]
+    exact = client.get(url, headers=superuser_token_headers).json()["count"]
+    monkeypatch.setattr(settings, "LIST_COUNT_STRATEGY", "cached")
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.json()["count"] == exact
+
+    r = client.get(
+        url, headers=superuser_token_headers, params={"include_count": False}
+    )
+    assert r.json()["count"] is None
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -413,6 +464,50 @@ def test_delete_user_me(client: TestClient, db: Session) -> None:
     assert user_db is None
 
 
+def test_deleted_user_token_rejected(client: TestClient, db: Session) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=username, password=password)
+    crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+
+    # Authenticated once, so the user is served from the snapshot cache
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+    r = client.delete(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 404
+
+
+def test_deactivated_user_token_rejected(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    username = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=username, password=password)
+    user = crud.create_user(session=db, user_create=user_in)
+    headers = user_authentication_headers(
+        client=client, email=username, password=password
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Inactive user"
+
+
 def test_delete_user_me_as_superuser(
     client: TestClient, superuser_token_headers: dict[str, str]
 ) -> None:
@@ -484,3 +579,89 @@ def test_delete_user_without_privileges(
     )
     assert r.status_code == 403
     assert r.json()["detail"] == "The user doesn't have enough privileges"
+
+
+def test_read_users_nearby(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+) -> None:
+    # Either side of the antimeridian, away from other tests' addresses
+    places = {
+        "near": (-17.0, 179.99),
+        "across": (-17.0, -179.95),
+        "far": (-17.5, 179.0),
+    }
+    users = {}
+    for name, (latitude, longitude) in places.items():
+        user = crud.create_user(
+            session=db,
+            user_create=UserCreate(
+                email=random_email(), password=random_lower_string()
+            ),
+        )
+        users[name] = user.id
+        db.add(
+            UserAddress(
+                user_id=user.id,
+                address_line_1="1 Reef Road",
+                city="Suva",
+                state="Central",
+                country="Fiji",
+                postal_code="00000",
+                latitude=latitude,
+                longitude=longitude,
+            )
+        )
+    db.commit()
+    try:
+        addresses = db.exec(
+            select(UserAddress).where(col(UserAddress.user_id).in_(users.values()))
+        ).all()
+        assert all(
+            address.geohash and len(address.geohash) == 12 for address in addresses
+        )
+
+        url = f"{settings.API_V1_STR}/users/nearby"
+        r = client.get(
+            url,
+            headers=superuser_token_headers,
+            params={"latitude": -17.0, "longitude": 179.99, "radius_km": 20},
+        )
+        assert r.status_code == 200
+        data = r.json()["data"]
+        assert [item["id"] for item in data] == [
+            str(users["near"]),
+            str(users["across"]),
+        ]
+        assert data[0]["distance_km"] == pytest.approx(0, abs=1e-6)
+        assert data[1]["distance_km"] == pytest.approx(6.4, abs=0.1)
+
+        # Nearest neighbours widen the search until enough users are found
+        r = client.get(
+            url,
+            headers=superuser_token_headers,
+            params={"latitude": -17.5, "longitude": 179.01, "limit": 3},
+        )
+        assert [item["id"] for item in r.json()["data"]] == [
+            str(users["far"]),
+            str(users["near"]),
+            str(users["across"]),
+        ]
+
+        r = client.get(
+            url,
+            headers=superuser_token_headers,
+            params={"latitude": -17.0, "longitude": 179.99, "radius_km": 10_000},
+        )
+        assert r.status_code == 422
+        r = client.get(
+            url,
+            headers=normal_user_token_headers,
+            params={"latitude": -17.0, "longitude": 179.99},
+        )
+        assert r.status_code == 403
+    finally:
+        db.exec(delete(UserAddress).where(col(UserAddress.user_id).in_(users.values())))
+        db.commit()
@@ -0,0 +1,73 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_db_pool_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    pools = {stats["name"]: stats for stats in r.json()}
+    assert set(pools) == {"sync", "async"}
+    pool_size, max_overflow = settings.db_pool_limits
+    for stats in pools.values():
+        assert stats["pool_size"] == pool_size
+        assert stats["max_overflow"] == max_overflow
+        assert stats["wait_time"]["buckets"]["+Inf"] == stats["wait_time"]["count"]
+    # Logging in goes through the async engine
+    assert pools["async"]["wait_time"]["count"] > 0
+
+
+def test_db_pool_stats_normal_user(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/db-pool-stats/",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 403
+
+
+def test_password_hasher_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/password-hasher-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats["workers"] == settings.PASSWORD_HASHER_WORKERS
+    assert stats["in_flight"] == 0
+    # Logging in the superuser verified its password through the hasher
+    assert stats["latency"]["count"] > 0
+
+
+def test_cache_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    client.get(f"{settings.API_V1_STR}/services/service/stats")
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/cache-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    caches = {stats["namespace"]: stats for stats in r.json()}
+    assert caches["service"]["misses"] > 0
+
+
+def test_geoip_stats(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/geoip-stats/",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    stats = r.json()
+    assert stats["cache_by_network"] == settings.GEOIP_CACHE_BY_NETWORK
+    assert stats["misses"] == stats["latency"]["count"]
@@ -7,7 +7,16 @@ from sqlmodel import Session, delete
 from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
-from app.models import Item, User
+from app.models import (
+    Item,
+    Notification,
+    PaymentDailyRollup,
+    Record,
+    RecordDailyRollup,
+    RollupWatermark,
+    RowCount,
+    User,
+)
 from app.tests.utils.user import authentication_token_from_email
 from app.tests.utils.utils import get_superuser_token_headers
 
@@ -19,8 +28,16 @@ def db() -> Generator[Session, None, None]:
         yield session
         statement = delete(Item)
         session.execute(statement)
+        statement = delete(Notification)
+        session.execute(statement)
         statement = delete(User)
         session.execute(statement)
+        statement = delete(RowCount)
+        session.execute(statement)
+        statement = delete(Record)
+        session.execute(statement)
+        for model in (RecordDailyRollup, PaymentDailyRollup, RollupWatermark):
+            session.execute(delete(model))
         session.commit()
 
 
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from app.core import security
+from app.core.auth_cache import (
+    decode_access_token,
+    get_user_snapshot,
+    invalidate_user,
+    set_user_snapshot,
+    token_cache,
+)
+from app.models import User
+from app.services.cache import invalidate_tags
+
+
+def test_decode_access_token_is_cached() -> None:
+    token = security.create_access_token("subject", timedelta(minutes=5))
+    claims = decode_access_token(token)
+    assert claims["sub"] == "subject"
+    assert decode_access_token(token) is claims
+    assert len(token_cache) > 0
+
+
+def test_decode_access_token_rejects_invalid_token() -> None:
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_access_token("not-a-token")
+    expired = security.create_access_token("subject", timedelta(minutes=-1))
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_access_token(expired)
+
+
+def test_user_snapshot_round_trip() -> None:
+    user = User(email="snapshot@example.com", hashed_password="secret-hash")
+    set_user_snapshot(user)
+
+    cached = get_user_snapshot(str(user.id))
+    assert cached
+    assert cached.id == user.id
+    assert cached.email == user.email
+    assert "hashed_password" not in cached.__dict__
+
+    invalidate_user(user.id)
+    assert get_user_snapshot(str(user.id)) is None
+
+
+def test_user_snapshot_purged_by_cache_tag() -> None:
+    user = User(email="tagged@example.com", hashed_password="secret-hash")
+    set_user_snapshot(user)
+    # As published by another worker committing a change to the user
+    invalidate_tags(f"user:{user.id}")
+    assert get_user_snapshot(str(user.id)) is None
@@ -0,0 +1,83 @@
+import asyncio
+from collections.abc import Generator
+
+import pytest
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.core import cache_invalidation
+from app.core.config import settings
+from app.core.db import async_engine
+from app.models import ItemCreate, User, UserCreate, UserUpdate
+from app.services.cache import Cache
+from app.tests.utils.utils import random_email, random_lower_string
+
+
+@pytest.fixture
+def cache(monkeypatch: pytest.MonkeyPatch) -> Generator[Cache, None, None]:
+    monkeypatch.setattr(settings, "CACHE_REDIS_ENABLED", False)
+    yield Cache("test-invalidation")
+
+
+def test_commit_purges_user_tag(db: Session, cache: Cache) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    cache.set("profile", {"name": "old"}, tags=[f"user:{user.id}"])
+
+    crud.update_user(session=db, db_user=user, user_in=UserUpdate(full_name="New"))
+    assert cache.get("profile") is None
+
+
+def test_commit_purges_owner_items_tag(db: Session, cache: Cache) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    cache.set("items", [], tags=[f"items:owner:{user.id}"])
+
+    item_in = ItemCreate(title=random_lower_string())
+    item = crud.create_item(session=db, item_in=item_in, owner_id=user.id)
+    assert cache.get("items") is None
+
+    cache.set("items", [str(item.id)], tags=[f"items:owner:{user.id}"])
+    cache.set("item", str(item.id), tags=[f"item:{item.id}"])
+    crud.delete_user(session=db, db_user=user)
+    assert cache.get("items") is None
+    assert cache.get("item") is None
+
+
+def test_rollback_keeps_tags(db: Session, cache: Cache) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    cache.set("profile", {"name": "old"}, tags=[f"user:{user.id}"])
+
+    user.full_name = "Not saved"
+    db.add(user)
+    db.flush()
+    db.rollback()
+    assert cache.get("profile") == {"name": "old"}
+
+
+def test_async_commit_purges_off_the_loop(
+    db: Session, cache: Cache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user_in = UserCreate(email=random_email(), password=random_lower_string())
+    user = crud.create_user(session=db, user_create=user_in)
+    cache.set("profile", {"name": "old"}, tags=[f"user:{user.id}"])
+    blocking: list[tuple[str, ...]] = []
+    monkeypatch.setattr(
+        cache_invalidation, "invalidate_tags", lambda *tags: blocking.append(tags)
+    )
+
+    async def run() -> None:
+        async with AsyncSession(async_engine) as session:
+            async_user = await session.get(User, user.id)
+            assert async_user
+            async_user.full_name = "New"
+            session.add(async_user)
+            await session.commit()
+            await asyncio.gather(*cache_invalidation._pending)
+        await async_engine.dispose()
+
+    asyncio.run(run())
+    assert cache.get("profile") is None
+    assert blocking == []
@@ -0,0 +1,58 @@
+import math
+
+import pytest
+
+from app.core.geo import (
+    EARTH_RADIUS_KM,
+    bounding_box,
+    geohash_cover,
+    geohash_encode,
+    haversine_km,
+)
+
+
+def destination(
+    latitude: float, longitude: float, distance_km: float, bearing: float
+) -> tuple[float, float]:
+    angle = distance_km / EARTH_RADIUS_KM
+    phi, theta = math.radians(latitude), math.radians(bearing)
+    phi2 = math.asin(
+        math.sin(phi) * math.cos(angle)
+        + math.cos(phi) * math.sin(angle) * math.cos(theta)
+    )
+    delta = math.atan2(
+        math.sin(theta) * math.sin(angle) * math.cos(phi),
+        math.cos(angle) - math.sin(phi) * math.sin(phi2),
+    )
+    return math.degrees(phi2), (longitude + math.degrees(delta) + 540) % 360 - 180
+
+
+def test_geohash_encode() -> None:
+    assert geohash_encode(42.605, -5.603, 5) == "ezs42"
+    assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert len(geohash_encode(18.0, -76.8)) == 12
+
+
+def test_haversine_km() -> None:
+    # Kingston to Montego Bay
+    assert haversine_km(17.9714, -76.7931, 18.4762, -77.8939) == pytest.approx(
+        129.2, abs=0.5
+    )
+    assert haversine_km(0, 179.5, 0, -179.5) == pytest.approx(111.2, abs=0.1)
+    assert haversine_km(90, 0, -90, 0) == pytest.approx(20015.1, abs=0.1)
+
+
+@pytest.mark.parametrize(
+    "latitude, longitude, radius_km",
+    [(18.0, -76.8, 5), (-17.0, 179.99, 50), (-17.0, -179.99, 50), (89.9, 10, 30)],
+)
+def test_geohash_cover_holds_the_circle(
+    latitude: float, longitude: float, radius_km: float
+) -> None:
+    cover = geohash_cover(bounding_box(latitude, longitude, radius_km), max_cells=32)
+
+    assert 0 < len(cover) <= 32
+    for bearing in range(0, 360, 15):
+        edge = destination(latitude, longitude, radius_km * 0.999, bearing)
+        geohash = geohash_encode(*edge)
+        assert any(geohash.startswith(prefix) for prefix in cover)
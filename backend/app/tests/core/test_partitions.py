@@ -0,0 +1,144 @@
+import uuid
+from collections.abc import Generator
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import Connection, inspect, text
+
+from app.core.db import engine
+from app.core.partitions import (
+    add_months,
+    is_partitioned,
+    list_partitions,
+    maintain_table_partitions,
+    partition_table,
+    unpartition_table,
+)
+
+TABLE = "partitionprobe"
+
+
+def create_tables(connection: Connection) -> None:
+    # Referencing a table of its own: dropping the foreign key would wait
+    # for the other sessions reading the referenced table
+    connection.execute(text(f"CREATE TABLE {TABLE}owner (id uuid PRIMARY KEY)"))
+    connection.execute(
+        text(
+            f"CREATE TABLE {TABLE} ("
+            "id uuid PRIMARY KEY, "
+            "created_at timestamp NOT NULL, "
+            f"owner_id uuid REFERENCES {TABLE}owner (id), "
+            "data varchar(255))"
+        )
+    )
+    connection.execute(
+        text(f"CREATE INDEX ix_{TABLE}_created_at_id ON {TABLE} (created_at, id)")
+    )
+
+
+@pytest.fixture
+def connection() -> Generator[Connection, None, None]:
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        create_tables(connection)
+        yield connection
+        transaction.rollback()
+
+
+@pytest.fixture
+def autocommit_connection() -> Generator[Connection, None, None]:
+    # For the statements that can't run in a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        create_tables(connection)
+        try:
+            yield connection
+        finally:
+            connection.execute(text(f"DROP TABLE IF EXISTS {TABLE}, {TABLE}owner"))
+
+
+def insert_row(connection: Connection, created_at: datetime) -> None:
+    owner_id = uuid.uuid4()
+    connection.execute(text(f"INSERT INTO {TABLE}owner VALUES (:id)"), {"id": owner_id})
+    connection.execute(
+        text(f"INSERT INTO {TABLE} VALUES (:id, :created_at, :owner_id, 'x')"),
+        {"id": uuid.uuid4(), "created_at": created_at, "owner_id": owner_id},
+    )
+
+
+def test_add_months() -> None:
+    assert add_months(date(2026, 11, 1), 1) == date(2026, 12, 1)
+    assert add_months(date(2026, 12, 1), 1) == date(2027, 1, 1)
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+
+
+def test_partition_and_unpartition_table(connection: Connection) -> None:
+    insert_row(connection, datetime(2020, 5, 17))
+    insert_row(connection, datetime(2020, 7, 2))
+
+    partition_table(connection, TABLE, "created_at", months_ahead=2)
+
+    assert is_partitioned(connection, TABLE)
+    partitions = list_partitions(connection, TABLE)
+    current = date.today().replace(day=1)
+    assert min(partitions) == date(2020, 5, 1)
+    assert max(partitions) == add_months(current, 2)
+    assert connection.execute(text(f"SELECT count(*) FROM {TABLE}")).scalar() == 2
+    assert (
+        connection.execute(text(f"SELECT count(*) FROM {TABLE}_p2020_05")).scalar() == 1
+    )
+    inspector = inspect(connection)
+    assert inspector.get_pk_constraint(TABLE)["constrained_columns"] == [
+        "id",
+        "created_at",
+    ]
+    assert [fk["referred_table"] for fk in inspector.get_foreign_keys(TABLE)] == [
+        f"{TABLE}owner"
+    ]
+    assert {index["name"] for index in inspector.get_indexes(TABLE)} == {
+        f"ix_{TABLE}_created_at_id"
+    }
+
+    unpartition_table(connection, TABLE)
+
+    assert not is_partitioned(connection, TABLE)
+    assert list_partitions(connection, TABLE) == {}
+    assert connection.execute(text(f"SELECT count(*) FROM {TABLE}")).scalar() == 2
+    inspector = inspect(connection)
+    assert inspector.get_pk_constraint(TABLE)["constrained_columns"] == ["id"]
+    assert len(inspector.get_foreign_keys(TABLE)) == 1
+    assert {index["name"] for index in inspector.get_indexes(TABLE)} == {
+        f"ix_{TABLE}_created_at_id"
+    }
+
+
+def test_maintain_table_partitions(autocommit_connection: Connection) -> None:
+    connection = autocommit_connection
+    partition_table(connection, TABLE, "created_at", months_ahead=0)
+    today = date.today()
+    current = today.replace(day=1)
+    connection.execute(
+        text(
+            f"CREATE TABLE {TABLE}_p2020_01 PARTITION OF {TABLE} "
+            "FOR VALUES FROM ('2020-01-01') TO ('2020-02-01')"
+        )
+    )
+
+    created, dropped = maintain_table_partitions(
+        connection, TABLE, today=today, months_ahead=2, retention_days=365
+    )
+
+    assert created == [
+        f"{TABLE}_p{add_months(current, 1):%Y_%m}",
+        f"{TABLE}_p{add_months(current, 2):%Y_%m}",
+    ]
+    assert dropped == [f"{TABLE}_p2020_01"]
+    assert not inspect(connection).has_table(f"{TABLE}_p2020_01")
+    assert sorted(list_partitions(connection, TABLE)) == [
+        current,
+        add_months(current, 1),
+        add_months(current, 2),
+    ]
+    # Nothing left to do
+    assert maintain_table_partitions(
+        connection, TABLE, today=today, months_ahead=2, retention_days=365
+    ) == ([], [])
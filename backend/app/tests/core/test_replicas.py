@@ -0,0 +1,79 @@
+import asyncio
+from unittest.mock import patch
+
+from app.core.config import settings
+from app.core.replicas import ReplicaRouter
+
+URLS = [
+    "postgresql+psycopg://postgres@replica-1/app",
+    "postgresql+psycopg://postgres@replica-2/app",
+]
+
+
+def test_no_replicas_reads_from_primary() -> None:
+    router = ReplicaRouter([])
+    assert router.choose() is None
+    assert router.choose("some-user") is None
+
+
+def test_round_robin() -> None:
+    router = ReplicaRouter(URLS)
+    chosen = [router.choose() for _ in range(4)]
+    assert [replica.name for replica in chosen if replica] == [
+        "postgresql+psycopg://postgres@replica-1/app",
+        "postgresql+psycopg://postgres@replica-2/app",
+    ] * 2
+
+
+def test_least_connections() -> None:
+    router = ReplicaRouter(URLS, strategy="least_connections")
+    busy, idle = router.replicas
+    with (
+        patch.object(busy, "in_use", return_value=3),
+        patch.object(idle, "in_use", return_value=1),
+    ):
+        assert router.choose() is idle
+
+
+def test_ejected_replica_is_skipped() -> None:
+    router = ReplicaRouter(URLS, eject_seconds=60)
+    ejected, healthy = router.replicas
+    router.eject(ejected)
+    assert {router.choose() for _ in range(4)} == {healthy}
+    router.eject(healthy)
+    assert router.choose() is None
+
+
+def test_read_your_writes() -> None:
+    router = ReplicaRouter(URLS, read_your_writes_seconds=60)
+    with patch("app.core.replicas.redis_client") as redis_mock:
+        redis_mock.exists.return_value = 0
+        assert router.choose("writer") is not None
+        router.mark_write("writer")
+        assert router.choose("writer") is None
+        assert router.choose("someone-else") is not None
+        redis_mock.set.assert_called_once()
+
+
+def test_replica_pools() -> None:
+    router = ReplicaRouter(URLS)
+    pool_size, max_overflow = settings.db_pool_limits
+    stats = router.pool_stats()
+    assert [pool["name"] for pool in stats] == [
+        f"{url} {engine}" for url in URLS for engine in ("sync", "async")
+    ]
+    for pool in stats:
+        assert pool["pool_size"] == pool_size
+        assert pool["max_overflow"] == max_overflow
+    first, second = router.replicas
+    # Stats are kept per replica
+    assert first.pool_class.stats is not second.pool_class.stats
+
+    pools = [
+        (replica.engine.pool, replica.async_engine.pool) for replica in router.replicas
+    ]
+    asyncio.run(router.dispose())
+    # Disposing replaces the pools, closing their connections
+    for replica, (pool, async_pool) in zip(router.replicas, pools, strict=True):
+        assert replica.engine.pool is not pool
+        assert replica.async_engine.pool is not async_pool
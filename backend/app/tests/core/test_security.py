@@ -0,0 +1,30 @@
+import pytest
+
+from app.core.security import (
+    PasswordHasher,
+    PasswordHasherBusy,
+    get_password_hash,
+    verify_password,
+)
+
+
+def test_password_hash_round_trip() -> None:
+    hashed = get_password_hash("a-password")
+    assert verify_password("a-password", hashed)
+    assert not verify_password("another-password", hashed)
+
+
+def test_password_hasher_rejects_when_saturated() -> None:
+    hasher = PasswordHasher(workers=0, max_queue=1)
+    assert hasher.capacity == 2
+
+    def reenter(depth: int) -> int:
+        # Each nested call holds its slot while the next one is admitted
+        return depth if depth == hasher.capacity else hasher.run(reenter, depth + 1)
+
+    assert hasher.run(reenter, 1) == 2
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(hasher.run, reenter, 1)
+    assert hasher.rejected.value == 1
+    assert hasher.in_flight == 0
+    assert hasher.stats()["latency"]["count"] == 4
@@ -0,0 +1,52 @@
+import uuid
+
+from sqlmodel import Session, col, select
+
+from app import crud
+from app.models import Notification
+from app.tests.utils.user import create_random_user
+
+
+def test_create_notifications_skips_unknown_users(db: Session) -> None:
+    users = [create_random_user(db), create_random_user(db)]
+    unknown = uuid.uuid4()
+    created = crud.create_notifications(
+        session=db, user_ids=[users[0].id, unknown, users[1].id], message="Hello"
+    )
+    db.commit()
+
+    assert sorted(user_id for _, user_id in created) == sorted(u.id for u in users)
+    notifications = db.exec(
+        select(Notification).where(
+            col(Notification.id).in_(
+                [notification_id for notification_id, _ in created]
+            )
+        )
+    ).all()
+    assert {n.user_id for n in notifications} == {u.id for u in users}
+    assert all(n.message == "Hello" for n in notifications)
+
+
+def test_create_notifications_without_users(db: Session) -> None:
+    assert (
+        crud.create_notifications(session=db, user_ids=[uuid.uuid4()], message="Hello")
+        == []
+    )
+
+
+def test_iter_user_id_chunks(db: Session) -> None:
+    users = [create_random_user(db) for _ in range(3)]
+    chunks = list(crud.iter_user_id_chunks(session=db, chunk_size=2))
+
+    assert all(0 < len(chunk) <= 2 for chunk in chunks)
+    ids = [user_id for chunk in chunks for user_id in chunk]
+    assert ids == sorted(ids)
+    assert {u.id for u in users} <= set(ids)
+    superusers = {
+        user_id
+        for chunk in crud.iter_user_id_chunks(
+            session=db, chunk_size=2, is_superuser=True
+        )
+        for user_id in chunk
+    }
+    assert not superusers & {u.id for u in users}
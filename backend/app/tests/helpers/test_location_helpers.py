@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from app.core.geo import haversine_km
+from app.helpers import location_helpers
+from app.helpers.location_helpers import (
+    coordinates_array,
+    distance_matrix,
+    haversine,
+    iter_distance_matrix,
+    nearest_neighbours,
+)
+from app.models import UserAddress
+
+
+@pytest.fixture
+def points() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return np.column_stack([rng.uniform(10, 27, 300), rng.uniform(-85, -59, 300)])
+
+
+def test_coordinates_array() -> None:
+    addresses = [
+        UserAddress(latitude=18.02, longitude=-76.78),
+        UserAddress(latitude=None, longitude=None),
+    ]
+
+    coordinates = coordinates_array(addresses)
+
+    assert coordinates.shape == (2, 2)
+    assert coordinates[0].tolist() == [18.02, -76.78]
+    assert np.isnan(coordinates[1]).all()
+    assert coordinates_array([]).shape == (0, 2)
+
+
+def test_haversine_broadcasts(points: np.ndarray) -> None:
+    kingston = (17.9714, -76.7931)
+
+    distances = haversine(kingston, points)
+
+    assert distances.shape == (300,)
+    for point, distance in zip(points[:5], distances[:5], strict=True):
+        assert distance == pytest.approx(haversine_km(*kingston, *point))
+    assert np.allclose(haversine(points, points[::-1]), haversine(points[::-1], points))
+
+
+def test_distance_matrix_chunks(points: np.ndarray) -> None:
+    matrix = distance_matrix(points)
+
+    assert matrix.shape == (300, 300)
+    assert np.allclose(matrix, matrix.T)
+    assert np.allclose(np.diag(matrix), 0)
+    assert np.allclose(distance_matrix(points, chunk_size=7), matrix)
+    assert distance_matrix(points, points[:10], dtype=np.float32).dtype == np.float32
+    starts = [
+        start for start, _ in iter_distance_matrix(points, points, chunk_size=128)
+    ]
+    assert starts == [0, 128, 256]
+
+
+def test_distance_matrix_memory_bound(
+    points: np.ndarray, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(location_helpers, "DISTANCE_CHUNK_BYTES", 300 * 8 * 50)
+
+    blocks = [block.shape for _, block in iter_distance_matrix(points, points)]
+
+    assert blocks == [(50, 300)] * 6
+
+
+@pytest.mark.parametrize("use_ball_tree", [False, True])
+def test_nearest_neighbours(points: np.ndarray, use_ball_tree: bool) -> None:
+    if use_ball_tree and location_helpers.BallTree is None:
+        pytest.skip("scikit-learn is not installed")
+    candidates = points.copy()
+    candidates[3] = np.nan
+    queries = np.vstack([points[:20], [[np.nan, np.nan]]])
+
+    distances, indexes = nearest_neighbours(
+        queries, candidates, k=4, chunk_size=6, use_ball_tree=use_ball_tree
+    )
+
+    expected = distance_matrix(queries[:20], candidates)
+    expected[np.isnan(expected)] = np.inf
+    assert np.array_equal(indexes[:20], np.argsort(expected, axis=1)[:, :4])
+    assert np.allclose(distances[:20], np.sort(expected, axis=1)[:, :4])
+    assert 3 not in indexes
+    assert indexes[20].tolist() == [-1] * 4
+    assert np.isinf(distances[20]).all()
+
+
+def test_nearest_neighbours_errors(
+    points: np.ndarray, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    with pytest.raises(ValueError):
+        nearest_neighbours(points, points[:3], k=4)
+    monkeypatch.setattr(location_helpers, "BallTree", None)
+    with pytest.raises(RuntimeError):
+        nearest_neighbours(points, points, use_ball_tree=True)
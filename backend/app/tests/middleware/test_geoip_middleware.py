@@ -0,0 +1,85 @@
+from typing import Any
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from app.middleware import geoipMiddleware
+from app.middleware.geoipMiddleware import GeoIPMiddleware, get_location
+
+
+@pytest.fixture
+def lookups(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str | None, Any]]:
+    calls: list[tuple[str | None, Any]] = []
+
+    def get_user_location(ip_address: str | None, user: Any = None) -> dict:
+        calls.append((ip_address, user))
+        return {"source": "ip_address", "city": "Kingston"}
+
+    monkeypatch.setattr(geoipMiddleware, "get_user_location", get_user_location)
+    return calls
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(GeoIPMiddleware, include=["/geo/*"], exclude=["/geo/skip"])
+
+    @app.get("/geo/plain")
+    def plain() -> str:
+        return "ok"
+
+    @app.get("/geo/location")
+    def location(request: Request) -> Any:
+        request.state.user = "user"
+        # Looked up once
+        assert request.state.location == request.state.location
+        return request.state.location
+
+    @app.get("/geo/async")
+    async def location_async(request: Request) -> Any:
+        request.state.user = "user"
+        assert await get_location(request) == await get_location(request)
+        return await get_location(request)
+
+    @app.get("/geo/skip")
+    @app.get("/other")
+    def skipped(request: Request) -> Any:
+        return getattr(request.state, "location", "unavailable")
+
+    @app.get("/other/async")
+    async def skipped_async(request: Request) -> Any:
+        return await get_location(request)
+
+    return TestClient(app)
+
+
+def test_location_is_looked_up_when_read(
+    client: TestClient, lookups: list[tuple[str | None, Any]]
+) -> None:
+    assert client.get("/geo/plain").json() == "ok"
+    assert lookups == []
+
+    r = client.get("/geo/location")
+    assert r.json() == {"source": "ip_address", "city": "Kingston"}
+    # The user authenticated by the route is reused
+    assert lookups == [("testclient", "user")]
+
+
+@pytest.mark.parametrize("path", ["/geo/skip", "/other"])
+def test_location_outside_included_paths(
+    client: TestClient, lookups: list[tuple[str | None, Any]], path: str
+) -> None:
+    assert client.get(path).json() == "unavailable"
+    assert lookups == []
+
+
+def test_location_from_async_route(
+    client: TestClient, lookups: list[tuple[str | None, Any]]
+) -> None:
+    r = client.get("/geo/async")
+    assert r.json() == {"source": "ip_address", "city": "Kingston"}
+    assert lookups == [("testclient", "user")]
+
+    assert client.get("/other/async").json() is None
+    assert len(lookups) == 1
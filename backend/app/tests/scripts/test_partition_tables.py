@@ -0,0 +1,25 @@
+from typing import Any
+
+import pytest
+
+from app import partition_tables
+
+
+def test_main(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[tuple[str, Any]] = []
+    monkeypatch.setattr(partition_tables, "is_partitioned", lambda _c, _t: False)
+    monkeypatch.setattr(
+        partition_tables,
+        "partition_table",
+        lambda _c, table, column, months_ahead: calls.append((table, column)),
+    )
+
+    partition_tables.main(["partition", "--table", "record"])
+    assert calls == [("record", "created_at")]
+
+    calls.clear()
+    partition_tables.main(["unpartition"])
+    assert calls == []
+
+    with pytest.raises(SystemExit):
+        partition_tables.main(["partition", "--table", "user"])
@@ -0,0 +1,417 @@
+import asyncio
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+import redis
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import ServicePublic, User
+from app.services import cache as cache_module
+from app.services.cache import (
+    Cache,
+    JSONSerializer,
+    Serializer,
+    cached,
+    invalidate_tags,
+    on_invalidate,
+    tag_key,
+)
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.data: dict[str, bytes] = {}
+        self.round_trips = 0
+
+    def get(self, key: str) -> bytes | None:
+        return self.data.get(key)
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        px: int | None = None,  # noqa: ARG002
+        nx: bool = False,
+    ) -> bool:
+        if nx and key in self.data:
+            return False
+        self.data[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def eval(self, _script: str, _numkeys: int, key: str, token: str) -> int:
+        if self.data.get(key) == token.encode():
+            del self.data[key]
+            return 1
+        return 0
+
+    def delete(self, key: str) -> None:
+        self.data.pop(key, None)
+
+    def mget(self, keys: list[str]) -> list[bytes | None]:
+        self.round_trips += 1
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":  # noqa: ARG002
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, redis: FakeRedis) -> None:
+        self.redis = redis
+        self.commands: list[tuple[str, bytes]] = []
+
+    def set(self, key: str, value: bytes, px: int | None = None) -> None:  # noqa: ARG002
+        self.commands.append((key, value))
+
+    def execute(self) -> None:
+        self.redis.round_trips += 1
+        for key, value in self.commands:
+            self.redis.data[key] = value
+
+    async def __aenter__(self) -> "FakePipeline":
+        return self
+
+    async def __aexit__(self, *_args: Any) -> None:
+        pass
+
+
+class FakeAsyncRedis(FakeRedis):
+    async def get(self, key: str) -> bytes | None:  # type: ignore[override]
+        return super().get(key)
+
+    async def set(  # type: ignore[override]
+        self, key: str, value: bytes, px: int | None = None, nx: bool = False
+    ) -> bool:
+        return super().set(key, value, px, nx)
+
+    async def eval(self, *args: Any) -> int:  # type: ignore[override]
+        return super().eval(*args)
+
+    async def mget(self, keys: list[str]) -> list[bytes | None]:  # type: ignore[override]
+        return super().mget(keys)
+
+    def pipeline(self, transaction: bool = True) -> "FakeAsyncPipeline":  # type: ignore[override]  # noqa: ARG002
+        return FakeAsyncPipeline(self)
+
+
+class FakeAsyncPipeline(FakePipeline):
+    async def execute(self) -> None:  # type: ignore[override]
+        super().execute()
+
+
+@pytest.fixture
+def fake_redis(monkeypatch: pytest.MonkeyPatch) -> FakeRedis:
+    fake = FakeRedis()
+    fake_async = FakeAsyncRedis()
+    fake_async.data = fake.data
+    monkeypatch.setattr(cache_module, "cache_redis_client", fake)
+    monkeypatch.setattr(cache_module, "async_redis", SimpleNamespace(client=fake_async))
+    monkeypatch.setattr(cache_module, "_redis_down_until", 0.0)
+    monkeypatch.setattr(settings, "CACHE_REDIS_ENABLED", True)
+    return fake
+
+
+def test_namespaced_versioned_keys(fake_redis: FakeRedis) -> None:
+    Cache("test-keys", version=1).set("a", 1)
+    Cache("test-keys", version=2).set("a", 2)
+    assert set(fake_redis.data) == {
+        f"{settings.CACHE_KEY_PREFIX}:test-keys:v1:a",
+        f"{settings.CACHE_KEY_PREFIX}:test-keys:v2:a",
+    }
+    assert Cache("test-keys", version=2).get("a") == 2
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_l1_in_front_of_l2() -> None:
+    cache = Cache("test-tiers")
+    cache.set("key", {"value": 1})
+    assert cache.get("key") == {"value": 1}
+    assert cache.metrics.l1_hits.value == 1
+
+    cache.l1.clear()
+    assert cache.get("key") == {"value": 1}
+    assert cache.metrics.l2_hits.value == 1
+    # Promoted back into L1
+    assert cache.get("key") == {"value": 1}
+    assert cache.metrics.l1_hits.value == 2
+
+    cache.delete("key")
+    assert cache.get("key", "missing") == "missing"
+    assert cache.metrics.misses.value == 1
+    stats = cache.metrics.snapshot()
+    assert stats["hit_rate"] == pytest.approx(3 / 4)
+    assert stats["l2_latency"]["count"] > 0
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_typed_get() -> None:
+    cache = Cache("test-typed")
+    cache.set("service", ServicePublic(service_id="1", data="x"))
+    assert cache.get("service") == {"service_id": "1", "data": "x"}
+    assert cache.get("service", type_=ServicePublic) == ServicePublic(
+        service_id="1", data="x"
+    )
+
+
+def test_redis_errors_fall_back_to_l1(
+    fake_redis: FakeRedis, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def fail(*_args: Any, **_kwargs: Any) -> None:
+        raise redis.ConnectionError("down")
+
+    monkeypatch.setattr(fake_redis, "get", fail)
+    monkeypatch.setattr(fake_redis, "set", fail)
+    cache = Cache("test-errors")
+    assert cache.get("key") is None
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    # Redis is skipped after the first error
+    assert cache.metrics.errors.value == 1
+
+
+def test_cached_decorator(fake_redis: FakeRedis) -> None:
+    cache = Cache("test-decorator")
+    calls = []
+
+    @cached(cache)
+    def get_service(service_id: str, session: object = None) -> ServicePublic:  # noqa: ARG001
+        calls.append(service_id)
+        return ServicePublic(service_id=service_id, data="Service Data")
+
+    first = get_service("1", session=object())
+    assert get_service("1", session=object()) == first
+    assert calls == ["1"]
+    cache.l1.clear()
+    assert isinstance(get_service("1"), ServicePublic)
+    assert calls == ["1"]
+    assert (
+        f"{settings.CACHE_KEY_PREFIX}:test-decorator:v1:service_id=1" in fake_redis.data
+    )
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_cached_decorator_async() -> None:
+    cache = Cache("test-decorator-async")
+    calls = []
+
+    @cached(cache, key=lambda service_id: service_id)
+    async def get_service(service_id: str) -> ServicePublic:
+        calls.append(service_id)
+        return ServicePublic(service_id=service_id, data="Service Data")
+
+    async def run() -> None:
+        first = await get_service("1")
+        cache.l1.clear()
+        assert await get_service("1") == first
+        await get_service("2")
+
+    asyncio.run(run())
+    assert calls == ["1", "2"]
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_cached_decorator_refreshes_with_own_session(db: Session) -> None:
+    cache = Cache("test-decorator-refresh", beta=1000)
+    user = db.exec(select(User)).first()
+    assert user
+    sessions: list[Session] = []
+
+    @cached(cache)
+    def get_email(session: Session, user_id: uuid.UUID) -> str:
+        sessions.append(session)
+        email = session.exec(select(User.email).where(User.id == user_id)).one()
+        # Fails if the session was closed or is used from another thread
+        assert session.in_transaction()
+        return email
+
+    # Slow to compute and close to expiry, XFetch refreshes it right away
+    cache.set(f"user_id={user.id}", "old", ttl=1, delta=1)
+    with Session(engine) as session:
+        assert get_email(session, user.id) == "old"
+    deadline = time.monotonic() + 5
+    while cache.get(f"user_id={user.id}") != user.email and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get(f"user_id={user.id}") == user.email
+    assert len(sessions) == 1
+    assert sessions[0] is not session
+    assert not sessions[0].in_transaction()
+
+    # Other ignored arguments can't be reopened, no early refresh
+    cache.set(f"user_id={user.id}", "old", ttl=1, delta=1)
+    assert get_email(object(), user.id) == "old"  # type: ignore[arg-type]
+    assert cache.metrics.early_refreshes.value == 1
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_get_or_set_single_flight() -> None:
+    cache = Cache("test-single-flight")
+    calls = []
+    release = threading.Event()
+
+    def loader() -> str:
+        calls.append(1)
+        release.wait(5)
+        return "value"
+
+    results: list[str] = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_set("key", loader)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert cache.metrics.coalesced.value == 7
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_get_or_set_async_single_flight() -> None:
+    cache = Cache("test-single-flight-async")
+    calls = []
+
+    async def loader() -> str:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def run() -> list[str]:
+        return await asyncio.gather(
+            *(cache.get_or_set_async("key", loader) for _ in range(5))
+        )
+
+    assert asyncio.run(run()) == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.metrics.coalesced.value == 4
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_get_or_set_early_refresh() -> None:
+    cache = Cache("test-early-refresh", beta=1000)
+    # Slow to compute and close to expiry, XFetch refreshes it right away
+    cache.set("key", "old", ttl=1, delta=1)
+    assert cache.get_or_set("key", lambda: "new") == "old"
+    assert cache.metrics.early_refreshes.value == 1
+    deadline = time.monotonic() + 5
+    while cache.get("key") != "new" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get("key") == "new"
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_get_or_set_async_early_refresh() -> None:
+    cache = Cache("test-early-refresh-async", beta=1000)
+
+    async def loader() -> str:
+        return "new"
+
+    async def run() -> None:
+        await cache.set_async("key", "old", ttl=1, delta=1)
+        assert await cache.get_or_set_async("key", loader) == "old"
+        await asyncio.gather(*cache._background)
+        assert await cache.get_async("key") == "new"
+
+    asyncio.run(run())
+    assert cache.metrics.early_refreshes.value == 1
+
+
+def test_get_or_set_waits_for_lock_holder(fake_redis: FakeRedis) -> None:
+    cache = Cache("test-lock", lock=True)
+    full_key = cache.make_key("key")
+    # Another worker is loading the key
+    fake_redis.data[f"lock:{full_key}"] = b"other-worker"
+
+    def other_worker() -> None:
+        time.sleep(0.05)
+        entry = ["theirs", 0.0, time.time() + 60]
+        fake_redis.data[full_key] = cache.serializer.dumps(entry)
+
+    threading.Thread(target=other_worker).start()
+    assert cache.get_or_set("key", lambda: "ours") == "theirs"
+    assert cache.metrics.coalesced.value == 1
+
+
+def test_get_or_set_releases_lock(fake_redis: FakeRedis) -> None:
+    cache = Cache("test-lock-release", lock=True)
+    assert cache.get_or_set("key", lambda: "value") == "value"
+    assert f"lock:{cache.make_key('key')}" not in fake_redis.data
+    assert cache.get("key") == "value"
+
+
+def test_get_many_and_set_many(fake_redis: FakeRedis) -> None:
+    cache = Cache("test-many")
+    cache.set_many({"a": 1, "b": 2, "c": 3})
+    assert fake_redis.round_trips == 1
+    cache.l1.clear()
+    cache.set("a", 10)
+    assert cache.get_many(["a", "b", "c", "d"]) == {"a": 10, "b": 2, "c": 3}
+    # "a" came from L1, the rest in a single MGET
+    assert fake_redis.round_trips == 2
+    assert cache.metrics.misses.value == 1
+
+
+@pytest.mark.usefixtures("fake_redis")
+def test_get_many_and_set_many_async() -> None:
+    cache = Cache("test-many-async")
+
+    async def run() -> dict[str, Any]:
+        await cache.set_many_async({"a": 1, "b": 2})
+        cache.l1.clear()
+        return await cache.get_many_async(["a", "b", "c"])
+
+    assert asyncio.run(run()) == {"a": 1, "b": 2}
+    assert cache_module.async_redis.client.round_trips == 2
+
+
+def test_invalidate_tags_purges_l1(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "CACHE_REDIS_ENABLED", False)
+    users = Cache("test-tags-users")
+    items = Cache("test-tags-items")
+    users.set("1", "user 1", tags=["user:1"])
+    users.set("2", "user 2", tags=["user:2"])
+    items.set("1", ["item"], tags=["user:1", "items:owner:1"])
+    purged: list[Any] = []
+    on_invalidate(purged.append)
+
+    invalidate_tags("user:1")
+    assert users.get("1") is None
+    assert items.get("1") is None
+    assert users.get("2") == "user 2"
+    assert purged[-1] == ("user:1",)
+
+
+def test_tagged_set_indexes_tags_in_redis(fake_redis: FakeRedis) -> None:
+    calls: list[tuple[Any, ...]] = []
+    original_pipeline = fake_redis.pipeline
+
+    def pipeline(transaction: bool = True) -> FakePipeline:
+        pipe = original_pipeline(transaction)
+        pipe.eval = lambda *args: calls.append(args)  # type: ignore[attr-defined]
+        return pipe
+
+    fake_redis.pipeline = pipeline  # type: ignore[method-assign]
+    cache = Cache("test-tags-redis")
+    cache.set("key", "value", ttl=60, tags=["user:1", "user:2"])
+    assert cache.make_key("key") in fake_redis.data
+    assert [call[2] for call in calls] == [tag_key("user:1"), tag_key("user:2")]
+    assert all(call[3] == cache.make_key("key") for call in calls)
+
+
+def test_serializer_requires_both_methods() -> None:
+    class DumpsOnly(Serializer):
+        def dumps(self, value: Any) -> bytes:
+            return b""
+
+    with pytest.raises(TypeError):
+        DumpsOnly()  # type: ignore[abstract]
+    assert JSONSerializer().loads(JSONSerializer().dumps({"a": [1]})) == {"a": [1]}
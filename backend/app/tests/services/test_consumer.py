@@ -0,0 +1,230 @@
+import asyncio
+from typing import Any
+
+import aio_pika
+import pytest
+
+from app.core.config import settings
+from app.services.consumer import (
+    RETRY_HEADER,
+    ROUTING_KEY_HEADER,
+    ConsumerRunner,
+)
+
+
+class FakeMessage:
+    def __init__(
+        self,
+        body: bytes,
+        routing_key: str = "jobs",
+        headers: dict[str, Any] | None = None,
+    ) -> None:
+        self.body = body
+        self.routing_key = routing_key
+        self.headers = headers or {}
+        self.acked = False
+        self.requeued = False
+
+    async def ack(self) -> None:
+        self.acked = True
+
+    async def nack(self, requeue: bool = True) -> None:
+        self.requeued = requeue
+
+
+class FakePublisher:
+    def __init__(self) -> None:
+        self.declared: dict[str, dict[str, Any]] = {}
+        self.published: list[tuple[str, bytes, dict[str, Any]]] = []
+        self.closed = False
+
+    async def declare_queue(self, name: str, **kwargs: Any) -> None:
+        self.declared[name] = kwargs
+
+    async def publish_async(
+        self, routing_key: str, body: bytes, *, headers: dict[str, Any]
+    ) -> None:
+        self.published.append((routing_key, body, headers))
+
+    async def close_async(self) -> None:
+        self.closed = True
+
+
+class FakeQueue:
+    def __init__(self) -> None:
+        self.deliver: Any = None
+        self.cancelled = False
+
+    async def consume(self, callback: Any) -> str:
+        self.deliver = callback
+        return "ctag"
+
+    async def cancel(self, _consumer_tag: str) -> None:
+        self.cancelled = True
+
+
+class FakeChannel:
+    def __init__(self, queue: FakeQueue) -> None:
+        self.queue = queue
+        self.prefetch_count: int | None = None
+
+    async def set_qos(self, prefetch_count: int) -> None:
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(self, _name: str, **_kwargs: Any) -> FakeQueue:
+        return self.queue
+
+    async def close(self) -> None:
+        pass
+
+
+class FakeConnection:
+    def __init__(self) -> None:
+        self.queue = FakeQueue()
+        self.channel_ = FakeChannel(self.queue)
+
+    async def channel(self) -> FakeChannel:
+        return self.channel_
+
+    async def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def publisher() -> FakePublisher:
+    return FakePublisher()
+
+
+@pytest.fixture
+def runner(publisher: FakePublisher) -> ConsumerRunner:
+    return ConsumerRunner("amqp://test", publisher=publisher)  # type: ignore[arg-type]
+
+
+def test_handlers_are_resolved_by_routing_key(runner: ConsumerRunner) -> None:
+    @runner.handler("events", routing_key="user.created", exchange="app")
+    async def on_created(_message: Any) -> None:
+        pass
+
+    @runner.handler("events")
+    async def on_other(_message: Any) -> None:
+        pass
+
+    subscription = runner.subscriptions["events"]
+    assert subscription.resolve("user.created") is on_created
+    assert subscription.resolve("user.deleted") is on_other
+    assert subscription.bindings == [
+        ("app", aio_pika.ExchangeType.DIRECT, "user.created")
+    ]
+    with pytest.raises(ValueError):
+        runner.handler("events")(on_other)
+
+
+def test_processed_message_is_acked(runner: ConsumerRunner) -> None:
+    received = []
+
+    @runner.handler("jobs")
+    async def handle(message: Any) -> None:
+        received.append(message.body)
+
+    message = FakeMessage(b"hello")
+    asyncio.run(runner.process(runner.subscriptions["jobs"], message))  # type: ignore[arg-type]
+
+    assert received == [b"hello"]
+    assert message.acked
+    assert runner.metrics["jobs"].processed.value == 1
+
+
+def test_failed_message_goes_to_retry_queue(
+    runner: ConsumerRunner, publisher: FakePublisher, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RABBITMQ_RETRY_DELAYS_SECONDS", [5, 30])
+
+    @runner.handler("jobs")
+    async def handle(_message: Any) -> None:
+        raise RuntimeError("boom")
+
+    message = FakeMessage(b"work", routing_key="jobs")
+    asyncio.run(runner.process(runner.subscriptions["jobs"], message))  # type: ignore[arg-type]
+
+    assert message.acked
+    assert publisher.declared["jobs.retry.5s"] == {
+        "arguments": {
+            "x-message-ttl": 5000,
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": "jobs",
+        }
+    }
+    assert publisher.published == [
+        ("jobs.retry.5s", b"work", {RETRY_HEADER: 1, ROUTING_KEY_HEADER: "jobs"})
+    ]
+    metrics = runner.metrics["jobs"]
+    assert (metrics.failed.value, metrics.retried.value) == (1, 1)
+
+
+def test_exhausted_retries_are_dead_lettered(
+    runner: ConsumerRunner, publisher: FakePublisher, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RABBITMQ_RETRY_DELAYS_SECONDS", [5, 30])
+    handled = []
+
+    @runner.handler("jobs", routing_key="job.run")
+    async def handle(message: Any) -> None:
+        handled.append(message.body)
+        raise RuntimeError("boom")
+
+    # Back from the last retry queue, through the default exchange
+    message = FakeMessage(
+        b"work",
+        routing_key="jobs",
+        headers={RETRY_HEADER: 2, ROUTING_KEY_HEADER: "job.run"},
+    )
+    asyncio.run(runner.process(runner.subscriptions["jobs"], message))  # type: ignore[arg-type]
+
+    assert handled == [b"work"]
+    assert message.acked
+    assert [target for target, _, _ in publisher.published] == ["jobs.dead"]
+    assert runner.metrics["jobs"].dead_lettered.value == 1
+
+
+def test_run_handles_concurrently_and_drains_on_stop(
+    runner: ConsumerRunner,
+    publisher: FakePublisher,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    connection = FakeConnection()
+
+    async def connect_robust(_url: str) -> FakeConnection:
+        return connection
+
+    monkeypatch.setattr(aio_pika, "connect_robust", connect_robust)
+    monkeypatch.setattr(settings, "RABBITMQ_PREFETCH_COUNT", 8)
+    active = 0
+    peak = 0
+
+    @runner.handler("jobs", concurrency=4)
+    async def handle(_message: Any) -> None:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+
+    messages = [FakeMessage(str(i).encode()) for i in range(8)]
+
+    async def scenario() -> None:
+        task = asyncio.create_task(runner.run())
+        while connection.queue.deliver is None:
+            await asyncio.sleep(0)
+        for message in messages:
+            await connection.queue.deliver(message)
+        runner.stop()
+        await task
+
+    asyncio.run(scenario())
+
+    assert connection.channel_.prefetch_count == 8
+    assert connection.queue.cancelled
+    assert all(message.acked for message in messages)
+    assert peak == 4
+    assert publisher.closed
+    assert runner.metrics["jobs"].processed.value == 8
@@ -0,0 +1,272 @@
+import os
+from pathlib import Path
+from typing import Any
+
+import geoip2.database
+import maxminddb
+import pytest
+import requests
+from sqlmodel import Session, col, delete
+
+from app.core.config import settings
+from app.helpers.location_helpers import get_user_location
+from app.models import User, UserAddress
+from app.services import geoip_service
+from app.services.geoip_service import (
+    GeocodingError,
+    GeocodingRateLimited,
+    GeoIPReader,
+    IPLocation,
+    cache_key,
+    geocode_address,
+    lookup_many,
+    normalize_address,
+)
+from app.tests.utils.geoip import FakeReader
+from app.tests.utils.user import create_random_user
+
+
+@pytest.fixture
+def database(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    FakeReader.opened = []
+    monkeypatch.setattr(geoip2.database, "Reader", FakeReader)
+    path = tmp_path / "GeoLite2-City.mmdb"
+    path.write_text("Kingston")
+    return path
+
+
+def test_cache_key() -> None:
+    assert cache_key("203.0.113.7") == "203.0.113.7"
+    assert cache_key("203.0.113.7", by_network=True) == "203.0.113.0/24"
+    assert cache_key("2001:DB8:1:2::1", by_network=True) == "2001:db8:1::/48"
+    with pytest.raises(ValueError):
+        cache_key("not an address")
+
+
+def test_lookup_opens_once_and_caches(database: Path) -> None:
+    reader = GeoIPReader(str(database), cache_size=10, reload_check_seconds=60)
+
+    first = reader.lookup("203.0.113.7")
+    assert first is not None
+    assert first["city"] == "Kingston"
+    assert first["country_iso_code"] == "JM"
+    # Callers get their own copy
+    first["city"] = "changed"
+    assert reader.lookup("203.0.113.7")["city"] == "Kingston"  # type: ignore[index]
+    # Unknown addresses are cached too
+    assert reader.lookup("10.0.0.1") is None
+    assert reader.lookup("10.0.0.1") is None
+
+    assert FakeReader.opened == [(str(database), maxminddb.MODE_MMAP)]
+    assert reader._reader.lookups == ["203.0.113.7", "10.0.0.1"]  # type: ignore[union-attr]
+    stats: dict[str, Any] = reader.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_rate"] == 0.5
+    assert stats["latency"]["count"] == 2
+
+
+def test_lookup_by_network(database: Path) -> None:
+    reader = GeoIPReader(str(database), cache_by_network=True)
+
+    reader.lookup("203.0.113.7")
+    reader.lookup("203.0.113.200")
+    reader.lookup("203.0.114.1")
+
+    assert reader.stats()["hits"] == 1
+    assert reader.stats()["cache_size"] == 2
+
+
+def test_lookup_reloads_replaced_database(database: Path) -> None:
+    reader = GeoIPReader(str(database), reload_check_seconds=0)
+    assert reader.lookup("203.0.113.7")["city"] == "Kingston"  # type: ignore[index]
+
+    replacement = database.with_name("GeoLite2-City.mmdb.new")
+    replacement.write_text("Montego Bay")
+    os.replace(replacement, database)
+
+    assert reader.lookup("203.0.113.7")["city"] == "Montego Bay"  # type: ignore[index]
+    assert reader.stats()["reloads"] == 1
+    assert len(FakeReader.opened) == 2
+
+
+def test_lookup_keeps_database_while_replaced(database: Path) -> None:
+    reader = GeoIPReader(str(database), reload_check_seconds=0)
+    reader.lookup("203.0.113.7")
+    database.unlink()
+
+    assert reader.lookup("203.0.113.8")["city"] == "Kingston"  # type: ignore[index]
+    assert reader.stats()["reloads"] == 0
+
+
+def test_get_location_by_ip_handles_errors(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        geoip_service, "geoip_reader", GeoIPReader(str(tmp_path / "missing.mmdb"))
+    )
+
+    assert geoip_service.get_location_by_ip("203.0.113.7") is None
+    assert geoip_service.get_location_by_ip("not an address") is None
+
+
+def test_lookup_many_dedupes_in_order(
+    database: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(geoip_service, "geoip_reader", GeoIPReader(str(database)))
+    ip_addresses = ["203.0.113.7", " 203.0.113.7", "", "10.0.0.1", "bad", "203.0.113.8"]
+
+    results = list(lookup_many(ip_addresses, workers=0, chunk_size=2))
+
+    assert [result.ip for result in results] == [
+        "203.0.113.7",
+        "10.0.0.1",
+        "bad",
+        "203.0.113.8",
+    ]
+    assert results[0].location["city"] == "Kingston"  # type: ignore[index]
+    assert results[1] == IPLocation("10.0.0.1", None)
+    assert results[2] == IPLocation("bad", None, "invalid address")
+
+
+def test_lookup_many_in_processes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Read by the spawned workers, which have no database to open
+    monkeypatch.setenv("GEOIP_DB_PATH", str(tmp_path / "missing.mmdb"))
+    ip_addresses = [f"203.0.113.{i}" for i in range(10)]
+    try:
+        results = list(lookup_many(ip_addresses, workers=2, chunk_size=1))
+    finally:
+        geoip_service.shutdown_batch_lookups()
+
+    assert [result.ip for result in results] == ip_addresses
+    assert all(result.location is None and result.error for result in results)
+
+
+ADDRESS = {
+    "address_line_1": "1 Hope Road",
+    "address_line_2": None,
+    "city": "Kingston",
+    "state": "St. Andrew",
+    "country": "Jamaica",
+    "postal_code": "JMAAW06",
+}
+
+
+def test_normalize_address() -> None:
+    assert (
+        normalize_address(ADDRESS)
+        == "1 hope road, kingston, st. andrew, jamaica, jmaaw06"
+    )
+    assert normalize_address(
+        {**ADDRESS, "address_line_1": "  1  HOPE Road ", "address_line_2": ""}
+    ) == normalize_address(ADDRESS)
+
+
+class FakeResponse:
+    def __init__(self, data: dict[str, Any]) -> None:
+        self.data = data
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self) -> dict[str, Any]:
+        return self.data
+
+
+@pytest.mark.parametrize(
+    "data, expected",
+    [
+        (
+            {
+                "status": "OK",
+                "results": [
+                    {
+                        "geometry": {"location": {"lat": 18.02, "lng": -76.78}},
+                        "formatted_address": "1 Hope Rd, Kingston, Jamaica",
+                    }
+                ],
+            },
+            {
+                "latitude": 18.02,
+                "longitude": -76.78,
+                "formatted_address": "1 Hope Rd, Kingston, Jamaica",
+            },
+        ),
+        ({"status": "ZERO_RESULTS", "results": []}, None),
+    ],
+)
+def test_geocode_address(
+    monkeypatch: pytest.MonkeyPatch, data: dict[str, Any], expected: dict | None
+) -> None:
+    calls: list[dict[str, Any]] = []
+
+    def get(_url: str, **kwargs: Any) -> FakeResponse:
+        calls.append(kwargs)
+        return FakeResponse(data)
+
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", "key")
+    monkeypatch.setattr(requests, "get", get)
+
+    assert geocode_address(ADDRESS) == expected
+    assert calls[0]["timeout"] == settings.GEOCODING_TIMEOUT_SECONDS
+    assert calls[0]["params"]["address"] == (
+        "1 Hope Road, Kingston, St. Andrew, Jamaica, JMAAW06"
+    )
+
+
+def test_geocode_address_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", "key")
+    monkeypatch.setattr(
+        requests, "get", lambda *_, **__: FakeResponse({"status": "OVER_QUERY_LIMIT"})
+    )
+    with pytest.raises(GeocodingRateLimited):
+        geocode_address(ADDRESS)
+
+    def timeout(*_args: Any, **_kwargs: Any) -> FakeResponse:
+        raise requests.Timeout("timed out")
+
+    monkeypatch.setattr(requests, "get", timeout)
+    with pytest.raises(GeocodingError):
+        geocode_address(ADDRESS)
+
+
+def test_get_user_location_never_geocodes(
+    database: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(geoip_service, "geoip_reader", GeoIPReader(str(database)))
+    monkeypatch.setattr(requests, "get", None)
+    user = User(email="geo@example.com", hashed_password="x")
+    address = UserAddress(**{**ADDRESS, "address_line_2": None}, user_id=user.id)
+    user.addresses = [address]
+
+    # Not geocoded yet: located by IP
+    location = get_user_location("203.0.113.7", user)
+    assert location is not None
+    assert location["source"] == "ip_address"
+
+    address.latitude, address.longitude = 18.02, -76.78
+    assert get_user_location("203.0.113.7", user) == {
+        "latitude": 18.02,
+        "longitude": -76.78,
+        "source": "user_address",
+    }
+
+
+def test_get_user_location_of_unloaded_addresses(db: Session) -> None:
+    user = create_random_user(db)
+    db.add(UserAddress(**ADDRESS, user_id=user.id, latitude=18.02, longitude=-76.78))
+    db.commit()
+    try:
+        with Session(db.get_bind()) as session:
+            fresh = session.get(User, user.id)
+            assert fresh is not None
+            location = get_user_location(None, fresh)
+        assert location == {
+            "latitude": 18.02,
+            "longitude": -76.78,
+            "source": "user_address",
+        }
+    finally:
+        db.execute(delete(UserAddress).where(col(UserAddress.user_id) == user.id))
+        db.commit()
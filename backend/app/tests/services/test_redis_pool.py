@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+import pytest
+import redis.asyncio
+
+from app.core.config import settings
+from app.services import redis_pool
+from app.services.redis_pool import AsyncRedisPool
+
+
+def test_async_redis_pool_lifecycle() -> None:
+    pool = AsyncRedisPool()
+
+    async def run() -> None:
+        await pool.open()
+        client = pool.client
+        assert pool.client is client
+        assert client.connection_pool.max_connections == settings.REDIS_MAX_CONNECTIONS
+        await pool.close()
+        assert pool.client is not client
+
+    asyncio.run(run())
+
+
+def test_async_redis_pool_per_event_loop() -> None:
+    pool = AsyncRedisPool()
+
+    async def get_client() -> object:
+        return pool.client
+
+    assert asyncio.run(get_client()) is not asyncio.run(get_client())
+
+
+def test_async_redis_pool_client_per_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    closed: list[object] = []
+    close_client = redis_pool._close_client
+
+    async def record_close(client: redis.asyncio.Redis) -> None:
+        closed.append(client)
+        await close_client(client)
+
+    monkeypatch.setattr(redis_pool, "_close_client", record_close)
+    pool = AsyncRedisPool()
+
+    async def get_client() -> object:
+        return pool.client
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        serving = asyncio.run_coroutine_threadsafe(get_client(), loop).result()
+        other = asyncio.run(get_client())
+        # Closed when its loop shut down, the other loop's is untouched
+        assert closed == [other]
+        assert asyncio.run_coroutine_threadsafe(get_client(), loop).result() is serving
+        asyncio.run_coroutine_threadsafe(pool.close(), loop).result()
+        assert closed == [other, serving]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
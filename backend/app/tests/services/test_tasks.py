@@ -0,0 +1,454 @@
+import csv
+import json
+import os
+import uuid
+from collections.abc import Generator, Sequence
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlmodel import Session, col, delete, func, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.helpers import task_helpers
+from app.helpers.rollup_helpers import get_daily_summary_db, refresh_rollups_db
+from app.helpers.task_helpers import (
+    CleanupProgress,
+    GeocodingProgress,
+    cleanup_old_records_db,
+    generate_report_db,
+    geocode_user_addresses_db,
+    prune_report_files,
+)
+from app.models import (
+    GeocodeCache,
+    Payment,
+    PaymentDailyRollup,
+    PaymentStatus,
+    Record,
+    RecordDailyRollup,
+    RecordType,
+    RollupWatermark,
+    UserAddress,
+)
+from app.services import tasks
+from app.services.geoip_service import GeocodingError, normalize_address
+from app.tests.utils.user import create_random_user
+
+# Far enough in the past not to touch records of other tests
+CUTOFF = datetime(2000, 1, 1)
+
+
+@pytest.fixture
+def old_records(db: Session) -> Generator[list[tuple[datetime, uuid.UUID]], None, None]:
+    """(created_at, id) of seven records before the cutoff, one after it."""
+    records = [
+        Record(record_type=RecordType.TYPE_A, created_at=CUTOFF - timedelta(days=i))
+        for i in range(1, 8)
+    ] + [Record(record_type=RecordType.TYPE_B, created_at=CUTOFF + timedelta(days=1))]
+    keys = [(record.created_at, record.id) for record in records]
+    db.add_all(records)
+    db.commit()
+    yield keys
+    db.execute(delete(Record).where(col(Record.id).in_([id for _, id in keys])))
+    db.commit()
+
+
+def count_before_cutoff(db: Session) -> int:
+    statement = select(func.count()).where(col(Record.created_at) < CUTOFF)
+    return db.exec(statement).one()
+
+
+def test_broadcast_notification_task(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    published: list[tuple[str, list[str]]] = []
+
+    def publish_many(routing_key: str, bodies: list[str]) -> int:
+        published.append((routing_key, list(bodies)))
+        return len(bodies)
+
+    monkeypatch.setattr(tasks.publisher, "publish_many", publish_many)
+    monkeypatch.setattr(settings, "NOTIFICATION_BROADCAST_CHUNK_SIZE", 2)
+    users = [create_random_user(db) for _ in range(3)]
+    user_ids = [str(u.id) for u in users] + [str(uuid.uuid4()), str(users[0].id)]
+
+    result: dict[str, Any] = tasks.broadcast_notification_task(
+        "Maintenance tonight", user_ids
+    )
+
+    assert result == {
+        "status": "broadcast_sent",
+        "notified": 3,
+        "skipped": 1,
+        "unpublished": 0,
+    }
+    # Duplicates dropped, chunks of two
+    assert [len(bodies) for _, bodies in published] == [2, 1]
+    messages = [json.loads(body) for _, bodies in published for body in bodies]
+    assert {m["user_id"] for m in messages} == {str(u.id) for u in users}
+    assert {m["message"] for m in messages} == {"Maintenance tonight"}
+
+
+@pytest.mark.usefixtures("old_records")
+def test_cleanup_old_records_in_chunks(db: Session) -> None:
+    reports: list[CleanupProgress] = []
+    progress = cleanup_old_records_db(
+        CUTOFF, batch_size=3, sleep_seconds=0, on_progress=reports.append
+    )
+
+    assert progress.deleted == 7
+    assert progress.done
+    assert [report.deleted for report in reports] == [3, 6, 7]
+    assert count_before_cutoff(db) == 0
+    assert db.exec(select(func.count()).select_from(Record)).one() == 1
+
+
+def test_cleanup_old_records_resumes(
+    db: Session, old_records: list[tuple[datetime, uuid.UUID]]
+) -> None:
+    first = cleanup_old_records_db(CUTOFF, batch_size=3, sleep_seconds=0, max_seconds=0)
+
+    assert (first.deleted, first.done) == (3, False)
+    assert first.checkpoint == sorted(old_records)[2]
+
+    rest = cleanup_old_records_db(
+        CUTOFF, resume_after=first.checkpoint, batch_size=3, sleep_seconds=0
+    )
+    assert (rest.deleted, rest.done) == (4, True)
+    assert count_before_cutoff(db) == 0
+
+
+@pytest.mark.usefixtures("old_records")
+def test_cleanup_old_records_task_continues(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORD_CLEANUP_BATCH_SIZE", 5)
+    monkeypatch.setattr(settings, "RECORD_CLEANUP_MAX_SECONDS", 0)
+    queued: list[dict[str, Any]] = []
+    monkeypatch.setattr(
+        tasks.cleanup_old_records,
+        "apply_async",
+        lambda kwargs: queued.append(kwargs),
+    )
+
+    result = tasks.cleanup_old_records(cutoff=CUTOFF.isoformat())
+
+    assert result == {"status": "resumed", "deleted": 5, "cutoff": CUTOFF.isoformat()}
+    assert len(queued) == 1
+    assert queued[0]["cutoff"] == CUTOFF.isoformat()
+
+    result = tasks.cleanup_old_records(**queued[0])
+    assert result["status"] == "done"
+    assert result["deleted"] == 2
+    assert count_before_cutoff(db) == 0
+
+
+def test_generate_report_db_csv(
+    old_records: list[tuple[datetime, uuid.UUID]], tmp_path: Path
+) -> None:
+    report = generate_report_db(
+        CUTOFF - timedelta(days=30), CUTOFF, format="csv", directory=str(tmp_path)
+    )
+
+    assert report.rows == 7
+    assert report.path.parent == tmp_path
+    with report.path.open(newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["id", "record_type", "created_at", "data"]
+    expected = sorted(old_records)[:7]
+    assert [(row[2], row[0]) for row in rows[1:]] == [
+        (created_at.isoformat(), str(id)) for created_at, id in expected
+    ]
+    assert {row[1] for row in rows[1:]} == {"Type A"}
+
+
+def test_generate_report_db_jsonl(
+    old_records: list[tuple[datetime, uuid.UUID]],
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # Several round trips of the server-side cursor
+    monkeypatch.setattr(settings, "REPORT_YIELD_PER", 3)
+    report = generate_report_db(
+        CUTOFF - timedelta(days=30),
+        CUTOFF + timedelta(days=30),
+        format="jsonl",
+        directory=str(tmp_path),
+    )
+
+    lines = [json.loads(line) for line in report.path.read_text().splitlines()]
+    assert report.rows == len(lines) == 8
+    assert [line["id"] for line in lines] == [str(id) for _, id in sorted(old_records)]
+    assert lines[-1]["record_type"] == "Type B"
+
+
+@pytest.fixture
+def yesterdays_record(db: Session) -> Generator[uuid.UUID, None, None]:
+    yesterday = datetime.utcnow().replace(hour=12) - timedelta(days=1)
+    record = Record(record_type=RecordType.TYPE_A, created_at=yesterday, data="x")
+    record_id = record.id
+    db.add(record)
+    db.commit()
+    yield record_id
+    db.execute(delete(Record).where(col(Record.id) == record_id))
+    db.commit()
+
+
+@pytest.fixture
+def rollups(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> Generator[None, None, None]:
+    """Empty rollups, refreshed up to now."""
+    monkeypatch.setattr(settings, "ROLLUP_LAG_SECONDS", 0)
+    for model in (RecordDailyRollup, PaymentDailyRollup, RollupWatermark):
+        db.execute(delete(model))
+    db.commit()
+    yield
+    for model in (RecordDailyRollup, PaymentDailyRollup, RollupWatermark):
+        db.execute(delete(model))
+    db.commit()
+
+
+@pytest.fixture
+def payments(db: Session) -> Generator[list[Payment], None, None]:
+    user = create_random_user(db)
+    payments = [
+        Payment(user_id=user.id, amount=amount, created_at=CUTOFF)
+        for amount in (10.0, 5.0)
+    ]
+    db.add_all(payments)
+    db.commit()
+    yield payments
+    db.execute(delete(Payment).where(col(Payment.user_id) == user.id))
+    db.commit()
+
+
+@pytest.mark.usefixtures("rollups", "old_records")
+def test_refresh_rollups_is_incremental(db: Session, payments: list[Payment]) -> None:
+    day = (CUTOFF - timedelta(days=1)).date()
+
+    first = refresh_rollups_db(batch_size=3)
+
+    assert first.records >= 8
+    assert first.payments >= 2
+    assert get_daily_summary_db(day).records == {RecordType.TYPE_A: 1}
+    assert get_daily_summary_db(CUTOFF.date()).payments == {
+        PaymentStatus.PENDING: (2, 15.0)
+    }
+    assert get_daily_summary_db(datetime(1999, 1, 1).date()).records == {}
+
+    today = datetime.utcnow().date()
+    before = get_daily_summary_db(today).records.get(RecordType.TYPE_B, 0)
+    record = Record(record_type=RecordType.TYPE_B)
+    payments[1].status = PaymentStatus.COMPLETED
+    db.add_all([record, payments[1]])
+    db.commit()
+
+    second = refresh_rollups_db()
+
+    # Only the rows written since the first refresh
+    assert second == (1, 1)
+    assert get_daily_summary_db(today).records[RecordType.TYPE_B] == before + 1
+    assert get_daily_summary_db(CUTOFF.date()).payments == {
+        PaymentStatus.PENDING: (1, 10.0),
+        PaymentStatus.COMPLETED: (1, 5.0),
+    }
+    assert refresh_rollups_db() == (0, 0)
+    db.execute(delete(Record).where(col(Record.id) == record.id))
+    db.commit()
+
+
+@pytest.mark.usefixtures("rollups")
+def test_refresh_rollups_recounts_late_commits(db: Session) -> None:
+    now = datetime.utcnow()
+    folded = Record(record_type=RecordType.TYPE_B, created_at=now)
+    db.add(folded)
+    db.commit()
+    refresh_rollups_db(now=now + timedelta(seconds=1))
+    # Stamped before the watermark moved past it, committed after
+    late = Record(record_type=RecordType.TYPE_B, created_at=now - timedelta(seconds=1))
+    db.add(late)
+    db.commit()
+    before = get_daily_summary_db(late.created_at.date()).records[RecordType.TYPE_B]
+
+    assert refresh_rollups_db(now=now + timedelta(seconds=1)).records == 0
+    summary = get_daily_summary_db(late.created_at.date())
+    assert summary.records[RecordType.TYPE_B] == before + 1
+    db.execute(delete(Record).where(col(Record.id).in_([folded.id, late.id])))
+    db.commit()
+
+
+@pytest.mark.usefixtures("rollups")
+@pytest.mark.parametrize("max_bytes", [10_000_000, 0])
+def test_generate_daily_report(
+    yesterdays_record: uuid.UUID,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    max_bytes: int,
+) -> None:
+    monkeypatch.setattr(settings, "REPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "REPORT_ATTACHMENT_MAX_BYTES", max_bytes)
+    sent: list[tuple[str, list[str]]] = []
+
+    def send_email(
+        _to_email: str, _subject: str, body: str, attachments: Sequence[Path]
+    ) -> None:
+        sent.append((body, [path.name for path in attachments]))
+        for path in attachments:
+            assert str(yesterdays_record) in path.read_text()
+
+    monkeypatch.setattr(tasks, "send_email", send_email)
+
+    result = tasks.generate_daily_report()
+
+    assert result["status"] == "report_generated"
+    assert result["rows"] >= 1
+    body, attached = sent[0]
+    assert "Type A: " in body
+    if max_bytes:
+        assert result["attached"]
+        assert len(attached) == 1
+        # Deleted once sent
+        assert list(tmp_path.iterdir()) == []
+    else:
+        assert not result["attached"]
+        assert attached == []
+        assert str(tmp_path) in body
+        assert len(list(tmp_path.iterdir())) == 1
+
+
+@pytest.mark.usefixtures("yesterdays_record")
+def test_generate_report_db_removes_partial_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    def dumps(_value: Any) -> str:
+        raise ValueError("boom")
+
+    monkeypatch.setattr(task_helpers.json, "dumps", dumps)
+
+    with pytest.raises(ValueError):
+        generate_report_db(format="jsonl", directory=str(tmp_path))
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_prune_report_files(tmp_path: Path) -> None:
+    now = datetime.utcnow()
+    old = tmp_path / "report-old.csv"
+    new = tmp_path / "report-new.jsonl"
+    other = tmp_path / "backup-old.csv"
+    for path in (old, new, other):
+        path.write_text("")
+    past = (now - timedelta(days=8)).timestamp()
+    for path in (old, other):
+        os.utime(path, (past, past))
+
+    pruned = prune_report_files(retention_days=7, directory=str(tmp_path), now=now)
+
+    assert pruned == [old]
+    assert sorted(tmp_path.iterdir()) == [other, new]
+
+
+@pytest.fixture
+def user_addresses(db: Session) -> Generator[list[UserAddress], None, None]:
+    user = create_random_user(db)
+    lines = ["1 Hope Road", "1  HOPE ROAD", "Nowhere 1", "2 Hope Road"]
+    addresses = [
+        UserAddress(
+            user_id=user.id,
+            address_line_1=line,
+            city="Kingston",
+            state="St. Andrew",
+            country="Jamaica",
+            postal_code="JMAAW06",
+        )
+        for line in lines
+    ]
+    keys = {normalize_address(address.model_dump()) for address in addresses}
+    db.add_all(addresses)
+    db.commit()
+    yield addresses
+    db.execute(delete(UserAddress).where(col(UserAddress.user_id) == user.id))
+    db.execute(delete(GeocodeCache).where(col(GeocodeCache.address_key).in_(keys)))
+    db.commit()
+
+
+def test_geocode_user_addresses(
+    db: Session,
+    user_addresses: list[UserAddress],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    requested: list[str] = []
+
+    def geocode_address(address: dict) -> dict | None:
+        requested.append(address["address_line_1"])
+        if address["address_line_1"].startswith("Nowhere"):
+            return None
+        if address["address_line_1"].startswith("2"):
+            raise GeocodingError("timed out")
+        return {"latitude": 18.02, "longitude": -76.78, "formatted_address": "Kingston"}
+
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", "key")
+    monkeypatch.setattr(task_helpers, "geocode_address", geocode_address)
+
+    progress = geocode_user_addresses_db(batch_size=2, rate_per_second=1000)
+
+    # The same address in two spellings is requested once
+    assert len(requested) == 3
+    assert {line.casefold().split()[0] for line in requested} == {"1", "nowhere", "2"}
+    assert progress == GeocodingProgress(updated=2, requested=3, failed=1, done=True)
+    for address in user_addresses:
+        db.refresh(address)
+    assert [(a.latitude, a.longitude) for a in user_addresses] == [
+        (18.02, -76.78),
+        (18.02, -76.78),
+        (None, None),
+        (None, None),
+    ]
+
+    # Only the failed address is requested again, the miss is cached
+    requested.clear()
+    progress = geocode_user_addresses_db(rate_per_second=1000)
+    assert requested == ["2 Hope Road"]
+    assert progress.updated == 0
+
+
+@pytest.mark.usefixtures("user_addresses")
+def test_geocode_user_addresses_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", "key")
+    monkeypatch.setattr(task_helpers, "geocode_address", lambda _address: None)
+
+    progress = geocode_user_addresses_db(rate_per_second=1000, max_requests=1)
+
+    assert progress.requested == 1
+    assert not progress.done
+
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", None)
+    assert geocode_user_addresses_db().requested == 0
+
+
+@pytest.mark.usefixtures("user_addresses")
+def test_geocode_user_addresses_single_run(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "GOOGLE_MAPS_API_KEY", "key")
+    monkeypatch.setattr(task_helpers, "geocode_address", lambda _address: None)
+
+    # Another run holds the lock
+    with engine.connect() as connection:
+        connection.scalar(
+            select(func.pg_advisory_lock(task_helpers.GEOCODING_LOCK_KEY))
+        )
+        try:
+            progress = geocode_user_addresses_db(rate_per_second=1000)
+        finally:
+            connection.scalar(
+                select(func.pg_advisory_unlock(task_helpers.GEOCODING_LOCK_KEY))
+            )
+    assert progress == GeocodingProgress(updated=0, requested=0, failed=0, done=False)
+
+    # Out of time before the first request
+    progress = geocode_user_addresses_db(rate_per_second=1000, max_run_seconds=0)
+    assert progress.requested == 0
+    assert not progress.done
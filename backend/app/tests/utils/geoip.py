@@ -0,0 +1,28 @@
+from pathlib import Path
+
+import geoip2.errors
+import geoip2.models
+
+
+class FakeReader:
+    """Stands in for geoip2's reader, the city is read from the file."""
+
+    opened: list[tuple[str, int]] = []
+
+    def __init__(self, path: str, mode: int) -> None:
+        self.city_name = Path(path).read_text()
+        self.lookups: list[str] = []
+        FakeReader.opened.append((path, mode))
+
+    def city(self, ip_address: str) -> geoip2.models.City:
+        self.lookups.append(ip_address)
+        if ip_address.startswith("10."):
+            raise geoip2.errors.AddressNotFoundError(f"{ip_address} not found")
+        return geoip2.models.City(
+            {
+                "city": {"names": {"en": self.city_name}},
+                "country": {"iso_code": "JM", "names": {"en": "Jamaica"}},
+                "location": {"latitude": 18.0, "longitude": -76.8},
+            },
+            ["en"],
+        )
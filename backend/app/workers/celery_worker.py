@@ -50,9 +50,23 @@ celery_worker.conf.beat_schedule = {
         'task': 'app.services.tasks.cleanup_old_records',
         'schedule': crontab(minute=0),  # Every hour
     },
-    'generate-daily-report-at-midnight': {
+    'maintain-partitions-daily': {
+        'task': 'app.services.tasks.maintain_partitions',
+        'schedule': crontab(minute=30, hour=0),  # Every day at 00:30
+    },
+    'refresh-rollups-every-fifteen-minutes': {
+        'task': 'app.services.tasks.refresh_rollups',
+        'schedule': crontab(minute='*/15'),  # Every 15 minutes
+    },
+    'geocode-user-addresses-every-ten-minutes': {
+        'task': 'app.services.tasks.geocode_user_addresses',
+        'schedule': crontab(minute='*/10'),  # Every 10 minutes
+    },
+    'generate-daily-report-after-midnight': {
         'task': 'app.services.tasks.generate_daily_report',
-        'schedule': crontab(minute=0, hour=0),  # Every day at midnight
+        # Every day at 00:05, once the rollups can take the last rows of the
+        # day past ROLLUP_LAG_SECONDS
+        'schedule': crontab(minute=5, hour=0),
     },
     'heartbeat-check-every-five-minutes': {
         'task': 'app.services.tasks.heartbeat_check',